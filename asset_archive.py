@@ -0,0 +1,200 @@
+import argparse
+import glob
+import io
+import mmap
+import os
+import struct
+from typing import NamedTuple
+
+
+# where an asset is stored in an archive: byte offset and length of its
+# data and its format (the file's extension, e.g. "png")
+class ArchiveEntry(NamedTuple):
+    offset: int
+    length: int
+    format: str
+
+
+# AssetFile is a read-only, seekable file over a slice of memory (an
+# archive entry), for readers that want a file object (PIL, FreeType,
+# pygame): only what is read gets copied.
+class AssetFile(io.RawIOBase):
+    def __init__(self, data: memoryview) -> None:
+        self.data = data
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), len(self.data) - self.position)
+        if count <= 0:
+            return 0
+        buffer[:count] = self.data[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.data)
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+# AssetArchive packs asset files into one file that is memory-mapped and
+# read at random: a header, the files' data (each aligned to ALIGNMENT
+# bytes) and an index of name -> (offset, length, format) at the end.
+# Names are the files' paths relative to the game's directory with "/"
+# separators, as the game loads them (e.g. "textures/block.png").
+#
+#   header   magic "BRKA", version, index offset, entry count
+#   entry    name length, offset, length, format, then the UTF-8 name
+class AssetArchive:
+    MAGIC = b"BRKA"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIQI")
+    ENTRY = struct.Struct("<HQQ8s")
+    ALIGNMENT = 16
+
+    def __init__(self, file: str) -> None:
+        self.file = file
+        with open(file, "rb") as archive:
+            self.map = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index, count = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError("not an asset archive: {}".format(file))
+        self.entries: dict[str, ArchiveEntry] = {}
+        for i in range(count):
+            length, offset, size, format = self.ENTRY.unpack_from(self.map, index)
+            index += self.ENTRY.size
+            name = bytes(self.map[index:index + length]).decode()
+            index += length
+            self.entries[name] = ArchiveEntry(
+                offset, size, format.rstrip(b"\0").decode())
+        self.view = memoryview(self.map)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    # the data of an asset, without copying it out of the mapping
+    def read(self, name: str) -> memoryview:
+        entry = self.entries[name]
+        return self.view[entry.offset:entry.offset + entry.length]
+
+    def close(self) -> None:
+        try:
+            self.view.release()
+            self.map.close()
+        except BufferError:
+            pass  # still read from, closed once the last view is gone
+
+    # packs files (name: path on disk) into a new archive
+    @staticmethod
+    def build(file: str, files: dict[str, str]) -> None:
+        index = b""
+        with open(file + ".tmp", "wb") as archive:
+            archive.write(b"\0" * AssetArchive.HEADER.size)
+            for name, path in sorted(files.items()):
+                offset = archive.tell()
+                padding = -offset % AssetArchive.ALIGNMENT
+                archive.write(b"\0" * padding)
+                offset += padding
+                with open(path, "rb") as source:
+                    data = source.read()
+                archive.write(data)
+                encoded = name.encode()
+                format = os.path.splitext(name)[1].lstrip(".").lower()
+                index += AssetArchive.ENTRY.pack(len(encoded), offset,
+                                                 len(data), format.encode())
+                index += encoded
+            index_offset = archive.tell()
+            archive.write(index)
+            archive.seek(0)
+            archive.write(AssetArchive.HEADER.pack(
+                AssetArchive.MAGIC, AssetArchive.VERSION, index_offset,
+                len(files)))
+        os.replace(file + ".tmp", file)
+
+
+# the mounted archive assets are read from (None: loose files only)
+archive: AssetArchive = None
+
+
+# reads assets from the given archive from now on (files it doesn't
+# contain are still read from disk)
+def mount(file: str) -> AssetArchive:
+    global archive
+    unmount()
+    archive = AssetArchive(file)
+    return archive
+
+
+def unmount() -> None:
+    global archive
+    if archive is not None:
+        archive.close()
+        archive = None
+
+
+def archiveName(name: str) -> str:
+    return os.path.normpath(name).replace(os.sep, "/")
+
+
+# the data of an asset: a view into the mounted archive, or the loose file
+# read from disk
+def readAsset(name: str):
+    if archive is not None and archiveName(name) in archive:
+        return archive.read(archiveName(name))
+    with open(name, "rb") as file:
+        return file.read()
+
+
+# opens an asset for reading, from the mounted archive or disk
+def openAsset(name: str, text: bool = False):
+    if archive is not None and archiveName(name) in archive:
+        file = io.BufferedReader(AssetFile(archive.read(archiveName(name))))
+        return io.TextIOWrapper(file) if text else file
+    return open(name, "r" if text else "rb")
+
+
+# reads a text asset (shader sources, levels, JSON)
+def readText(name: str) -> str:
+    return bytes(readAsset(name)).decode()
+
+
+# the asset files of the game in directory: textures, audio, fonts, levels
+# and shader sources
+def gameAssets(directory: str) -> dict[str, str]:
+    patterns = ["textures/*", "audio/*", "fonts/*", "levels/*",
+                "*.vs", "*.fs", "*.gs"]
+    files = {}
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            if os.path.isfile(path):
+                files[archiveName(os.path.relpath(path, directory))] = path
+    return files
+
+
+def main() -> None:
+    directory = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Pack the game's assets into an archive")
+    parser.add_argument("--output", default=os.path.join(directory,
+                                                          "assets.pak"),
+                        help="archive to write (default: assets.pak)")
+    arguments = parser.parse_args()
+    files = gameAssets(directory)
+    AssetArchive.build(arguments.output, files)
+    print("Packed {} files into {}".format(len(files), arguments.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import wave
+
+import numpy as np
+
+from asset_archive import openAsset, readAsset
+from startup import lazyImport
+
+# imported when first used
+Image = lazyImport("PIL.Image")
+mixer = lazyImport("pygame.mixer")
+
+
+# AssetCache keeps decoded assets on disk so later runs skip decoding:
+# texels of images (decoded by PIL) and PCM samples of sounds (decoded by
+# pygame, in the mixer's output format). Entries are named after a hash of
+# the source file's contents (plus everything else the decoded data
+# depends on), so an edited source simply misses the cache and no entry
+# ever needs to be invalidated explicitly; stale entries can be deleted
+# with the directory. Entries are memory-mapped and handed to OpenGL or
+# the mixer without another copy in Python. Writing entries is
+# best-effort: if the directory can't be written, assets are decoded on
+# every run.
+#
+# Sources are read through asset_archive, so they may come from a mounted
+# archive as well as from disk.
+#
+# Prebake the cache of a deployment with:
+#   python asset_cache.py [--dir DIRECTORY]
+class AssetCache:
+    # bump when the layout of entries changes
+    VERSION = 1
+    # magic, width, height, channels
+    TEXTURE_HEADER = struct.Struct("<4sIII")
+    # magic, frequency, format, channels
+    SOUND_HEADER = struct.Struct("<4sIiI")
+    # the default directory, next to this file (not the working directory)
+    DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "asset_cache")
+
+    def __init__(self, directory: str = None) -> None:
+        self.directory = directory or self.DIRECTORY
+        self.hits = 0
+        self.misses = 0
+
+    # the entry name for a source file decoded with the given parameters
+    def key(self, file: str, *parameters) -> str:
+        key = hashlib.sha256()
+        key.update(readAsset(file))
+        key.update(repr((self.VERSION,) + parameters).encode())
+        return key.hexdigest()
+
+    def path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key + extension)
+
+    # maps an entry into memory (None if it isn't cached)
+    def map(self, path: str) -> mmap.mmap:
+        try:
+            with open(path, "rb") as file:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    # writes an entry to a temporary file first so an interrupted write
+    # never leaves a truncated entry behind; returns whether it was written
+    def store(self, path: str, header: bytes, data: bytes) -> bool:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "wb") as file:
+                file.write(header)
+                file.write(data)
+            os.replace(path + ".tmp", path)
+            return True
+        except OSError:
+            return False
+
+    # returns an image's (width, height, texels) as RGBA (alpha) or RGB
+    # bytes, top row first; texels of a cache hit are a view of the mapped
+    # entry
+    def texture(self, file: str, alpha: bool) -> tuple[int, int, np.ndarray]:
+        channels = 4 if alpha else 3
+        path = self.path(self.key(file, channels), ".tex")
+        entry = self.map(path)
+        if entry is not None and len(entry) >= self.TEXTURE_HEADER.size:
+            magic, width, height, stored = self.TEXTURE_HEADER.unpack_from(entry)
+            size = self.TEXTURE_HEADER.size + width * height * channels
+            if magic == b"TEX1" and stored == channels and len(entry) == size:
+                self.hits += 1
+                return width, height, np.frombuffer(
+                    entry, np.uint8, offset=self.TEXTURE_HEADER.size)
+        self.misses += 1
+        image = Image.open(openAsset(file)).convert("RGBA" if alpha else "RGB")
+        width, height = image.size
+        texels = image.tobytes()
+        self.store(path, self.TEXTURE_HEADER.pack(b"TEX1", width, height,
+                                                  channels), texels)
+        return width, height, np.frombuffer(texels, np.uint8)
+
+    # returns a sound's samples in the format of the (initialized) mixer
+    def samples(self, file: str) -> np.ndarray:
+        format = mixer.get_init()
+        path = self.path(self.key(file, format), ".pcm")
+        entry = self.map(path)
+        if entry is not None and len(entry) >= self.SOUND_HEADER.size:
+            magic, *stored = self.SOUND_HEADER.unpack_from(entry)
+            if magic == b"PCM1" and tuple(stored) == format:
+                self.hits += 1
+                return np.frombuffer(entry, np.uint8,
+                                     offset=self.SOUND_HEADER.size)
+        self.misses += 1
+        samples = mixer.Sound(file=openAsset(file)).get_raw()
+        self.store(path, self.SOUND_HEADER.pack(b"PCM1", *format), samples)
+        return np.frombuffer(samples, np.uint8)
+
+    def sound(self, file: str) -> "mixer.Sound":
+        return mixer.Sound(buffer=self.samples(file))
+
+    # returns a file to stream music from: the decoded samples as a WAV
+    # file (streaming it needs no decoding), or the source itself if the
+    # mixer's format can't be stored in a WAV file (or the file can't be
+    # written)
+    def music(self, file: str) -> str:
+        frequency, format, channels = mixer.get_init()
+        if format != -16:
+            return file
+        path = self.path(self.key(file, frequency, format, channels), ".wav")
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        self.misses += 1
+        samples = mixer.Sound(file=openAsset(file)).get_raw()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with wave.open(path + ".tmp", "wb") as output:
+                output.setnchannels(channels)
+                output.setsampwidth(2)
+                output.setframerate(frequency)
+                output.writeframes(samples)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return file
+        return path
+
+
+# decodes all assets the game loads into the cache
+def bake(directory: str) -> AssetCache:
+    from game import MUSIC, SOUNDS, TEXTURES
+    cache = AssetCache(directory)
+    for file, alpha, name in TEXTURES:
+        if present(file):
+            cache.texture(file, alpha)
+    for name, file in SOUNDS.items():
+        if present(file):
+            cache.samples(file)
+    if present(MUSIC):
+        cache.music(MUSIC)
+    return cache
+
+
+def present(file: str) -> bool:
+    try:
+        readAsset(file)
+        return True
+    except OSError:
+        pass
+    print("Skipping missing asset", file)
+    return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Decode the game's textures and audio into the cache")
+    parser.add_argument("--dir", default=AssetCache.DIRECTORY,
+                        help="cache directory (default: asset_cache next to "
+                             "this file)")
+    arguments = parser.parse_args()
+    # no audio device is needed to decode
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    mixer.init()
+    cache = bake(arguments.dir)
+    mixer.quit()
+    print("{} cached, {} decoded".format(cache.hits, cache.misses))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import time
+from typing import NamedTuple
+
+import glfw
+import glm
+
+from ball_object import BallObject
+from game import (Game, GameState, ballCheckCollision, paddleBounceVelocity,
+                  resolveCollision)
+from game_level import GameLevel
+from game_object import GameObject
+
+
+# Where and when a ball reaches the line of the player pad: x of the
+# ball's center, time until then, number of breakable bricks hit on the
+# way and the ball's position and velocity at that moment.
+class Intercept(NamedTuple):
+    x: float
+    time: float
+    bricks: int
+    position: tuple[float, float]
+    velocity: tuple[float, float]
+
+
+# BallPredictor simulates a ball forward without rendering, using the same
+# wall reflection (BallObject.move) and brick collision resolution as the
+# game, until it reaches the player pad's line. Bricks are treated as they
+# are at the time of the prediction (bricks the simulated ball destroys
+# are taken out of the simulation, not out of the level).
+# Results are cached per ball state: a ball travels in a straight line
+# between two bounces, so every state on that line (same velocity, same
+# line, within quantization) shares one prediction. The cache is dropped
+# whenever the level changes.
+class BallPredictor:
+    def __init__(self, game: Game, horizon: float = 4.0,
+                 quantization: float = 0.5) -> None:
+        self.game = game
+        # how far ahead (in seconds) to simulate at most
+        self.horizon = horizon
+        self.quantization = quantization
+        # scratch objects reused by every simulation
+        self.probe = BallObject(glm.vec2(0.0), game.ball_radius,
+                                glm.vec2(0.0), None)
+        self.probe.stuck = False
+        self.box = GameObject(glm.vec2(0.0), glm.vec2(0.0), None)
+        self.cache: dict[tuple, Intercept] = {}
+        self.level_key = None
+
+    # refreshes the plain list copies of the level the simulation reads
+    # (much faster to index from Python than numpy arrays) and drops the
+    # cache if the level changed
+    def syncLevel(self, level: GameLevel) -> None:
+        key = (id(level), level.revision, level.destroyed_version,
+               level.hits_version)
+        if key == self.level_key:
+            return
+        self.level_key = key
+        self.cache.clear()
+        self.grid = level.brick_grid.tolist()
+        self.destroyed = level.brick_destroyed.tolist()
+        self.solid = level.brick_solid.tolist()
+        self.hits = level.brick_hits.tolist()
+        self.positions = level.brick_position.tolist()
+        self.unit_width = level.unit_width
+        self.unit_height = level.unit_height
+        self.box.size = glm.vec2(level.unit_width, level.unit_height)
+
+    # predicts where the ball at position (top-left, as BallObject) with
+    # velocity reaches the pad's line; None if it doesn't within the
+    # horizon or the deadline (a time.perf_counter() value) passed
+    def predict(self, position: glm.vec2, velocity: glm.vec2,
+                pass_through: bool = False,
+                deadline: float = None) -> Intercept:
+        self.syncLevel(self.game.levels[self.game.level])
+        speed = glm.length(velocity)
+        if speed == 0.0:
+            return None
+        # position along and across the line the ball travels on
+        along = (position.x * velocity.x + position.y * velocity.y) / speed
+        across = (position.x * velocity.y - position.y * velocity.x) / speed
+        q = self.quantization
+        key = (round(velocity.x / q), round(velocity.y / q),
+               round(across / q), pass_through)
+        cached = self.cache.get(key)
+        if cached is not None:
+            # same line, only the time left differs
+            return cached._replace(time=cached.time - along / speed)
+        intercept = self.simulate(position, velocity, pass_through, deadline)
+        if intercept is not None:
+            self.cache[key] = intercept._replace(
+                time=intercept.time + along / speed)
+        return intercept
+
+    def simulate(self, position: glm.vec2, velocity: glm.vec2,
+                 pass_through: bool, deadline: float) -> Intercept:
+        game = self.game
+        probe, box = self.probe, self.box
+        radius = probe.radius
+        probe.position = glm.vec2(position)
+        probe.velocity = glm.vec2(velocity)
+        pad_line = game.player.position.y
+        # small enough steps for the ball not to skip through a brick
+        dt = min(1.0 / 60.0, radius * 0.5 / glm.length(velocity))
+        rows, columns = len(self.grid), len(self.grid[0]) if self.grid else 0
+        # hits taken by bricks during this simulation
+        damage: dict[int, int] = {}
+        bricks = 0
+        steps = int(self.horizon / dt)
+        for step in range(1, steps + 1):
+            if (deadline is not None and step % 32 == 0
+                    and time.perf_counter() > deadline):
+                return None
+            probe.move(dt, game.width)
+            elapsed = step * dt
+            # (balls bouncing off the pad start on its line going up)
+            if (probe.position.y + 2.0 * radius >= pad_line
+                    and probe.velocity.y > 0.0):
+                return Intercept(probe.position.x + radius, elapsed, bricks,
+                                 (probe.position.x, probe.position.y),
+                                 (probe.velocity.x, probe.velocity.y))
+            # test the bricks in the 3x3 tiles around the ball's center
+            column = int((probe.position.x + radius) / self.unit_width)
+            row = int((probe.position.y + radius) / self.unit_height)
+            if row < -1 or row > rows:
+                continue
+            for r in range(max(row - 1, 0), min(row + 2, rows)):
+                for c in range(max(column - 1, 0), min(column + 2, columns)):
+                    i = self.grid[r][c]
+                    if i < 0 or self.destroyed[i]:
+                        continue
+                    solid = self.solid[i]
+                    if not solid and damage.get(i, 0) >= self.hits[i]:
+                        continue  # destroyed earlier in this simulation
+                    box.position = glm.vec2(self.positions[i])
+                    collision = ballCheckCollision(probe, box)
+                    if not collision.is_collision:
+                        continue
+                    if not solid:
+                        damage[i] = damage.get(i, 0) + 1
+                        bricks += 1
+                    if solid or not pass_through:
+                        resolveCollision(probe, collision)
+        return None
+
+
+# Autopilot plays the game through the same key state the keyboard sets,
+# so Game.processInput moves the pad exactly as for a player: call
+# control() each frame before processInput. It tracks the ball that
+# reaches the pad first (extra balls only if the main ball can still be
+# reached afterwards) and, as time allows, tries several spots on the pad
+# to bounce it off, preferring the one that hits the most bricks on its
+# next way down. All predictions of a frame share a budget in seconds.
+class Autopilot:
+    # where on the pad (fraction of its half width) to try bouncing balls
+    OFFSETS = (0.0, -0.3, 0.3, -0.6, 0.6, -0.85, 0.85)
+
+    def __init__(self, game: Game, budget: float = 0.002,
+                 attract: bool = True) -> None:
+        self.game = game
+        self.budget = budget
+        # also start the game from the menu (attract mode)
+        self.attract = attract
+        self.predictor = BallPredictor(game)
+        # pad center the autopilot currently steers to
+        self.target: float = None
+
+    # presses or releases a key like the key callback does
+    def press(self, key: int, down: bool) -> None:
+        if self.game.keys[key] and not down:
+            self.game.keys_processed[key] = False
+        self.game.keys[key] = down
+
+    def control(self, dt: float) -> None:
+        game = self.game
+        if game.state != GameState.GAME_ACTIVE:
+            self.press(glfw.KEY_A, False)
+            self.press(glfw.KEY_D, False)
+            # alternate pressing and releasing so each press counts once
+            self.press(glfw.KEY_ENTER,
+                       self.attract and not game.keys[glfw.KEY_ENTER])
+            return
+        self.press(glfw.KEY_ENTER, False)
+        deadline = time.perf_counter() + self.budget
+        self.target = self.plan(deadline)
+        # launch the ball as soon as it's stuck to the pad
+        self.press(glfw.KEY_SPACE, game.ball.stuck)
+        center = game.player.position.x + game.player.size.x / 2.0
+        # don't bother moving less than one frame's travel
+        dead_zone = game.player_velocity * dt
+        left = right = False
+        if self.target is not None:
+            left = self.target < center - dead_zone
+            right = self.target > center + dead_zone
+        self.press(glfw.KEY_A, left)
+        self.press(glfw.KEY_D, right)
+
+    # returns the pad center to steer to, None to stay
+    def plan(self, deadline: float) -> float:
+        game = self.game
+        if game.ball.stuck:
+            return None
+        main = self.predictor.predict(game.ball.position, game.ball.velocity,
+                                      game.ball.pass_through, deadline)
+        intercept = main
+        # an extra ball arriving earlier is worth catching as long as the
+        # pad still gets to the main ball in time
+        for i in game.balls.active().tolist():
+            if time.perf_counter() > deadline:
+                break
+            x, y = game.balls.position[i].tolist()
+            vx, vy = game.balls.velocity[i].tolist()
+            if vy <= 0.0:
+                continue
+            extra = self.predictor.predict(glm.vec2(x, y), glm.vec2(vx, vy),
+                                           game.balls.pass_through, deadline)
+            if extra is None or (intercept is not None
+                                 and extra.time >= intercept.time):
+                continue
+            if main is None or (abs(main.x - extra.x) / game.player_velocity
+                                <= main.time - extra.time):
+                intercept = extra
+        if intercept is None:
+            # nothing predicted in time: follow the ball
+            return game.ball.position.x + game.ball.radius
+        return intercept.x - self.aim(intercept, deadline) * game.player.size.x / 2.0
+
+    # picks where on the pad (offset from its center as a fraction of its
+    # half width) to bounce the intercepted ball
+    def aim(self, intercept: Intercept, deadline: float) -> float:
+        game = self.game
+        half_width = game.player.size.x / 2.0
+        best, best_bricks = 0.0, -1
+        for offset in self.OFFSETS:
+            if time.perf_counter() > deadline:
+                break
+            # the pad has to be able to get there
+            center = intercept.x - offset * half_width
+            if center < half_width or center > game.width - half_width:
+                continue
+            velocity = paddleBounceVelocity(glm.vec2(intercept.velocity),
+                                            offset,
+                                            game.initial_ball_velocity[0])
+            result = self.predictor.predict(glm.vec2(intercept.position),
+                                            velocity, game.ball.pass_through,
+                                            deadline)
+            if result is not None and result.bricks > best_bricks:
+                best, best_bricks = offset, result.bricks
+        return best
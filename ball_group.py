@@ -0,0 +1,89 @@
+import glm
+import numpy as np
+
+from texture2d import Texture2D
+from sprite_renderer import SpriteRenderer
+
+
+# BallGroup holds the state of many balls at once. Instead of one
+# BallObject per ball, positions and velocities live in flat arrays
+# (one row per ball) so that movement and collision detection can be
+# computed for all balls in a single vectorized pass.
+class BallGroup:
+    def __init__(self, capacity: int, radius: float,
+                 sprite: Texture2D) -> None:
+        self.capacity = capacity
+        self.radius = radius
+        self.size = glm.vec2(radius * 2.0, radius * 2.0)
+        self.sprite = sprite
+        self.color = glm.vec3(1.0)
+        # ball state (top-left position, as with BallObject)
+        self.position = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.pass_through = False
+
+    # returns the number of balls currently in play
+    def count(self) -> int:
+        return int(np.count_nonzero(self.alive))
+
+    # returns the indices of all balls currently in play
+    def active(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    # returns the center point of every ball in play
+    def centers(self, indices: np.ndarray) -> np.ndarray:
+        return self.position[indices] + self.radius
+
+    # adds balls at the given position, one per row of velocities; balls
+    # that don't fit in the remaining capacity are dropped. Returns the
+    # number of balls actually spawned
+    def spawn(self, position: glm.vec2, velocities: np.ndarray) -> int:
+        free = np.flatnonzero(~self.alive)[:len(velocities)]
+        self.position[free] = (position.x, position.y)
+        self.velocity[free] = velocities[:len(free)]
+        self.alive[free] = True
+        return len(free)
+
+    # moves all balls, keeping them constrained within the window bounds
+    # (except bottom edge)
+    def move(self, dt: float, window_width: int) -> None:
+        i = self.active()
+        if len(i) == 0:
+            return
+        pos = self.position[i] + self.velocity[i] * dt
+        vel = self.velocity[i]
+        # reflect on the left, right and top edges and restore at the
+        # correct position
+        left = pos[:, 0] <= 0.0
+        right = (pos[:, 0] + self.size.x) >= window_width
+        top = pos[:, 1] <= 0.0
+        vel[left | right, 0] *= -1.0
+        pos[left, 0] = 0.0
+        pos[right & ~left, 0] = window_width - self.size.x
+        vel[top, 1] *= -1.0
+        pos[top, 1] = 0.0
+        self.position[i] = pos
+        self.velocity[i] = vel
+
+    # removes every ball that dropped past the given bottom edge
+    def cull(self, height: float) -> None:
+        self.alive &= self.position[:, 1] < height
+
+    # takes one ball out of the group, returning its position and velocity
+    def take(self, index: int) -> tuple[glm.vec2, glm.vec2]:
+        self.alive[index] = False
+        x, y = self.position[index].tolist()
+        vx, vy = self.velocity[index].tolist()
+        return glm.vec2(x, y), glm.vec2(vx, vy)
+
+    # removes all balls
+    def clear(self) -> None:
+        self.alive[:] = False
+        self.pass_through = False
+
+    # draw all balls in play
+    def draw(self, renderer: SpriteRenderer) -> None:
+        for x, y in self.position[self.alive].tolist():
+            renderer.drawSprite(self.sprite, glm.vec2(x, y), self.size,
+                                0.0, self.color)
@@ -0,0 +1,72 @@
+import timeit
+
+import glm
+
+from game import (Collision, Direction, ballCheckCollision, axisDirection)
+from ball_object import BallObject
+from game_object import GameObject
+
+
+# Micro-benchmark for the ball vs brick collision test, comparing the
+# plain float implementation in game.py with the previous glm based one.
+# Run with: python bench_collision.py
+
+
+# previous implementation, kept here as the reference to measure against
+def glmVectorDirection(target: glm.vec2) -> Direction:
+    compass: list[glm.vec2] = [
+        glm.vec2(0.0, 1.0),  # up
+        glm.vec2(1.0, 0.0),  # right
+        glm.vec2(0.0, -1.0),  # down
+        glm.vec2(-1.0, 0.0)  # left
+    ]
+    max = 0.0
+    best_match = -1
+    for i in range(4):
+        dot_product = glm.dot(glm.normalize(target), compass[i])
+        if dot_product > max:
+            max = dot_product
+            best_match = i
+    return Direction(best_match)
+
+
+def glmBallCheckCollision(one: BallObject, two: GameObject) -> Collision:
+    center = glm.vec2(one.position + one.radius)
+    aabb_half_extents = glm.vec2(two.size.x / 2.0, two.size.y / 2.0)
+    aabb_center = glm.vec2(two.position.x + aabb_half_extents.x,
+                           two.position.y + aabb_half_extents.y)
+    difference = center - aabb_center
+    clamped = glm.clamp(difference, -aabb_half_extents, aabb_half_extents)
+    closest = aabb_center + clamped
+    difference = closest - center
+    if glm.length(difference) < one.radius:
+        return Collision(True, glmVectorDirection(difference), difference)
+    else:
+        return Collision(False, Direction.UP, glm.vec2(0.0, 0.0))
+
+
+def main() -> None:
+    # GameObject/BallObject only store the sprite, so no GL context is needed
+    ball = BallObject(glm.vec2(387.5, 200.0), 12.5, glm.vec2(100.0, -350.0),
+                      None)
+    miss = GameObject(glm.vec2(0.0, 0.0), glm.vec2(61.5, 37.5), None)
+    hit = GameObject(glm.vec2(380.0, 220.0), glm.vec2(61.5, 37.5), None)
+    # both implementations must agree before timing them
+    for brick in (miss, hit):
+        a = ballCheckCollision(ball, brick)
+        b = glmBallCheckCollision(ball, brick)
+        assert a.is_collision == b.is_collision
+        assert a.direction == b.direction
+    assert axisDirection(3.0, -1.0) == Direction.RIGHT
+    number = 100000
+    for name, brick in (("miss", miss), ("hit", hit)):
+        for label, function in (("glm", glmBallCheckCollision),
+                                ("float", ballCheckCollision)):
+            seconds = min(timeit.repeat(lambda: function(ball, brick),
+                                        number=number, repeat=5))
+            print("{:5} {:5}: {:8.1f} ns/call".format(
+                name, label, seconds / number * 1e9))
+
+
+if __name__ == "__main__":
+    main()
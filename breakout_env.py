@@ -0,0 +1,207 @@
+import random
+
+import glfw
+import numpy as np
+from OpenGL.GL import *
+
+from headless import FrameCapture, createHiddenWindow
+from game import Game, GameState
+
+
+# BreakoutEnv wraps Game for reinforcement learning with a Gymnasium style
+# reset(seed)/step(action) API (without depending on gymnasium). The game
+# runs in a hidden window at a fixed time step:
+#
+#   env = BreakoutEnv(observation="vector", frame_skip=4)
+#   observation, info = env.reset(seed=0)
+#   observation, reward, terminated, truncated, info = env.step(action)
+#
+# Actions are indices into ACTIONS, which map to the A/D/SPACE keys that
+# Game.processInput handles. The reward is the score gained. An episode
+# terminates when the last life is lost or the level is cleared and is
+# truncated after max_steps steps.
+#
+# Vector observations are written into one preallocated float32 array
+# (returned by every step, copy it to keep it): ball position and velocity,
+# pad position and width, whether the ball is stuck, lives left, then one
+# entry per brick that is 1 while the brick isn't destroyed. Positions are
+# divided by the game's size and velocities by its initial ball speed.
+# Pixel observations are the scene downsampled to pixel_size (RGB, uint8)
+# and read back asynchronously; with pixel_latency > 0 a step returns the
+# frame of up to that many steps earlier instead of stalling on the GPU.
+class BreakoutEnv:
+    # (left, right, fire) keys held per action
+    ACTIONS = ((False, False, False),  # noop
+               (True, False, False),  # left
+               (False, True, False),  # right
+               (False, False, True),  # fire
+               (True, False, True),  # left + fire
+               (False, True, True))  # right + fire
+    # number of vector observation entries before the brick mask
+    STATE_SIZE = 8
+
+    def __init__(self, observation: str = "vector", frame_skip: int = 4,
+                 sticky_action_probability: float = 0.25,
+                 max_steps: int = 27000, level: int = 0,
+                 pixel_size: tuple[int, int] = (84, 84),
+                 pixel_latency: int = 1, dt: float = 1.0 / 60.0,
+                 width: int = 800, height: int = 600) -> None:
+        if observation not in ("vector", "pixels"):
+            raise ValueError("observation must be 'vector' or 'pixels'")
+        self.observation = observation
+        self.frame_skip = frame_skip
+        self.sticky_action_probability = sticky_action_probability
+        self.max_steps = max_steps
+        self.level = level
+        self.pixel_size = pixel_size
+        self.pixel_latency = pixel_latency
+        self.dt = dt
+        self.action_count = len(self.ACTIONS)
+        self.window = createHiddenWindow(width, height)
+        self.game = Game(width, height)
+        self.game.init()
+        self.game.finishLoading()
+        self.game.resize(width, height)
+        self.rng = np.random.default_rng()
+        self.last_action = 0
+        self.steps = 0
+        self.time = 0.0
+        self.vector: np.ndarray = None
+        self.pixels: np.ndarray = None
+        self.capture: FrameCapture = None
+        if observation == "pixels":
+            self.initPixels()
+
+    # shape of the observations of the current level
+    def observationShape(self) -> tuple[int, ...]:
+        if self.observation == "pixels":
+            return (self.pixel_size[1], self.pixel_size[0], 3)
+        return (self.STATE_SIZE + self.game.levels[self.level].brickCount(),)
+
+    # starts a new episode on level (default: the one given to the
+    # constructor); returns (observation, info)
+    def reset(self, seed: int = None, level: int = None):
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+            self.rng = np.random.default_rng(seed)
+        if level is not None:
+            self.level = level
+        game = self.game
+        game.level = self.level
+        game.resetLevel()
+        game.resetPlayer()
+        game.powerups.clear()
+        game.score = 0
+        game.state = GameState.GAME_ACTIVE
+        self.last_action = 0
+        self.steps = 0
+        if self.vector is None or len(self.vector) != self.observationShape()[0]:
+            self.vector = np.zeros(self.observationShape(), dtype=np.float32)
+        if self.capture is not None:
+            # don't hand out frames of the previous episode
+            self.capture.poll(wait=True)
+            self.render()
+            self.pixels = self.readPixels(wait=True)
+        return self.observe(), self.info()
+
+    # advances the game by frame_skip frames holding the action's keys;
+    # returns (observation, reward, terminated, truncated, info)
+    def step(self, action: int):
+        game = self.game
+        reward = 0
+        terminated = False
+        for frame in range(self.frame_skip):
+            # sticky actions: sometimes the previous action is repeated
+            if self.rng.random() >= self.sticky_action_probability:
+                self.last_action = action
+            left, right, fire = self.ACTIONS[self.last_action]
+            game.keys[glfw.KEY_A] = left
+            game.keys[glfw.KEY_D] = right
+            game.keys[glfw.KEY_SPACE] = fire
+            score = game.score
+            self.time += self.dt
+            glfw.set_time(self.time)
+            game.processInput(self.dt)
+            game.update(self.dt)
+            game.recordFrame(self.dt)
+            # losing the last life sends the game back to the menu (and
+            # resets the score), clearing the level to the win screen
+            if game.state != GameState.GAME_MENU:
+                reward += game.score - score
+            if game.state != GameState.GAME_ACTIVE:
+                terminated = True
+                break
+        self.steps += 1
+        truncated = not terminated and self.steps >= self.max_steps
+        if self.capture is not None:
+            self.render()
+            self.pixels = self.readPixels()
+        return self.observe(), reward, terminated, truncated, self.info()
+
+    def info(self) -> dict:
+        return {"lives": self.game.lives, "level": self.level,
+                "score": self.game.score, "steps": self.steps}
+
+    # fills the preallocated vector observation in place (or returns the
+    # latest pixel observation)
+    def observe(self) -> np.ndarray:
+        if self.observation == "pixels":
+            return self.pixels
+        game = self.game
+        v = self.vector
+        speed = float(np.hypot(*game.initial_ball_velocity))
+        v[0] = game.ball.position.x / game.width
+        v[1] = game.ball.position.y / game.height
+        v[2] = game.ball.velocity.x / speed
+        v[3] = game.ball.velocity.y / speed
+        v[4] = game.player.position.x / game.width
+        v[5] = game.player.size.x / game.width
+        v[6] = game.ball.stuck
+        v[7] = game.lives
+        np.logical_not(game.levels[self.level].brick_destroyed,
+                       out=v[self.STATE_SIZE:], casting="unsafe")
+        return v
+
+    # creates the downsampling target and readback ring for pixels
+    def initPixels(self) -> None:
+        width, height = self.pixel_size
+        self.small_texture = GLuint()
+        glCreateTextures(GL_TEXTURE_2D, 1, self.small_texture)
+        glTextureStorage2D(self.small_texture, 1, GL_RGBA8, width, height)
+        self.small_fbo = GLuint()
+        glCreateFramebuffers(1, self.small_fbo)
+        glNamedFramebufferTexture(self.small_fbo, GL_COLOR_ATTACHMENT0,
+                                  self.small_texture, 0)
+        self.capture = FrameCapture(width, height,
+                                    max(2, self.pixel_latency + 1))
+        self.pixels = np.zeros(self.observationShape(), dtype=np.uint8)
+
+    # renders the scene and downsamples it into the small framebuffer
+    def render(self) -> None:
+        glClearColor(0.0, 0.0, 0.0, 1.0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        self.game.render()
+        effects = self.game.effects
+        width, height = self.pixel_size
+        glBlitNamedFramebuffer(effects.fbo, self.small_fbo,
+                               0, 0, effects.scene_width, effects.scene_height,
+                               0, 0, width, height,
+                               GL_COLOR_BUFFER_BIT, GL_LINEAR)
+
+    # starts reading the small framebuffer back and returns the newest
+    # finished frame (the previous observation if none finished yet)
+    def readPixels(self, wait: bool = False) -> np.ndarray:
+        frames = self.capture.capture(self.small_fbo)
+        if wait or self.pixel_latency == 0:
+            frames += self.capture.poll(wait=True)
+        if len(frames) == 0:
+            return self.pixels
+        return frames[-1][:, :, :3]
+
+    def close(self) -> None:
+        if self.capture is not None:
+            self.capture.delete()
+            self.capture = None
+        glfw.destroy_window(self.window)
+        glfw.terminate()
@@ -0,0 +1,22 @@
+#version 460 core
+in vec2 TexCoords;
+in vec3 BrickColor;
+flat in int Texture;
+out vec4 color;
+
+// one texture per palette texture, see BrickRenderer.MAX_TEXTURES
+uniform sampler2D textures[4];
+
+void main()
+{
+    // sampler arrays may only be indexed with constant expressions
+    vec4 sampled;
+    switch (Texture)
+    {
+    case 1: sampled = texture(textures[1], TexCoords); break;
+    case 2: sampled = texture(textures[2], TexCoords); break;
+    case 3: sampled = texture(textures[3], TexCoords); break;
+    default: sampled = texture(textures[0], TexCoords); break;
+    }
+    color = vec4(BrickColor, 1.0) * sampled;
+}
@@ -0,0 +1,31 @@
+#version 460 core
+layout (location = 0) in vec4 vertex; // <vec2 position, vec2 texCoords>
+// per brick instance
+layout (location = 1) in vec4 rect; // <vec2 position, vec2 size>
+layout (location = 2) in vec4 appearance; // <vec3 color, float texture>
+
+// one bit per brick, set once the brick is destroyed
+layout (std430, binding = 0) readonly buffer Destroyed
+{
+    uint destroyed[];
+};
+
+out vec2 TexCoords;
+out vec3 BrickColor;
+flat out int Texture;
+
+uniform mat4 projection;
+
+void main()
+{
+    TexCoords = vertex.zw;
+    BrickColor = appearance.rgb;
+    Texture = int(appearance.a);
+    if (((destroyed[gl_InstanceID >> 5] >> (gl_InstanceID & 31)) & 1u) != 0u)
+    {
+        // destroyed: collapse the quad outside the clip volume
+        gl_Position = vec4(2.0, 2.0, 2.0, 1.0);
+        return;
+    }
+    gl_Position = projection * vec4(rect.xy + vertex.xy * rect.zw, 0.0, 1.0);
+}
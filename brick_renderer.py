@@ -0,0 +1,147 @@
+import numpy as np
+from OpenGL.GL import *
+
+from game_level import GameLevel
+from resource_manager import ResourceManager
+from shader import Shader
+
+
+# BrickRenderer draws all bricks of a level with a single instanced draw.
+# The per-brick instance data (rectangle, color, texture) stays resident in
+# a GPU buffer for as long as the level isn't reloaded, and a bitmask of
+# destroyed bricks is uploaded only when bricks get destroyed; the vertex
+# shader drops destroyed instances. Damaged bricks only have their own
+# rows re-uploaded. The CPU cost of drawing a level
+# therefore doesn't depend on the number of bricks.
+class BrickRenderer:
+    # number of distinct brick textures a palette can use
+    MAX_TEXTURES = 4
+
+    def __init__(self, shader: Shader) -> None:
+        self.shader = shader
+        self.shader.use()
+        # one texture unit per palette texture
+        for i in range(self.MAX_TEXTURES):
+            self.shader.setInteger("textures[{}]".format(i), i)
+        # level (and its versions) the GPU buffers currently hold
+        self.level: GameLevel = None
+        self.revision = -1
+        self.destroyed_version = -1
+        self.count = 0
+        self.instance_buffer: GLuint = None
+        self.mask_buffer: GLuint = None
+        self.initRenderData()
+
+    # draws every brick of the level that isn't destroyed
+    def drawLevel(self, level: GameLevel) -> None:
+        if self.level is not level or self.revision != level.revision:
+            self.uploadLevel(level)
+        elif self.destroyed_version != level.destroyed_version:
+            self.uploadMask(level)
+        if self.count == 0:
+            return
+        self.shader.use()
+        for i, name in enumerate(level.palette.textures[:self.MAX_TEXTURES]):
+            ResourceManager.getTexture(name).bind(i)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, self.mask_buffer)
+        glBindVertexArray(self.vao)
+        glDrawArraysInstanced(GL_TRIANGLES, 0, 6, self.count)
+
+    # (re)creates the instance and mask buffers for a (re)loaded level
+    def uploadLevel(self, level: GameLevel) -> None:
+        if self.instance_buffer is not None:
+            glDeleteBuffers(1, self.instance_buffer)
+            glDeleteBuffers(1, self.mask_buffer)
+        self.level = level
+        self.revision = level.revision
+        self.count = level.brickCount()
+        if len(level.palette.textures) > self.MAX_TEXTURES:
+            # the shader draws bricks with the extra textures with the first
+            print("ERROR::BRICKRENDERER: Palette uses {} textures, only {} "
+                  "are supported".format(len(level.palette.textures),
+                                         self.MAX_TEXTURES))
+        instances = np.zeros((max(self.count, 1), 8), dtype=np.float32)
+        instances[:self.count] = self.instanceData(
+            level, np.arange(self.count))
+        self.instance_buffer = GLuint()
+        glCreateBuffers(1, self.instance_buffer)
+        glNamedBufferStorage(self.instance_buffer, instances.nbytes,
+                             instances, GL_DYNAMIC_STORAGE_BIT)
+        glVertexArrayVertexBuffer(self.vao, 1, self.instance_buffer, 0,
+                                  8 * sizeof(GLfloat))
+        self.mask_buffer = GLuint()
+        glCreateBuffers(1, self.mask_buffer)
+        glNamedBufferStorage(self.mask_buffer, self.maskWords() * 4, None,
+                             GL_DYNAMIC_STORAGE_BIT)
+        self.uploadMask(level)
+
+    # returns the instance rows (rect, color, texture index) of the given
+    # bricks
+    def instanceData(self, level: GameLevel, indices: np.ndarray) -> np.ndarray:
+        instances = np.empty((len(indices), 8), dtype=np.float32)
+        instances[:, 0:2] = level.brick_position[indices]
+        instances[:, 2:4] = level.brick_size[indices]
+        instances[:, 4:7] = level.brick_color[indices]
+        instances[:, 7] = level.brick_texture[indices]
+        return instances
+
+    # re-uploads the instance rows of bricks whose appearance changed;
+    # consecutive indices are uploaded in one call
+    def updateBricks(self, level: GameLevel, indices) -> None:
+        if self.level is not level or self.revision != level.revision:
+            return
+        indices = np.unique(np.asarray(indices, dtype=np.intp))
+        if len(indices) == 0:
+            return
+        instances = self.instanceData(level, indices)
+        starts = np.flatnonzero(np.diff(indices, prepend=-2) != 1)
+        ends = np.append(starts[1:], len(indices))
+        row = 8 * sizeof(GLfloat)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            run = np.ascontiguousarray(instances[start:end])
+            glNamedBufferSubData(self.instance_buffer,
+                                 int(indices[start]) * row, run.nbytes, run)
+
+    # uploads the destroyed flags as one bit per brick
+    def uploadMask(self, level: GameLevel) -> None:
+        self.destroyed_version = level.destroyed_version
+        mask = np.zeros(self.maskWords() * 4, dtype=np.uint8)
+        bits = np.packbits(level.brick_destroyed, bitorder="little")
+        mask[:len(bits)] = bits
+        glNamedBufferSubData(self.mask_buffer, 0, mask.nbytes, mask)
+
+    # number of 32 bit words the destroyed bitmask takes
+    def maskWords(self) -> int:
+        return max(1, (self.count + 31) // 32)
+
+    # initializes the unit quad shared by all instances
+    def initRenderData(self) -> None:
+        vertices = [
+            # pos     # tex
+            0.0, 1.0, 0.0, 1.0,
+            1.0, 0.0, 1.0, 0.0,
+            0.0, 0.0, 0.0, 0.0,
+            0.0, 1.0, 0.0, 1.0,
+            1.0, 1.0, 1.0, 1.0,
+            1.0, 0.0, 1.0, 0.0
+        ]
+        ctype_vertices = (GLfloat * len(vertices))(*vertices)
+        self.vao = GLuint()
+        glCreateVertexArrays(1, self.vao)
+        vbo = GLuint()
+        glCreateBuffers(1, vbo)
+        glNamedBufferStorage(vbo, ctypes.sizeof(ctype_vertices), ctype_vertices,
+                             GL_DYNAMIC_STORAGE_BIT)
+        glVertexArrayVertexBuffer(self.vao, 0, vbo, 0, 4 * sizeof(GLfloat))
+        glVertexArrayAttribFormat(self.vao, 0, 4, GL_FLOAT, GL_FALSE, 0)
+        glVertexArrayAttribBinding(self.vao, 0, 0)
+        glEnableVertexArrayAttrib(self.vao, 0)
+        # per instance: <vec4 rect> and <vec4 appearance> from binding 1
+        glVertexArrayAttribFormat(self.vao, 1, 4, GL_FLOAT, GL_FALSE, 0)
+        glVertexArrayAttribBinding(self.vao, 1, 1)
+        glEnableVertexArrayAttrib(self.vao, 1)
+        glVertexArrayAttribFormat(self.vao, 2, 4, GL_FLOAT, GL_FALSE,
+                                  4 * sizeof(GLfloat))
+        glVertexArrayAttribBinding(self.vao, 2, 1)
+        glEnableVertexArrayAttrib(self.vao, 2)
+        glVertexArrayBindingDivisor(self.vao, 1, 1)
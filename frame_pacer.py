@@ -0,0 +1,170 @@
+import time
+from typing import Callable
+
+import glfw
+import numpy as np
+from OpenGL.GL import *
+
+
+# FramePacer decides when the main loop starts a frame. Modes:
+#
+#   uncapped     frames as fast as the driver allows (no vsync)
+#   vsync        swap_buffers waits for the display (swap interval 1)
+#   cap          no vsync, sleeps so frames start target_fps times a second
+#   low-latency  vsync, but after each swap sleeps until just before the
+#                next refresh (minus the predicted frame work), so input is
+#                sampled as late as possible instead of right after a swap
+#
+# When the loop reports the game as idle (menu or win screen) frames are
+# paced at idle_fps in every mode, waiting for window events so a key
+# press still wakes the loop up at once (idle_fps 0 turns this off).
+# Call beginFrame() before sampling input and endFrame() after
+# swap_buffers:
+#
+#   pacer = FramePacer("cap", 60.0)
+#   pacer.apply()  # once the context is current
+#   while ...:
+#       pacer.beginFrame(idle)
+#       poll input, update, render, swap_buffers
+#       pacer.endFrame()
+#
+# While sleeping, poll is called about every poll_interval seconds (e.g.
+# InputPipeline.poll) so input gets sampled during the wait. vsync waits
+# inside swap_buffers instead, where nothing is polled: input is sampled
+# once per frame there. report()
+# returns the achieved frame time and an input-to-photon estimate (input
+# sampled to swap, plus half a refresh for the display to scan the image
+# out) over the last history frames.
+class FramePacer:
+    MODES = ("uncapped", "vsync", "cap", "low-latency")
+
+    def __init__(self, mode: str = "vsync", target_fps: float = 60.0,
+                 idle_fps: float = 5.0, poll: Callable[[], None] = None,
+                 poll_interval: float = 0.002, history: int = 120) -> None:
+        if mode not in self.MODES:
+            raise ValueError("unknown pacing mode: {}".format(mode))
+        self.mode = mode
+        self.target_fps = target_fps
+        self.idle_fps = idle_fps
+        self.poll = poll
+        self.poll_interval = poll_interval
+        # the last bit of a wait is spun rather than slept, sleeping isn't
+        # precise enough
+        self.spin = 0.001
+        # display refresh period, updated by apply()
+        self.refresh = 1.0 / 60.0
+        # frame time, latency estimate and work (input to swap) per frame
+        self.frame_times = np.zeros(history)
+        self.latencies = np.zeros(history)
+        self.work_times = np.zeros(history)
+        self.frames = 0
+        # frames whose frame time (start to next start) is known
+        self.timed_frames = 0
+        self.frame_start: float = None
+        self.input_time: float = None
+        self.next_frame: float = None
+        self.last_swap: float = None
+        self.idle = False
+
+    # sets the swap interval for the mode and reads the refresh rate
+    def apply(self) -> None:
+        glfw.swap_interval(1 if self.mode in ("vsync", "low-latency") else 0)
+        monitor = glfw.get_primary_monitor()
+        mode = glfw.get_video_mode(monitor) if monitor else None
+        if mode is not None and mode.refresh_rate > 0:
+            self.refresh = 1.0 / mode.refresh_rate
+
+    # waits until the next frame should start; idle frames are paced at
+    # idle_fps
+    def beginFrame(self, idle: bool = False) -> None:
+        now = time.perf_counter()
+        self.idle = idle and self.idle_fps > 0.0
+        if self.idle:
+            if self.frame_start is not None:
+                self.waitEvents(self.frame_start + 1.0 / self.idle_fps)
+            self.next_frame = None
+        elif self.mode == "cap":
+            period = 1.0 / self.target_fps
+            if self.next_frame is None or self.next_frame < now - period:
+                # first frame or fell behind: don't try to catch up
+                self.next_frame = now
+            self.waitUntil(self.next_frame)
+            self.next_frame += period
+        elif self.mode == "low-latency" and self.last_swap is not None:
+            self.waitUntil(self.last_swap + self.refresh
+                           - self.predictWork() - self.spin)
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            i = self.timed_frames % len(self.frame_times)
+            self.frame_times[i] = now - self.frame_start
+            self.timed_frames += 1
+        self.frame_start = now
+        self.input_time = now
+
+    # records the frame once it was swapped
+    def endFrame(self) -> None:
+        if self.mode == "low-latency":
+            # swap_buffers may return before the image is queued, wait for
+            # it so the next wait starts from the refresh
+            glFinish()
+        now = time.perf_counter()
+        self.last_swap = now
+        i = self.frames % len(self.frame_times)
+        self.work_times[i] = now - self.input_time
+        self.latencies[i] = now - self.input_time + self.refresh / 2.0
+        self.frames += 1
+
+    # expected time from sampling input to the swap: the slowest of the
+    # recent frames, with some margin
+    def predictWork(self) -> float:
+        count = min(self.frames, len(self.work_times))
+        if count == 0:
+            return self.refresh / 2.0
+        return min(float(np.max(self.work_times[:count])) * 1.25,
+                   self.refresh)
+
+    # sleeps (polling input) until deadline, spinning the last bit
+    def waitUntil(self, deadline: float) -> None:
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0.0:
+                return
+            if remaining > self.spin:
+                time.sleep(min(remaining - self.spin, self.poll_interval))
+                if self.poll is not None:
+                    self.poll()
+
+    # waits for window events until deadline; returns early on any event
+    def waitEvents(self, deadline: float) -> None:
+        remaining = deadline - time.perf_counter()
+        if remaining > 0.0:
+            glfw.wait_events_timeout(remaining)
+
+    # achieved frame time and input-to-photon estimate in milliseconds
+    def report(self) -> dict:
+        count = min(self.frames, len(self.latencies))
+        timed = min(self.timed_frames, len(self.frame_times))
+        if count == 0 or timed == 0:
+            return {"mode": self.mode, "frames": 0}
+        frame_times = self.frame_times[:timed]
+        latencies = self.latencies[:count]
+        average = float(np.mean(frame_times))
+        return {
+            "mode": self.mode,
+            "idle": self.idle,
+            "frames": self.frames,
+            "fps": 1.0 / average if average > 0.0 else 0.0,
+            "frame_time_ms": average * 1000.0,
+            "frame_time_max_ms": float(np.max(frame_times)) * 1000.0,
+            "latency_ms": float(np.mean(latencies)) * 1000.0,
+            "latency_max_ms": float(np.max(latencies)) * 1000.0
+        }
+
+    # one line summary of report(), e.g. for the window title
+    def summary(self) -> str:
+        report = self.report()
+        if report["frames"] == 0:
+            return report["mode"]
+        return "{} {:.0f} fps {:.1f} ms ~{:.0f} ms latency{}".format(
+            report["mode"], report["fps"], report["frame_time_ms"],
+            report["latency_ms"], " (idle)" if report["idle"] else "")
@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+from OpenGL.GL import *
+
+
+# FrameProfiler measures named sections of a frame on the CPU
+# (time.perf_counter) and on the GPU (GL_TIMESTAMP queries written before
+# and after the section's commands). Each frame uses its own set of query
+# objects out of frames_in_flight sets, so a set's results are only read
+# when the set comes around again, frames later, and only if they're
+# available by then: reading results never stalls (a sample that isn't
+# ready is dropped). Sections may nest; a section measured more than once
+# per frame only keeps its last measurement.
+#
+#   profiler.beginFrame()
+#   profiler.begin("scene") ... profiler.end("scene")
+#
+# report() returns rolling averages over the last history frames in
+# milliseconds. When not enabled, every call returns right away.
+class FrameProfiler:
+    def __init__(self, sections: list[str], enabled: bool = True,
+                 frames_in_flight: int = 2, history: int = 60) -> None:
+        self.sections = list(sections)
+        self.index = {name: i for i, name in enumerate(self.sections)}
+        self.enabled = enabled
+        self.history = history
+        # per section: rolling samples and how many were taken
+        self.cpu = np.zeros((len(self.sections), history))
+        self.gpu = np.zeros((len(self.sections), history))
+        self.cpu_count = np.zeros(len(self.sections), dtype=np.int64)
+        self.gpu_count = np.zeros(len(self.sections), dtype=np.int64)
+        self.cpu_start = [0.0] * len(self.sections)
+        self.sets: list[GLuint] = []
+        # which sections were measured by each set's frame
+        self.issued: list[list[bool]] = []
+        self.current = 0
+        if not enabled:
+            return
+        for i in range(frames_in_flight):
+            # begin and end timestamp per section
+            queries = (GLuint * (2 * len(self.sections)))()
+            glCreateQueries(GL_TIMESTAMP, len(queries), queries)
+            self.sets.append(queries)
+            self.issued.append([False] * len(self.sections))
+        self.result = GLuint64()
+        self.available = GLint()
+
+    # collects the results of the query set this frame reuses
+    def beginFrame(self) -> None:
+        if not self.enabled:
+            return
+        self.current = (self.current + 1) % len(self.sets)
+        queries = self.sets[self.current]
+        issued = self.issued[self.current]
+        for i in range(len(self.sections)):
+            if not issued[i]:
+                continue
+            issued[i] = False
+            end = queries[2 * i + 1]
+            glGetQueryObjectiv(end, GL_QUERY_RESULT_AVAILABLE, self.available)
+            if not self.available.value:
+                continue
+            glGetQueryObjectui64v(end, GL_QUERY_RESULT, self.result)
+            stop = self.result.value
+            glGetQueryObjectui64v(queries[2 * i], GL_QUERY_RESULT,
+                                  self.result)
+            self.add(self.gpu, self.gpu_count, i,
+                     (stop - self.result.value) / 1e9)
+
+    def begin(self, name: str) -> None:
+        if not self.enabled:
+            return
+        i = self.index[name]
+        glQueryCounter(self.sets[self.current][2 * i], GL_TIMESTAMP)
+        self.cpu_start[i] = time.perf_counter()
+
+    def end(self, name: str) -> None:
+        if not self.enabled:
+            return
+        i = self.index[name]
+        self.add(self.cpu, self.cpu_count, i,
+                 time.perf_counter() - self.cpu_start[i])
+        glQueryCounter(self.sets[self.current][2 * i + 1], GL_TIMESTAMP)
+        self.issued[self.current][i] = True
+
+    def add(self, samples: np.ndarray, counts: np.ndarray, i: int,
+            seconds: float) -> None:
+        samples[i, counts[i] % self.history] = seconds
+        counts[i] += 1
+
+    # average CPU and GPU milliseconds per section (None: no samples yet)
+    def report(self) -> dict:
+        report = {}
+        for i, name in enumerate(self.sections):
+            cpu = min(int(self.cpu_count[i]), self.history)
+            gpu = min(int(self.gpu_count[i]), self.history)
+            report[name] = {
+                "cpu_ms": float(np.mean(self.cpu[i, :cpu])) * 1000.0
+                if cpu > 0 else None,
+                "gpu_ms": float(np.mean(self.gpu[i, :gpu])) * 1000.0
+                if gpu > 0 else None
+            }
+        return report
+
+    # one line summary of the GPU times, e.g. for the window title
+    def summary(self) -> str:
+        parts = []
+        for name, times in self.report().items():
+            if times["gpu_ms"] is not None:
+                parts.append("{} {:.2f}".format(name, times["gpu_ms"]))
+        return "gpu ms: " + ", ".join(parts)
+
+    def delete(self) -> None:
+        for queries in self.sets:
+            glDeleteQueries(len(queries), queries)
+        self.sets.clear()
@@ -2,21 +2,34 @@ from enum import Enum
 from typing import NamedTuple
 import random
 import sys
+import threading
 
 import glm
 import glfw
-from pygame import mixer
+import numpy as np
 
+import startup
 
 from resource_manager import ResourceManager
 from sprite_renderer import SpriteRenderer
+from brick_renderer import BrickRenderer
 from game_object import GameObject
 from ball_object import BallObject
+from ball_group import BallGroup
 from particle_generator import ParticleGenerator
 from post_processor import PostProcessor
-from text_renderer import TextRenderer
+from text_renderer import TextLabel, TextRenderer
 from game_level import GameLevel
+from tile_palette import TilePalette
+from static_layer import StaticLayer
+from hot_reload import HotReloader
+from game_stats import GameStats
+from frame_profiler import FrameProfiler
 from texture2d import Texture2D
+from startup import lazyImport
+
+# imported when the audio is initialized
+mixer = lazyImport("pygame.mixer")
 
 
 # Represents the current state of the game
@@ -55,22 +68,63 @@ class PowerUp(GameObject):
         self.activated = False
 
 
+# appearance of each powerup type: color, duration and texture name
+POWERUP_TYPES: dict[str, tuple[glm.vec3, float, str]] = {
+    "speed": (glm.vec3(0.5, 0.5, 1.0), 0.0, "powerup_speed"),
+    "sticky": (glm.vec3(1.0, 0.5, 1.0), 20.0, "powerup_sticky"),
+    "pass-through": (glm.vec3(0.5, 1.0, 0.5), 10.0, "powerup_passthrough"),
+    "pad-size-increase": (glm.vec3(1.0, 0.6, 0.4), 0.0, "powerup_increase"),
+    "multi-ball": (glm.vec3(1.0, 1.0, 0.3), 0.0, "block"),
+    "confuse": (glm.vec3(1.0, 0.3, 0.3), 15.0, "powerup_confuse"),
+    "chaos": (glm.vec3(0.9, 0.25, 0.25), 15.0, "powerup_chaos")
+}
+
+
+# textures the game loads: file, whether it has alpha, name
+TEXTURES: list[tuple[str, bool, str]] = [
+    ("textures/background.jpg", False, "background"),
+    ("textures/awesomeface.png", True, "face"),
+    ("textures/block.png", False, "block"),
+    ("textures/block_solid.png", False, "block_solid"),
+    ("textures/paddle.png", True, "paddle"),
+    ("textures/particle.png", True, "particle"),
+    ("textures/powerup_speed.png", True, "powerup_speed"),
+    ("textures/powerup_sticky.png", True, "powerup_sticky"),
+    ("textures/powerup_increase.png", True, "powerup_increase"),
+    ("textures/powerup_confuse.png", True, "powerup_confuse"),
+    ("textures/powerup_chaos.png", True, "powerup_chaos"),
+    ("textures/powerup_passthrough.png", True, "powerup_passthrough")
+]
+
+# sound effects and the music the game plays
+SOUNDS: dict[str, str] = {
+    "box": "audio/bleep.mp3",
+    "solid": "audio/solid.wav",
+    "powerup": "audio/powerup.wav",
+    "pad": "audio/bleep.wav"
+}
+MUSIC = "audio/breakout.mp3"
+
+
+# stands in for the sounds until the audio is loaded (or if there is no
+# audio device)
+class SilentSound:
+    def play(self, *args) -> None:
+        pass
+
+
 # calculates which direction a vector is facing (N,E,S or W)
 def vectorDirection(target: glm.vec2) -> Direction:
-    compass: list[glm.vec2] = [
-        glm.vec2(0.0, 1.0),  # up
-        glm.vec2(1.0, 0.0),  # right
-        glm.vec2(0.0, -1.0),  # down
-        glm.vec2(-1.0, 0.0)  # left
-    ]
-    max = 0.0
-    best_match = -1
-    for i in range(4):
-        dot_product = glm.dot(glm.normalize(target), compass[i])
-        if dot_product > max:
-            max = dot_product
-            best_match = i
-    return Direction(best_match)
+    return axisDirection(target.x, target.y)
+
+
+# same as vectorDirection but on plain floats: the compass direction with
+# the largest dot product is simply the dominant axis of the vector, so a
+# single comparison of both components is enough (no normalization)
+def axisDirection(x: float, y: float) -> Direction:
+    if abs(x) > abs(y):
+        return Direction.RIGHT if x > 0.0 else Direction.LEFT
+    return Direction.UP if y > 0.0 else Direction.DOWN
 
 
 def isOtherPowerUpActive(powerups: list[PowerUp], type: str) -> bool:
@@ -101,43 +155,136 @@ def checkCollision(one: GameObject, two: GameObject) -> bool:
     return collision_x and collision_y
 
 
+# shared result for every miss so the common case allocates nothing
+NO_COLLISION = Collision(False, Direction.UP, glm.vec2(0.0, 0.0))
+
+
 # AABB - Circle collision
+# Works on plain floats rather than glm temporaries since it runs once per
+# brick per frame; only a hit builds a Collision.
 def ballCheckCollision(one: BallObject, two: GameObject) -> Collision:
+    return ballCheckCollisionBox(one, two.position.x, two.position.y,
+                                 two.size.x, two.size.y)
+
+
+# same test against a box given as plain floats (top-left corner and size),
+# e.g. straight from a level's brick arrays
+def ballCheckCollisionBox(one: BallObject, x: float, y: float,
+                          width: float, height: float) -> Collision:
+    radius = one.radius
     # get center point circle first
-    center = glm.vec2(one.position + one.radius)
+    center_x = one.position.x + radius
+    center_y = one.position.y + radius
     # cacluate AABB info (center, half-extents)
-    aabb_half_extents = glm.vec2(two.size.x / 2.0, two.size.y / 2.0)
-    aabb_center = glm.vec2(two.position.x + aabb_half_extents.x,
-                           two.position.y + aabb_half_extents.y)
-    # get difference vector between both centers
-    difference = center - aabb_center
-    clamped = glm.clamp(difference, -aabb_half_extents, aabb_half_extents)
-    # now that we know the clamped values, add this to AABB_center and we get the value of box closest to circle
-    closest = aabb_center + clamped
-    # now retrieve vector between center circle and closest point AABB and check if length < radius
-    difference = closest - center
+    half_x = width * 0.5
+    half_y = height * 0.5
+    aabb_x = x + half_x
+    aabb_y = y + half_y
+    # get difference vector between both centers and clamp it to the AABB,
+    # which gives the point of the box closest to the circle; then retrieve
+    # the vector between that point and the circle center
+    dx = center_x - aabb_x
+    if dx > half_x:
+        dx = half_x
+    elif dx < -half_x:
+        dx = -half_x
+    dy = center_y - aabb_y
+    if dy > half_y:
+        dy = half_y
+    elif dy < -half_y:
+        dy = -half_y
+    dx = aabb_x + dx - center_x
+    dy = aabb_y + dy - center_y
+    # check if length < radius (compared squared).
     # not <= since in that case a collision also occurs when object one exactly
     # touches object two, which they are at the end of each collision resolution stage.
-    if glm.length(difference) < one.radius:
-        return Collision(True, vectorDirection(difference), difference)
-    else:
-        return Collision(False, Direction.UP, glm.vec2(0.0, 0.0))
+    if dx * dx + dy * dy < radius * radius:
+        return Collision(True, axisDirection(dx, dy), glm.vec2(dx, dy))
+    return NO_COLLISION
+
+
+# collision resolution: reverses the ball's velocity along the axis it hit
+# the box on and moves it back out of the box
+def resolveCollision(ball: BallObject, collision: Collision) -> None:
+    dir = collision.direction
+    diff_vector = collision.position
+    if dir == Direction.LEFT or dir == Direction.RIGHT:  # horizontal collision
+        ball.velocity.x = -ball.velocity.x  # reverse horizontal velocity
+        # relocate
+        penetration = ball.radius - abs(diff_vector.x)
+        if dir == Direction.LEFT:
+            ball.position.x += penetration  # move ball to right
+        else:
+            ball.position.x -= penetration  # move ball to left
+    else:  # vertical collision
+        ball.velocity.y = -ball.velocity.y  # reverse vertical velocity
+        # relocate
+        penetration = ball.radius - abs(diff_vector.y)
+        if dir == Direction.UP:
+            ball.position.y -= penetration  # move ball back up
+        else:
+            ball.position.y += penetration  # move ball back down
+
+
+# velocity of a ball bouncing off the player pad at percentage (-1 left
+# edge, 1 right edge) of the pad's half width from its center; the more
+# off center, the more sideways it goes
+def paddleBounceVelocity(velocity: glm.vec2, percentage: float,
+                         initial_velocity_x: float) -> glm.vec2:
+    strength = 2.0
+    new_velocity = glm.vec2(initial_velocity_x * percentage * strength,
+                            velocity.y)
+    # keep speed consistent over both axes (multiply by length of old velocity, so total strength is not changed)
+    new_velocity = glm.normalize(new_velocity) * glm.length(new_velocity)
+    # fix sticky paddle
+    new_velocity.y = -1.0 * abs(new_velocity.y)
+    return new_velocity
+
+
+# AABB - Circle collision for many balls against a level at once.
+# Only the tiles within reach of each ball's grid cell are tested, so the
+# cost scales with the number of balls rather than with the level size.
+# Returns the ball indices (into centers), brick indices and difference
+# vectors (closest point - center) of every colliding pair.
+def ballsCheckCollision(centers: np.ndarray, radius: float,
+                        level: GameLevel) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    ball, brick = level.bricksNear(centers, radius)
+    # closest point on each AABB to the circle center
+    half_extents = level.brick_size[brick] / 2.0
+    aabb_center = level.brick_position[brick] + half_extents
+    center = centers[ball]
+    clamped = np.clip(center - aabb_center, -half_extents, half_extents)
+    difference = aabb_center + clamped - center
+    hit = np.einsum("ij,ij->i", difference, difference) < radius * radius
+    return ball[hit], brick[hit], difference[hit]
 
 
 # Game holds all game-related state and functionality.
 # Combines all game-related data into a single class for
 # easy access to each of the components and manageability.
+# The game simulates in a fixed logical coordinate space of width x height
+# units, independent of the window's size in pixels; see resize().
 class Game:
     def __init__(self, width: int, height: int) -> None:
         self.state = GameState.GAME_MENU
         self.keys: list[bool] = [False] * 1024
         self.keys_processed: list[bool] = [False] * 1024
+        # pad movement (-1 left .. 1 right) set by an input pipeline for
+        # processInput instead of the A/D keys (None: use the keys)
+        self.paddle_axis: float = None
         self.width = width
         self.height = height
         self.levels: list[GameLevel] = []
+        self.level_files = ["levels/one.lvl", "levels/two.lvl",
+                            "levels/three.lvl", "levels/four.lvl"]
         self.powerups: list[PowerUp] = []
+        # maximum number of extra balls in play (multi-ball)
+        self.max_balls = 512
+        # number of extra balls released by a multi-ball powerup
+        self.multi_ball_count = 2
         self.level = 0
         self.lives = 3
+        self.score = 0
         self.shake_time = 0.0
         # Initial velocity of the Ball
         self.initial_ball_velocity = (100.0, -350.0)
@@ -147,15 +294,35 @@ class Game:
         self.player_size = glm.vec2(300.0, 20.0)
         # Initial velocity of the player paddle
         self.player_velocity = 500.0
-        mixer.init()
+        # MSAA samples of the post-processing framebuffer (0 disables
+        # multisampling)
+        self.msaa_samples = 4
+        # development mode: reload shaders and levels when their files
+        # change on disk
+        self.hot_reload = False
+        # internal resolution of the scene relative to the window
+        self.render_scale = 1.0
+        # size of the window's framebuffer in pixels and the rectangle of it
+        # the game is shown in (x, y, width, height)
+        self.framebuffer_size = (width, height)
+        self.viewport = (0, 0, width, height)
+        # file session statistics are written to (.jsonl, .db or .sqlite),
+        # None to only count them in memory, and how often (in seconds)
+        self.stats_file: str = None
+        self.stats_interval = 10.0
+        # measure CPU and GPU time of the render passes
+        self.profile = False
+        # sound effects, loaded in the background by init()
+        self.box_sound = self.solid_sound = SilentSound()
+        self.powerup_sound = self.pad_sound = SilentSound()
+        self.audio_thread: threading.Thread = None
 
     def init(self) -> None:
         # load shaders
         ResourceManager.loadShader("sprite.vs", "sprite.fs", None, "sprite")
         ResourceManager.loadShader(
             "particle.vs", "particle.fs", None, "particle")
-        ResourceManager.loadShader(
-            "post_processing.vs", "post_processing.fs", None, "postprocessing")
+        ResourceManager.loadShader("brick.vs", "brick.fs", None, "brick")
         # configure shaders
         projection = glm.ortho(0.0, float(self.width),
                                float(self.height), 0.0, -1.0, 1.0)
@@ -167,49 +334,53 @@ class Game:
         ResourceManager.getShader("particle").setInteger("sprite", 0)
         ResourceManager.getShader("particle").setMatrix4(
             "projection", projection)
+        ResourceManager.getShader("brick").use()
+        ResourceManager.getShader("brick").setMatrix4(
+            "projection", projection)
         # load textures
-        ResourceManager.loadTexture(
-            "textures/background.jpg", False, "background")
-        ResourceManager.loadTexture("textures/awesomeface.png", True, "face")
-        ResourceManager.loadTexture("textures/block.png", False, "block")
-        ResourceManager.loadTexture(
-            "textures/block_solid.png", False, "block_solid")
-        ResourceManager.loadTexture("textures/paddle.png", True, "paddle")
-        ResourceManager.loadTexture("textures/particle.png", True, "particle")
-        ResourceManager.loadTexture(
-            "textures/powerup_speed.png", True, "powerup_speed")
-        ResourceManager.loadTexture(
-            "textures/powerup_sticky.png", True, "powerup_sticky")
-        ResourceManager.loadTexture(
-            "textures/powerup_increase.png", True, "powerup_increase")
-        ResourceManager.loadTexture(
-            "textures/powerup_confuse.png", True, "powerup_confuse")
-        ResourceManager.loadTexture(
-            "textures/powerup_chaos.png", True, "powerup_chaos")
-        ResourceManager.loadTexture(
-            "textures/powerup_passthrough.png", True, "powerup_passthrough")
+        for file, alpha, name in TEXTURES:
+            ResourceManager.loadTexture(file, alpha, name)
         # set render-specific controls
         self.renderer = SpriteRenderer(ResourceManager.getShader("sprite"))
+        self.brick_renderer = BrickRenderer(ResourceManager.getShader("brick"))
         self.particles = ParticleGenerator(ResourceManager.getShader("particle"),
                                            ResourceManager.getTexture("particle"), 500)
-        self.effects = PostProcessor(ResourceManager.getShader(
-            "postprocessing"), self.width, self.height)
+        self.effects = PostProcessor(self.width, self.height,
+                                     self.msaa_samples, self.render_scale)
+        self.static_layer = StaticLayer(self.width, self.height)
         self.text = TextRenderer(self.width, self.height)
-        self.text.load("fonts/OCRAEXT.TTF", 24)
+        self.text.load("fonts/OCRAEXT.TTF", 24, background=True)
+        # HUD and prompts, only laid out again when their text changes
+        self.lives_label = TextLabel(self.text, "Lives:{}", 5.0, 5.0)
+        self.level_label = TextLabel(self.text, "Current Level:{}", 5.0, 45.0)
+        self.menu_labels = [
+            TextLabel(self.text, "Press ENTER to start",
+                      250.0, self.height / 2.0),
+            TextLabel(self.text, "Press W or S to select level",
+                      245.0, self.height / 2.0 + 20.0, 0.75)]
+        self.win_labels = [
+            TextLabel(self.text, "You WON!!!", 320.0,
+                      self.height / 2.0 - 20.0, 1.0, glm.vec3(0.0, 1.0, 0.0)),
+            TextLabel(self.text, "Press ENTER to retry or ESC to quit",
+                      130.0, self.height / 2.0, 1.0, glm.vec3(1.0, 1.0, 0.0))]
+        if self.hot_reload:
+            self.reloader = HotReloader(self)
         # load levels
-        one = GameLevel()
-        one.load("levels/one.lvl", self.width, self.height / 2)
-        two = GameLevel()
-        two.load("levels/two.lvl", self.width, self.height / 2)
-        three = GameLevel()
-        three.load("levels/three.lvl", self.width, self.height / 2)
-        four = GameLevel()
-        four.load("levels/four.lvl", self.width, self.height / 2)
-        self.levels.append(one)
-        self.levels.append(two)
-        self.levels.append(three)
-        self.levels.append(four)
+        self.palette = TilePalette.load("levels/tiles.json")
+        for file in self.level_files:
+            level = GameLevel(self.palette)
+            level.load(file, self.width, self.height / 2)
+            self.levels.append(level)
         self.level = 0
+        # session statistics
+        self.stats = GameStats(len(self.palette.hits), list(POWERUP_TYPES),
+                               self.stats_interval)
+        if self.stats_file is not None:
+            self.stats.open(self.stats_file)
+        self.profiler = FrameProfiler(
+            ["scene", "particles", "blit", "effects", "text"], self.profile)
+        if self.profile:
+            self.stats.addReport("profile", self.profiler.report)
         # configure game objects
         player_pos = glm.vec2(
             self.width / 2.0 - self.player_size.x / 2.0, self.height - self.player_size.y)
@@ -221,22 +392,81 @@ class Game:
         tempx, tempy = self.initial_ball_velocity
         self.ball = BallObject(ball_pos, self.ball_radius, glm.vec2(
             tempx, tempy), ResourceManager.getTexture("face"))
-
-        # audio
-        self.box_sound = mixer.Sound("audio/bleep.mp3")
-        self.solid_sound = mixer.Sound("audio/solid.wav")
-        self.powerup_sound = mixer.Sound("audio/powerup.wav")
-        self.pad_sound = mixer.Sound("audio/bleep.wav")
-        mixer.music.load("audio/breakout.mp3")
-        mixer.music.play(-1)
+        self.balls = BallGroup(self.max_balls, self.ball_radius,
+                               ResourceManager.getTexture("face"))
+
+        # audio (pygame, the mixer and decoding sounds) is set up on another
+        # thread while the first frames render
+        self.audio_thread = threading.Thread(target=self.initAudio,
+                                             name="audio", daemon=True)
+        self.audio_thread.start()
+
+    def initAudio(self) -> None:
+        try:
+            mixer.init()
+            sounds = [ResourceManager.loadSound(SOUNDS[name]) for name in
+                      ("box", "solid", "powerup", "pad")]
+            (self.box_sound, self.solid_sound,
+             self.powerup_sound, self.pad_sound) = sounds
+            ResourceManager.loadMusic(MUSIC)
+            mixer.music.play(-1)
+            startup.mark("audio loaded")
+        except Exception as e:
+            print("ERROR::GAME: Failed to initialize audio", e)
+
+    # waits for what init() loads in the background (text and audio), for
+    # frames that have to be complete from the start
+    def finishLoading(self) -> None:
+        self.text.wait()
+        if self.audio_thread is not None:
+            self.audio_thread.join()
+
+    # stops the music and closes the mixer
+    def closeAudio(self) -> None:
+        if self.audio_thread is None:
+            return
+        self.audio_thread.join()
+        self.audio_thread = None
+        if mixer.get_init():
+            mixer.music.stop()
+            mixer.quit()
+
+    # adapts rendering to a new framebuffer size (in pixels); the logical
+    # game area is scaled to fit, keeping its aspect ratio
+    def resize(self, width: int, height: int) -> None:
+        if width <= 0 or height <= 0:
+            return  # minimized
+        self.framebuffer_size = (width, height)
+        scale = min(width / self.width, height / self.height)
+        w = max(1, int(self.width * scale))
+        h = max(1, int(self.height * scale))
+        self.viewport = ((width - w) // 2, (height - h) // 2, w, h)
+        self.effects.resize(*self.viewport)
+        self.static_layer.resize(int(w * self.render_scale),
+                                 int(h * self.render_scale))
+
+    # renders the scene at the given fraction of the output resolution
+    def setRenderScale(self, render_scale: float) -> None:
+        self.render_scale = render_scale
+        self.effects.render_scale = render_scale
+        self.resize(*self.framebuffer_size)
 
     def update(self, dt: float) -> None:
+        if self.hot_reload:
+            self.reloader.poll(glfw.get_time())
         # update objects
         self.ball.move(dt, self.width)
+        self.balls.move(dt, self.width)
 
         # check for collisions
         self.doCollisions()
-        # update particles
+        # extra balls that reach the bottom edge are simply lost
+        self.balls.cull(self.height)
+        # update particles (one trail particle per extra ball)
+        active = self.balls.active()
+        self.particles.respawnParticles(
+            self.balls.position[active], self.balls.velocity[active], 1,
+            glm.vec2(self.balls.radius / 2.0))
         self.particles.update(
             dt, self.ball, 2, glm.vec2(self.ball.radius / 2.0))
         # update PowerUps
@@ -246,21 +476,38 @@ class Game:
             self.shake_time -= dt
             if self.shake_time <= 0.0:
                 self.effects.shake = False
+        self.stats.poll(glfw.get_time(), score=self.score, level=self.level)
         # check loss condition
-        if self.ball.position.y >= self.height:  # did ball reach bottom edge?
+        if self.ball.position.y >= self.height and self.balls.count() > 0:
+            # an extra ball is still in play: it becomes the main ball
+            position, velocity = self.balls.take(self.balls.active()[0])
+            self.ball.position = position
+            self.ball.velocity = velocity
+        elif self.ball.position.y >= self.height:  # did ball reach bottom edge?
             self.lives = self.lives - 1
+            self.stats.lives_lost += 1
             # did the player lose all his lives? : game over
             if self.lives == 0:
                 self.resetLevel()
+                self.score = 0
                 self.state = GameState.GAME_MENU
             self.resetPlayer()
         # check win condition
         if self.state == GameState.GAME_ACTIVE and self.levels[self.level].isCompleted():
+            self.stats.levelCleared(self.level)
             self.resetLevel()
             self.resetPlayer()
             self.effects.chaos = True
             self.state = GameState.GAME_WIN
 
+    # records a frame's statistics; call once per rendered frame with its
+    # frame time (update() may run any number of times per frame)
+    def recordFrame(self, dt: float) -> None:
+        if self.state == GameState.GAME_ACTIVE:
+            self.stats.frame(dt, glm.length(self.ball.velocity))
+        else:
+            self.stats.frame(dt)
+
     # game loop
     def processInput(self, dt: float) -> None:
         if self.state == GameState.GAME_MENU:
@@ -268,7 +515,7 @@ class Game:
                 self.state = GameState.GAME_ACTIVE
                 self.keys_processed[glfw.KEY_ENTER] = True
             if self.keys[glfw.KEY_W] and (not self.keys_processed[glfw.KEY_W]):
-                if self.level < 3:
+                if self.level < len(self.levels) - 1:
                     self.level = self.level + 1
                 else:
                     self.level = 0
@@ -277,7 +524,7 @@ class Game:
                 if self.level > 0:
                     self.level = self.level - 1
                 else:
-                    self.level = 3
+                    self.level = len(self.levels) - 1
                 self.keys_processed[glfw.KEY_S] = True
         if self.state == GameState.GAME_WIN:
             if self.keys[glfw.KEY_ENTER]:
@@ -285,14 +532,17 @@ class Game:
                 self.effects.chaos = False
                 self.state = GameState.GAME_MENU
         if self.state == GameState.GAME_ACTIVE:
-            velocity = self.player_velocity * dt
+            axis = self.paddle_axis
+            if axis is None:
+                axis = float(self.keys[glfw.KEY_D]) - float(self.keys[glfw.KEY_A])
+            velocity = self.player_velocity * dt * axis
             # move playerboard
-            if self.keys[glfw.KEY_A]:
+            if velocity < 0.0:
                 if self.player.position.x >= 0.0:
-                    self.player.position.x -= velocity
+                    self.player.position.x += velocity
                     if self.ball.stuck:
-                        self.ball.position.x -= velocity
-            if self.keys[glfw.KEY_D]:
+                        self.ball.position.x += velocity
+            if velocity > 0.0:
                 if self.player.position.x <= self.width - self.player.size.x:
                     self.player.position.x += velocity
                     if self.ball.stuck:
@@ -301,15 +551,18 @@ class Game:
                 self.ball.stuck = False
 
     def render(self) -> None:
+        profiler = self.profiler
+        profiler.beginFrame()
         if self.state == GameState.GAME_ACTIVE or self.state == GameState.GAME_MENU or self.state == GameState.GAME_WIN:
+            # refresh the cached background and level if bricks changed
+            self.static_layer.update(self.renderer, self.brick_renderer,
+                                     ResourceManager.getTexture("background"),
+                                     self.levels[self.level])
             # begin rendering to postprocessing framebuffer
+            profiler.begin("scene")
             self.effects.beginRender()
-            # draw background
-            background_texture = ResourceManager.getTexture("background")
-            self.renderer.drawSprite(background_texture, glm.vec2(
-                0.0, 0.0), glm.vec2(self.width, self.height), 0.0)
-            # draw level
-            self.levels[self.level].draw(self.renderer)
+            # draw background and level
+            self.static_layer.draw(self.renderer)
             # draw player
             self.player.draw(self.renderer)
             # draw PowerUps
@@ -317,40 +570,54 @@ class Game:
                 if not powerup.destroyed:
                     powerup.draw(self.renderer)
             # draw particles
+            profiler.begin("particles")
             self.particles.draw()
+            profiler.end("particles")
             # draw ball
             self.ball.draw(self.renderer)
+            self.balls.draw(self.renderer)
+            profiler.end("scene")
             # end rendering to mpostprocessing framebuffer
+            profiler.begin("blit")
             self.effects.endRender()
+            profiler.end("blit")
             # render postprocessing quad
+            profiler.begin("effects")
             self.effects.render(glfw.get_time())
+            profiler.end("effects")
             # render text (don't include in postprocessing)
-            ss = "".join(["Lives:", str(self.lives)])
-            self.text.renderText(ss, 5.0, 5.0, 1.0)
-            ss = "".join(["Current Level:", str(self.level)])
-            self.text.renderText(ss, 5.0, 45.0, 1.0)
+            profiler.begin("text")
+            self.lives_label.update(self.lives)
+            self.lives_label.draw()
+            self.level_label.update(self.level)
+            self.level_label.draw()
         if self.state == GameState.GAME_MENU:
-            self.text.renderText("Press ENTER to start",
-                                 250.0, self.height / 2.0, 1.0)
-            self.text.renderText("Press W or S to select level",
-                                 245.0, self.height / 2.0 + 20.0, 0.75)
+            for label in self.menu_labels:
+                label.draw()
         if self.state == GameState.GAME_WIN:
-            self.text.renderText(
-                "You WON!!!", 320.0, self.height / 2.0 - 20.0, 1.0, glm.vec3(0.0, 1.0, 0.0))
-            self.text.renderText("Press ENTER to retry or ESC to quit",
-                                 130.0, self.height / 2.0, 1.0, glm.vec3(1.0, 1.0, 0.0))
+            for label in self.win_labels:
+                label.draw()
+        profiler.end("text")
 
     def resetLevel(self) -> None:
-        if self.level == 0:
-            self.levels[0].load("levels/one.lvl", self.width, self.height / 2)
-        if self.level == 1:
-            self.levels[1].load("levels/two.lvl", self.width, self.height / 2)
-        if self.level == 2:
-            self.levels[2].load("levels/three.lvl",
-                                self.width, self.height / 2)
-        if self.level == 3:
-            self.levels[3].load("levels/four.lvl", self.width, self.height / 2)
+        level = self.levels[self.level]
+        file = self.level_files[self.level]
+        if file is not None:
+            level.load(file, self.width, self.height / 2)
+        else:
+            # generated level: rebuild from its tile data
+            level.init(level.tile_data, self.width, self.height / 2)
         self.lives = 3
+        self.stats.startLevel()
+
+    # adds a level from tile data (e.g. from level_generator) and returns
+    # its index
+    def addLevel(self, tile_data) -> int:
+        level = GameLevel(self.palette)
+        level.init(tile_data, self.width, self.height / 2)
+        self.levels.append(level)
+        self.level_files.append(None)
+        return len(self.levels) - 1
 
     def resetPlayer(self) -> None:
         # reset player/ball stats
@@ -362,6 +629,7 @@ class Game:
                      self.ball_radius, -self.ball_radius * 2.0)
         tempx, tempy = self.initial_ball_velocity
         self.ball.reset(ball_pos, glm.vec2(tempx, tempy))
+        self.balls.clear()
         # also disable all active powerups
         self.effects.chaos = False
         self.effects.confuse = False
@@ -378,6 +646,7 @@ class Game:
                 if powerup.duration <= 0.0:
                     # remove powerup from list
                     powerup.activated = False
+                    self.stats.powerupExpired(powerup.type)
                     # deactivate effects
                     if powerup.type == "sticky":
                         if not isOtherPowerUpActive(self.powerups, "sticky"):
@@ -388,6 +657,7 @@ class Game:
                         if not isOtherPowerUpActive(self.powerups, "pass-through"):
                             # only reset if no other PowerUp of type pass-through is active
                             self.ball.pass_through = False
+                            self.balls.pass_through = False
                             self.player.color = glm.vec3(1.0)
                     elif powerup.type == "confuse":
                         if not isOtherPowerUpActive(self.powerups, "confuse"):
@@ -404,37 +674,43 @@ class Game:
             if p.destroyed and (not p.activated):
                 self.powerups.remove(p)
 
-    def spawnPowerUps(self, block: GameObject) -> None:
-        if shouldSpawn(75):  # 1 in 75 chance
-            self.powerups.append(PowerUp("speed", glm.vec3(0.5, 0.5, 1.0), 0.0,
-                                         block.position, ResourceManager.getTexture("powerup_speed")))
-        if shouldSpawn(75):  # 1 in 75 chance
-            self.powerups.append(PowerUp("sticky", glm.vec3(1.0, 0.5, 1.0), 20.0,
-                                         block.position, ResourceManager.getTexture("powerup_sticky")))
-        if shouldSpawn(75):  # 1 in 75 chance
-            self.powerups.append(PowerUp("pass-through", glm.vec3(0.5, 1.0, 0.5), 10.0,
-                                         block.position, ResourceManager.getTexture("powerup_passthrough")))
-        if shouldSpawn(75):  # 1 in 75 chance
-            self.powerups.append(PowerUp("pad-size-increase", glm.vec3(1.0, 0.6, 0.4), 0.0,
-                                         block.position, ResourceManager.getTexture("powerup_increase")))
-        if shouldSpawn(15):  # Negative powerups should spawn more often
-            self.powerups.append(PowerUp("confuse", glm.vec3(1.0, 0.3, 0.3), 15.0,
-                                         block.position, ResourceManager.getTexture("powerup_confuse")))
-        if shouldSpawn(15):
-            self.powerups.append(PowerUp("chaos", glm.vec3(0.9, 0.25, 0.25), 15.0,
-                                         block.position, ResourceManager.getTexture("powerup_chaos")))
+    # rolls each powerup of the destroyed block's drop table (type: 1 in
+    # chance) and spawns the ones that hit
+    def spawnPowerUps(self, block: GameObject, drops: dict[str, int]) -> None:
+        for type, chance in drops.items():
+            if shouldSpawn(chance):
+                color, duration, texture = POWERUP_TYPES[type]
+                self.powerups.append(PowerUp(type, color, duration,
+                                             block.position,
+                                             ResourceManager.getTexture(texture)))
+                self.stats.powerupSpawned(type)
+
+    # scores and counts bricks that were just destroyed and rolls their
+    # powerup drops
+    def bricksDestroyed(self, level: GameLevel, destroyed: np.ndarray) -> None:
+        if len(destroyed) == 0:
+            return
+        codes = level.brick_code[destroyed]
+        self.score += int(level.palette.score[codes].sum())
+        self.stats.countBricks(codes)
+        for i, code in zip(destroyed.tolist(), codes.tolist()):
+            self.spawnPowerUps(level.brick(i), level.palette.drops[code])
 
     def ActivatePowerUp(self, powerup: PowerUp) -> None:
         if powerup.type == "speed":
             self.ball.velocity *= 1.2
+            self.balls.velocity *= 1.2
         elif powerup.type == "sticky":
             self.ball.sticky = True
             self.player.color = glm.vec3(1.0, 0.5, 1.0)
         elif powerup.type == "pass-through":
             self.ball.pass_through = True
+            self.balls.pass_through = True
             self.player.color = glm.vec3(1.0, 0.5, 0.5)
         elif powerup.type == "pad-size-increase":
             self.player.size.x += 50
+        elif powerup.type == "multi-ball":
+            self.spawnBalls(self.multi_ball_count)
         elif powerup.type == "confuse":
             if not self.effects.chaos:
                 self.effects.confuse = True  # only activate if chaos wasn't already active
@@ -442,15 +718,41 @@ class Game:
             if not self.effects.confuse:
                 self.effects.chaos = True
 
+    # releases count extra balls from the main ball's position, fanned out
+    # around its current direction at the same speed
+    def spawnBalls(self, count: int) -> int:
+        speed = glm.length(self.ball.velocity)
+        heading = np.arctan2(self.ball.velocity.y, self.ball.velocity.x)
+        if self.ball.stuck or self.ball.velocity.y > 0.0:
+            heading = np.arctan2(*reversed(self.initial_ball_velocity))
+        spread = np.linspace(-0.6, 0.6, count) if count > 1 else np.zeros(1)
+        angles = heading + spread
+        velocities = np.stack(
+            (np.cos(angles), np.sin(angles)), axis=1) * speed
+        return self.balls.spawn(self.ball.position, velocities)
+
     def doCollisions(self):
-        for box in self.levels[self.level].bricks:
-            if not box.destroyed:
-                collision = ballCheckCollision(self.ball, box)
+        level = self.levels[self.level]
+        # only bricks around the ball can be hit; look a ball's width around
+        # it since resolving one collision can push it into the next tile
+        center = np.array([[self.ball.position.x + self.ball.radius,
+                            self.ball.position.y + self.ball.radius]])
+        nearby = np.sort(level.bricksNear(center, self.ball.radius * 2.0)[1])
+        # test straight against the brick arrays, nothing is allocated
+        # unless a brick is hit
+        positions = level.brick_position[nearby].tolist()
+        sizes = level.brick_size[nearby].tolist()
+        for n, i in enumerate(nearby.tolist()):
+            if not level.brick_destroyed[i]:
+                x, y = positions[n]
+                width, height = sizes[n]
+                collision = ballCheckCollisionBox(self.ball, x, y,
+                                                  width, height)
                 if collision.is_collision:  # if collision is true
-                    # destroy block if not solid
-                    if not box.is_solid:
-                        box.destroyed = True
-                        self.spawnPowerUps(box)
+                    solid = bool(level.brick_solid[i])
+                    # hit (and maybe destroy) block if not solid
+                    if not solid:
+                        self.bricksDestroyed(level, level.hitBricks(i))
                         self.box_sound.play()
                     else:
                         # if block is solid, enable shake effect
@@ -458,26 +760,12 @@ class Game:
                         self.effects.shake = True
                         self.solid_sound.play()
                     # collision resolution
-                    dir = collision.direction
-                    diff_vector = collision.position
-                    if not (self.ball.pass_through and not box.is_solid):
+                    if not (self.ball.pass_through and not solid):
                         # don't do collision resolution on non-solid bricks if pass-through is activated
-                        if dir == Direction.LEFT or dir == Direction.RIGHT:  # horizontal collision
-                            self.ball.velocity.x = -self.ball.velocity.x  # reverse horizontal velocity
-                            # relocate
-                            penetration = self.ball.radius - abs(diff_vector.x)
-                            if dir == Direction.LEFT:
-                                self.ball.position.x += penetration  # move ball to right
-                            else:
-                                self.ball.position.x -= penetration  # move ball to left
-                        else:  # vertical collision
-                            self.ball.velocity.y = -self.ball.velocity.y  # reverse vertical velocity
-                            # relocate
-                            penetration = self.ball.radius - abs(diff_vector.y)
-                            if dir == Direction.UP:
-                                self.ball.position.y -= penetration  # move ball back up
-                            else:
-                                self.ball.position.y += penetration  # move ball back down
+                        resolveCollision(self.ball, collision)
+
+        # then resolve all extra balls against the level at once
+        self.doBallGroupCollisions()
 
         # also check collisions on PowerUps and if so, activate them
         for powerup in self.powerups:
@@ -485,9 +773,11 @@ class Game:
                 # first check if powerup passed bottom edge, if so: keep as inactive and destroy
                 if powerup.position.y >= self.height:
                     powerup.destroyed = True
-                if checkCollision(self.player, powerup):
+                    self.stats.powerupMissed(powerup.type)
+                elif checkCollision(self.player, powerup):
                     # collided with player, now activate powerup
                     self.ActivatePowerUp(powerup)
+                    self.stats.powerupCollected(powerup.type)
                     powerup.destroyed = True
                     powerup.activated = True
                     self.powerup_sound.play()
@@ -501,15 +791,84 @@ class Game:
             distance = (self.ball.position.x + self.ball.radius) - center_board
             percentage = distance / (self.player.size.x / 2.0)
             # then mvoe accordingly
-            strength = 2.0
-            old_velocity = self.ball.velocity
-            temp_x, temp_y = self.initial_ball_velocity
-            self.ball.velocity.x = temp_x * percentage * strength
-            # keep speed consistent over both axes (multiply by length of old velocity, so total strength is not changed)
-            self.ball.velocity = glm.normalize(
-                self.ball.velocity) * glm.length(old_velocity)
-            # fix sticky paddle
-            self.ball.velocity.y = -1.0 * abs(self.ball.velocity.y)
+            self.ball.velocity = paddleBounceVelocity(
+                self.ball.velocity, percentage, self.initial_ball_velocity[0])
             # if Sticky powerup is activated, also stick ball to paddle once new velocity vectors were calculated
             self.ball.stuck = self.ball.sticky
+            self.stats.paddle_hits += 1
+            self.pad_sound.play()
+
+    # collision detection and resolution for all extra balls in a single
+    # vectorized pass against the level's brick arrays and the player pad
+    def doBallGroupCollisions(self) -> None:
+        active = self.balls.active()
+        if len(active) == 0:
+            return
+        level = self.levels[self.level]
+        radius = self.balls.radius
+        ball, brick, difference = ballsCheckCollision(
+            self.balls.centers(active), radius, level)
+        if len(ball) > 0:
+            solid = level.brick_solid[brick]
+            # hit every non-solid block that was hit (once, no matter by how
+            # many balls)
+            if not np.all(solid):
+                self.bricksDestroyed(level, level.hitBricks(brick[~solid]))
+                self.box_sound.play()
+            # if a solid block was hit, enable shake effect
+            if np.any(solid):
+                self.shake_time = 0.05
+                self.effects.shake = True
+                self.solid_sound.play()
+            # collision resolution: each ball is resolved against its deepest
+            # contact only (don't do collision resolution on non-solid bricks
+            # if pass-through is activated)
+            resolve = solid | (not self.balls.pass_through)
+            ball, difference = ball[resolve], difference[resolve]
+            distance = np.einsum("ij,ij->i", difference, difference)
+            order = np.lexsort((distance, ball))
+            first = np.unique(ball[order], return_index=True)[1]
+            hit = active[ball[order][first]]
+            diff = difference[order][first]
+            horizontal = np.abs(diff[:, 0]) > np.abs(diff[:, 1])
+            penetration = radius - np.abs(diff)
+            # horizontal collision: reverse horizontal velocity and relocate
+            # away from the side that was hit
+            h = hit[horizontal]
+            self.balls.velocity[h, 0] *= -1.0
+            self.balls.position[h, 0] -= np.copysign(
+                penetration[horizontal, 0], diff[horizontal, 0])
+            # vertical collision: reverse vertical velocity and relocate
+            v = hit[~horizontal]
+            self.balls.velocity[v, 1] *= -1.0
+            self.balls.position[v, 1] -= np.copysign(
+                penetration[~horizontal, 1], diff[~horizontal, 1])
+
+        # and finally check collisions against the player pad
+        half_extents = np.array((self.player.size.x / 2.0,
+                                 self.player.size.y / 2.0), dtype=np.float32)
+        aabb_center = np.array((self.player.position.x,
+                                self.player.position.y),
+                               dtype=np.float32) + half_extents
+        center = self.balls.centers(active)
+        difference = aabb_center + np.clip(
+            center - aabb_center, -half_extents, half_extents) - center
+        hit = active[np.einsum("ij,ij->i", difference, difference)
+                     < radius * radius]
+        if len(hit) > 0:
+            # change velocity based on where each ball hit the board
+            center_board = aabb_center[0]
+            percentage = (self.balls.position[hit, 0] + radius
+                          - center_board) / half_extents[0]
+            strength = 2.0
+            old_velocity = self.balls.velocity[hit]
+            speed = np.linalg.norm(old_velocity, axis=1)
+            temp_x, temp_y = self.initial_ball_velocity
+            velocity = old_velocity.copy()
+            velocity[:, 0] = temp_x * percentage * strength
+            # keep speed consistent over both axes
+            velocity *= (speed / np.linalg.norm(velocity, axis=1))[:, None]
+            velocity[:, 1] = -np.abs(velocity[:, 1])
+            self.balls.velocity[hit] = velocity
+            self.stats.paddle_hits += len(hit)
             self.pad_sound.play()
@@ -1,82 +1,192 @@
 import glm
+import numpy as np
 
+from asset_archive import openAsset
 from game_object import GameObject
 from resource_manager import ResourceManager
-from sprite_renderer import SpriteRenderer
+from tile_palette import TilePalette
 
 
 # GameLevel holds all Tiles as part of a Breakout level and
-# hosts functionality to Load/render levels from the harddisk.
+# hosts functionality to Load levels from the harddisk (BrickRenderer
+# draws them).
+# Bricks are stored as flat arrays (one row per brick) so levels of any
+# size load in a single vectorized pass and collisions can be tested for
+# many balls at once; brick() returns a GameObject for a single brick.
+# What each tile code means comes from the level's TilePalette.
 class GameLevel:
-    def __init__(self) -> None:
+    def __init__(self, palette: TilePalette = None) -> None:
+        self.palette = palette if palette is not None else TilePalette()
         # level state
-        self.bricks: list[GameObject] = []
+        self.tile_data = np.zeros((0, 0), dtype=np.int32)
+        self.brick_code = np.zeros(0, dtype=np.int32)
+        self.brick_position = np.zeros((0, 2), dtype=np.float32)
+        self.brick_size = np.zeros((0, 2), dtype=np.float32)
+        self.brick_color = np.zeros((0, 3), dtype=np.float32)
+        self.brick_texture = np.zeros(0, dtype=np.int32)
+        self.brick_solid = np.zeros(0, dtype=bool)
+        # hits left before a brick is destroyed
+        self.brick_hits = np.zeros(0, dtype=np.int32)
+        self.brick_destroyed = np.zeros(0, dtype=bool)
+        # maps every (row, column) tile of the level to its brick index,
+        # -1 for empty tiles
+        self.brick_grid = np.full((0, 0), -1, dtype=np.int32)
+        self.unit_width = 0.0
+        self.unit_height = 0.0
+        # bumped whenever the level is (re)initialized, and the bricks
+        # destroyed or damaged since, so cached renderings of the level know
+        # what to redraw
+        self.revision = 0
+        self.dirty_bricks: list[int] = []
+        # bumped whenever bricks get destroyed, and whenever bricks take
+        # hits (destroyed or not)
+        self.destroyed_version = 0
+        self.hits_version = 0
 
     # loads level from file
     def load(self, file: str, level_width: int, level_height: int) -> None:
-        # clear old data
-        self.bricks.clear()
         tile_data: list[list[int]] = []
         # load from file
-        with open(file) as file:
+        with openAsset(file, text=True) as file:
             # read each line from level file
             lines = file.readlines()
             for line in lines:
                 # read each word separated by spaces
                 data = line.split()
-                row: list[int] = []
-                for i in range(len(data)):
-                    row.append(int(data[i]))
-                tile_data.append(row)
+                if len(data) > 0:
+                    tile_data.append([int(word) for word in data])
             if len(tile_data) > 0:
                 self.init(tile_data, level_width, level_height)
 
-    # render level
-    def draw(self, renderer: SpriteRenderer) -> None:
-        for tile in self.bricks:
-            if not tile.destroyed:
-                tile.draw(renderer)
+    # number of bricks (solid or not, destroyed or not) in the level
+    def brickCount(self) -> int:
+        return len(self.brick_solid)
+
+    # returns a GameObject holding the state of a single brick
+    def brick(self, index: int) -> GameObject:
+        x, y = self.brick_position[index].tolist()
+        w, h = self.brick_size[index].tolist()
+        r, g, b = self.brick_color[index].tolist()
+        texture = self.palette.textures[self.brick_texture[index]]
+        obj = GameObject(glm.vec2(x, y), glm.vec2(w, h),
+                         ResourceManager.getTexture(texture),
+                         glm.vec3(r, g, b))
+        obj.is_solid = bool(self.brick_solid[index])
+        obj.destroyed = bool(self.brick_destroyed[index])
+        return obj
 
     # check if the level is completed (all non-solid tiles are destroyed)
     def isCompleted(self) -> bool:
-        for tile in self.bricks:
-            if (not tile.is_solid) and (not tile.destroyed):
-                return False
-        return True
+        return not np.any(~self.brick_solid & ~self.brick_destroyed)
+
+    # marks the given brick(s) as destroyed
+    def destroyBricks(self, indices) -> None:
+        self.brick_destroyed[indices] = True
+        self.destroyed_version += 1
+        self.dirty_bricks.extend(np.atleast_1d(indices).tolist())
+
+    # hits the given non-solid bricks once each: bricks out of hit points
+    # get destroyed, the others are darkened in place. Returns the indices
+    # of the destroyed bricks
+    def hitBricks(self, indices: np.ndarray) -> np.ndarray:
+        indices = np.unique(indices)
+        self.brick_hits[indices] -= 1
+        self.hits_version += 1
+        left = self.brick_hits[indices]
+        destroyed = indices[left <= 0]
+        damaged = indices[left > 0]
+        if len(damaged) > 0:
+            self.shadeBricks(damaged)
+            self.dirty_bricks.extend(damaged.tolist())
+        if len(destroyed) > 0:
+            self.destroyBricks(destroyed)
+        return destroyed
+
+    # darkens the given bricks by the share of hit points they have left
+    def shadeBricks(self, indices: np.ndarray) -> None:
+        code = self.brick_code[indices]
+        share = np.where(self.palette.hits[code] > 0,
+                         self.brick_hits[indices]
+                         / np.maximum(self.palette.hits[code], 1), 1.0)
+        self.brick_color[indices] = (self.palette.color[code]
+                                     * (0.4 + 0.6 * share)[:, None])
+
+    # sets the destroyed flags and hit points of the given bricks (e.g. as
+    # received from a server); cached renderings are patched as for hits
+    def setBricks(self, indices: np.ndarray, destroyed: np.ndarray,
+                  hits: np.ndarray) -> None:
+        self.brick_destroyed[indices] = destroyed
+        self.brick_hits[indices] = hits
+        self.shadeBricks(indices)
+        self.destroyed_version += 1
+        self.hits_version += 1
+        self.dirty_bricks.extend(np.atleast_1d(indices).tolist())
+
+    # restores the destroyed flags and hit points of all bricks (e.g. from
+    # a snapshot); cached renderings of the level are redrawn from scratch
+    def restoreBricks(self, destroyed: np.ndarray, hits: np.ndarray) -> None:
+        self.brick_destroyed[:] = destroyed
+        self.brick_hits[:] = hits
+        self.shadeBricks(np.arange(self.brickCount()))
+        self.destroyed_version += 1
+        self.hits_version += 1
+        self.revision += 1
+        self.dirty_bricks.clear()
+
+    # returns (ball, brick) index pairs of the bricks not yet destroyed
+    # within reach of circles of the given radius around each center; only
+    # the tiles around each center's grid cell are looked at, so the cost
+    # doesn't depend on the size of the level
+    def bricksNear(self, centers: np.ndarray,
+                   radius: float) -> tuple[np.ndarray, np.ndarray]:
+        rows, columns = self.brick_grid.shape
+        if len(centers) == 0 or rows == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        # candidate tiles: the window of cells the circle can overlap
+        reach_x = int(np.ceil(radius / self.unit_width))
+        reach_y = int(np.ceil(radius / self.unit_height))
+        cell_x = np.floor(centers[:, 0] / self.unit_width).astype(np.intp)
+        cell_y = np.floor(centers[:, 1] / self.unit_height).astype(np.intp)
+        dx, dy = np.meshgrid(np.arange(-reach_x, reach_x + 1),
+                             np.arange(-reach_y, reach_y + 1))
+        cx = (cell_x[:, None] + dx.ravel()[None, :]).ravel()
+        cy = (cell_y[:, None] + dy.ravel()[None, :]).ravel()
+        ball = np.repeat(np.arange(len(centers)), dx.size)
+        inside = (cx >= 0) & (cx < columns) & (cy >= 0) & (cy < rows)
+        ball, cx, cy = ball[inside], cx[inside], cy[inside]
+        brick = self.brick_grid[cy, cx].astype(np.intp)
+        valid = brick >= 0
+        ball, brick = ball[valid], brick[valid]
+        valid = ~self.brick_destroyed[brick]
+        return ball[valid], brick[valid]
 
-    # initialize level from tile data
-    def init(self, tile_data: list[list[int]], level_width: int,
-             level_height: int) -> None:
+    # initialize level from tile data (a list of rows or a 2D array of
+    # tile codes)
+    def init(self, tile_data, level_width: int, level_height: int) -> None:
+        tile_data = np.asarray(tile_data, dtype=np.int32)
+        self.tile_data = tile_data
         # calculate dimensions
-        h = len(tile_data)
-        w = len(tile_data[0])
+        h, w = tile_data.shape
         unit_width = level_width / float(w)
         unit_height = level_height / float(h)
-        # initialize level tiles based on tileData
-        for y in range(h):
-            for x in range(w):
-                # check block type from level data (2D level array)
-                if tile_data[y][x] == 1:  # solid
-                    pos = glm.vec2(unit_width * x, unit_height * y)
-                    size = glm.vec2(unit_width, unit_height)
-                    obj = GameObject(pos, size, ResourceManager.getTexture(
-                        "block_solid"), glm.vec3(0.8, 0.8, 0.7))
-                    obj.is_solid = True
-                    self.bricks.append(obj)
-                # non-solid, now determine its color based on level data
-                elif tile_data[y][x] > 1:
-                    color = glm.vec3(1.0)  # original: white
-                    if tile_data[y][x] == 2:
-                        color = glm.vec3(0.2, 0.6, 1.0)
-                    elif tile_data[y][x] == 3:
-                        color = glm.vec3(0.0, 0.7, 0.0)
-                    elif tile_data[y][x] == 4:
-                        color = glm.vec3(0.8, 0.8, 0.4)
-                    elif tile_data[y][x] == 5:
-                        color = glm.vec3(1.0, 0.5, 0.0)
-                    pos = glm.vec2(unit_width * x, unit_height * y)
-                    size = glm.vec2(unit_width, unit_height)
-                    obj = GameObject(pos, size,
-                                     ResourceManager.getTexture("block"),
-                                     color)
-                    self.bricks.append(obj)
+        self.unit_width = unit_width
+        self.unit_height = unit_height
+        # one brick per non-empty tile, in row-major order
+        ys, xs = np.nonzero(tile_data > 0)
+        codes = self.palette.resolve(tile_data[ys, xs])
+        count = len(codes)
+        self.brick_grid = np.full((h, w), -1, dtype=np.int32)
+        self.brick_grid[ys, xs] = np.arange(count, dtype=np.int32)
+        self.brick_position = np.stack(
+            (xs * unit_width, ys * unit_height), axis=1).astype(np.float32)
+        self.brick_size = np.empty((count, 2), dtype=np.float32)
+        self.brick_size[:] = (unit_width, unit_height)
+        # look up each brick's type in the palette
+        self.brick_code = codes
+        self.brick_color = self.palette.color[codes]
+        self.brick_texture = self.palette.texture[codes]
+        self.brick_solid = self.palette.solid[codes]
+        self.brick_hits = self.palette.hits[codes].copy()
+        self.brick_destroyed = np.zeros(count, dtype=bool)
+        self.revision += 1
+        self.dirty_bricks.clear()
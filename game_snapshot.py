@@ -0,0 +1,175 @@
+import struct
+
+import glm
+import numpy as np
+
+from resource_manager import ResourceManager
+from game import Game, GameState, PowerUp, POWERUP_TYPES
+
+
+# Snapshots serialize the complete simulation state of a Game (level
+# progress, player, balls, powerups, effects, lives and score) into a
+# compact binary blob and restore it again, e.g. to suspend and resume a
+# kiosk, to roll back replays or to branch searches from the same state.
+# The level's layout itself isn't stored, only which bricks are destroyed
+# (one bit per brick) and their hit points; a snapshot is restored onto
+# the same level it was taken from. Particles are purely visual and not
+# part of the snapshot.
+#
+# Layout (little-endian): header, player, ball, destroyed bitmask, hit
+# points (one byte per brick), extra balls and powerups.
+
+SNAPSHOT_MAGIC = b"BRKS"
+SNAPSHOT_VERSION = 1
+
+# magic, version, state, flags, level, lives, score, brick count, shake time
+HEADER = struct.Struct("<4sHBBiiiIf")
+# position, size, color
+PLAYER = struct.Struct("<7f")
+# position, velocity, color
+BALL = struct.Struct("<7f")
+# number of extra balls, number of powerups
+COUNTS = struct.Struct("<HH")
+# type, flags, duration, position, velocity
+POWERUP = struct.Struct("<BBf4f")
+
+POWERUP_NAMES = list(POWERUP_TYPES)
+
+# bits of the header's flags byte
+FLAG_CONFUSE = 1
+FLAG_CHAOS = 2
+FLAG_SHAKE = 4
+FLAG_STUCK = 8
+FLAG_STICKY = 16
+FLAG_PASS_THROUGH = 32
+FLAG_BALLS_PASS_THROUGH = 64
+# bits of a powerup's flags byte
+FLAG_ACTIVATED = 1
+FLAG_DESTROYED = 2
+
+
+# returns the snapshot of the game's current state
+def saveSnapshot(game: Game) -> bytes:
+    level = game.levels[game.level]
+    count = level.brickCount()
+    flags = ((FLAG_CONFUSE if game.effects.confuse else 0)
+             | (FLAG_CHAOS if game.effects.chaos else 0)
+             | (FLAG_SHAKE if game.effects.shake else 0)
+             | (FLAG_STUCK if game.ball.stuck else 0)
+             | (FLAG_STICKY if game.ball.sticky else 0)
+             | (FLAG_PASS_THROUGH if game.ball.pass_through else 0)
+             | (FLAG_BALLS_PASS_THROUGH if game.balls.pass_through else 0))
+    player, ball = game.player, game.ball
+    balls = game.balls.active()
+    parts = [
+        HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, game.state.value,
+                    flags, game.level, game.lives, game.score, count,
+                    game.shake_time),
+        PLAYER.pack(*player.position, *player.size, *player.color),
+        BALL.pack(*ball.position, *ball.velocity, *ball.color),
+        np.packbits(level.brick_destroyed, bitorder="little").tobytes(),
+        np.clip(level.brick_hits, 0, 255).astype(np.uint8).tobytes(),
+        COUNTS.pack(len(balls), len(game.powerups)),
+        game.balls.position[balls].astype("<f4").tobytes(),
+        game.balls.velocity[balls].astype("<f4").tobytes()
+    ]
+    for powerup in game.powerups:
+        parts.append(POWERUP.pack(
+            POWERUP_NAMES.index(powerup.type),
+            (FLAG_ACTIVATED if powerup.activated else 0)
+            | (FLAG_DESTROYED if powerup.destroyed else 0),
+            powerup.duration, *powerup.position, *powerup.velocity))
+    return b"".join(parts)
+
+
+# restores the game's state from a snapshot; raises ValueError if the
+# snapshot isn't valid or doesn't fit the game's levels
+def loadSnapshot(game: Game, data: bytes) -> None:
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError("truncated snapshot")
+    (magic, version, state, flags, level_index, lives, score, count,
+     shake_time) = HEADER.unpack_from(view, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("not a version {} snapshot".format(SNAPSHOT_VERSION))
+    if not 0 <= level_index < len(game.levels):
+        raise ValueError("snapshot of unknown level {}".format(level_index))
+    level = game.levels[level_index]
+    if count != level.brickCount():
+        raise ValueError("snapshot doesn't match level {}".format(level_index))
+    mask_size = (count + 7) // 8
+    if len(view) < (HEADER.size + PLAYER.size + BALL.size + mask_size
+                    + count + COUNTS.size):
+        raise ValueError("truncated snapshot")
+    offset = HEADER.size
+    player = PLAYER.unpack_from(view, offset)
+    offset += PLAYER.size
+    ball = BALL.unpack_from(view, offset)
+    offset += BALL.size
+    destroyed = np.unpackbits(np.frombuffer(view, np.uint8, mask_size, offset),
+                              count=count, bitorder="little").astype(bool)
+    offset += mask_size
+    hits = np.frombuffer(view, np.uint8, count, offset)
+    offset += count
+    ball_count, powerup_count = COUNTS.unpack_from(view, offset)
+    offset += COUNTS.size
+    # (position and velocity of each ball, two float pairs)
+    if len(view) < offset + ball_count * 16 + powerup_count * POWERUP.size:
+        raise ValueError("truncated snapshot")
+    if ball_count > game.balls.capacity:
+        raise ValueError("snapshot has too many balls")
+    balls = np.frombuffer(view, "<f4", ball_count * 4,
+                          offset).reshape(2, ball_count, 2)
+    offset += balls.nbytes
+    if state not in {member.value for member in GameState}:
+        raise ValueError("snapshot has unknown game state {}".format(state))
+    powerups = []
+    for i in range(powerup_count):
+        (type, powerup_flags, duration, x, y, vx,
+         vy) = POWERUP.unpack_from(view, offset + i * POWERUP.size)
+        if type >= len(POWERUP_NAMES):
+            raise ValueError("snapshot has unknown powerup {}".format(type))
+        name = POWERUP_NAMES[type]
+        color, _, texture = POWERUP_TYPES[name]
+        powerup = PowerUp(name, color, duration, glm.vec2(x, y),
+                          ResourceManager.getTexture(texture))
+        powerup.velocity = glm.vec2(vx, vy)
+        powerup.activated = bool(powerup_flags & FLAG_ACTIVATED)
+        powerup.destroyed = bool(powerup_flags & FLAG_DESTROYED)
+        powerups.append(powerup)
+
+    # everything parsed and valid, now apply it
+    game.level = level_index
+    game.state = GameState(state)
+    game.lives = lives
+    game.score = score
+    game.shake_time = shake_time
+    level.restoreBricks(destroyed, hits)
+    game.player.position = glm.vec2(player[0:2])
+    game.player.size = glm.vec2(player[2:4])
+    game.player.color = glm.vec3(player[4:7])
+    game.ball.position = glm.vec2(ball[0:2])
+    game.ball.velocity = glm.vec2(ball[2:4])
+    game.ball.color = glm.vec3(ball[4:7])
+    game.ball.stuck = bool(flags & FLAG_STUCK)
+    game.ball.sticky = bool(flags & FLAG_STICKY)
+    game.ball.pass_through = bool(flags & FLAG_PASS_THROUGH)
+    game.balls.clear()
+    game.balls.alive[:ball_count] = True
+    game.balls.position[:ball_count] = balls[0]
+    game.balls.velocity[:ball_count] = balls[1]
+    game.balls.pass_through = bool(flags & FLAG_BALLS_PASS_THROUGH)
+    game.effects.confuse = bool(flags & FLAG_CONFUSE)
+    game.effects.chaos = bool(flags & FLAG_CHAOS)
+    game.effects.shake = bool(flags & FLAG_SHAKE)
+    game.powerups = powerups
+
+
+def saveSnapshotFile(game: Game, file: str) -> None:
+    with open(file, "wb") as f:
+        f.write(saveSnapshot(game))
+
+
+def loadSnapshotFile(game: Game, file: str) -> None:
+    with open(file, "rb") as f:
+        loadSnapshot(game, f.read())
@@ -0,0 +1,206 @@
+import bisect
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+
+# GameStats counts what happens during a session: bricks destroyed per
+# tile code, paddle hits, powerups spawned/collected/expired/missed,
+# lives lost, time to clear each level and histograms of ball speed and
+# frame time. All counters are preallocated, so recording an event is a
+# single increment. Every interval seconds a snapshot of the counters is
+# handed to a StatsWriter, which writes it out on a background thread;
+# the game loop itself never does any I/O.
+class GameStats:
+    # upper edges of the frame time histogram bins in seconds (the last bin
+    # takes everything slower)
+    FRAME_TIME_EDGES = [0.004, 0.008, 0.012, 0.017, 0.021, 0.025, 0.034,
+                        0.050, 0.100, 0.250]
+    # width of the ball speed histogram bins in units per second
+    BALL_SPEED_BIN = 50.0
+    BALL_SPEED_BINS = 32
+
+    def __init__(self, brick_types: int, powerup_types: list[str],
+                 interval: float = 10.0) -> None:
+        self.interval = interval
+        self.next_flush = interval
+        self.writer: StatsWriter = None
+        self.session = "{}-{}".format(time.strftime("%Y%m%d-%H%M%S"),
+                                      os.getpid())
+        self.powerup_types = list(powerup_types)
+        self.powerup_index = {type: i for i, type in
+                              enumerate(self.powerup_types)}
+        # counters
+        self.bricks_destroyed = np.zeros(brick_types, dtype=np.int64)
+        self.powerups_spawned = np.zeros(len(powerup_types), dtype=np.int64)
+        self.powerups_collected = np.zeros(len(powerup_types), dtype=np.int64)
+        self.powerups_expired = np.zeros(len(powerup_types), dtype=np.int64)
+        self.powerups_missed = np.zeros(len(powerup_types), dtype=np.int64)
+        self.paddle_hits = 0
+        self.lives_lost = 0
+        self.frames = 0
+        # histograms
+        self.frame_time = np.zeros(len(self.FRAME_TIME_EDGES) + 1,
+                                   dtype=np.int64)
+        self.ball_speed = np.zeros(self.BALL_SPEED_BINS, dtype=np.int64)
+        # time spent on the current level and (level, seconds) per clear
+        self.level_time = 0.0
+        self.clear_times: list[tuple[int, float]] = []
+        # other reports included in every snapshot, by name
+        self.reports: dict[str, Callable[[], dict]] = {}
+
+    # writes snapshots to file (.jsonl, or SQLite for .db/.sqlite files)
+    def open(self, file: str) -> None:
+        self.writer = StatsWriter(file)
+
+    # records a frame; ball_speed is only given while the game is played
+    def frame(self, dt: float, ball_speed: float = None) -> None:
+        self.frames += 1
+        self.frame_time[bisect.bisect_left(self.FRAME_TIME_EDGES, dt)] += 1
+        if ball_speed is not None:
+            self.level_time += dt
+            bin = min(int(ball_speed / self.BALL_SPEED_BIN),
+                      self.BALL_SPEED_BINS - 1)
+            self.ball_speed[bin] += 1
+
+    # includes the dict returned by report in every snapshot under name
+    def addReport(self, name: str, report: Callable[[], dict]) -> None:
+        self.reports[name] = report
+
+    # counts destroyed bricks by their tile codes
+    def countBricks(self, codes: np.ndarray) -> None:
+        np.add.at(self.bricks_destroyed, codes, 1)
+
+    def powerupSpawned(self, type: str) -> None:
+        self.powerups_spawned[self.powerup_index[type]] += 1
+
+    def powerupCollected(self, type: str) -> None:
+        self.powerups_collected[self.powerup_index[type]] += 1
+
+    def powerupExpired(self, type: str) -> None:
+        self.powerups_expired[self.powerup_index[type]] += 1
+
+    def powerupMissed(self, type: str) -> None:
+        self.powerups_missed[self.powerup_index[type]] += 1
+
+    # starts timing a (re)started level
+    def startLevel(self) -> None:
+        self.level_time = 0.0
+
+    def levelCleared(self, level: int) -> None:
+        self.clear_times.append((level, self.level_time))
+        self.level_time = 0.0
+
+    # returns all counters as a JSON serializable dict
+    def snapshot(self, **extra) -> dict:
+        def perType(counts: np.ndarray) -> dict[str, int]:
+            return dict(zip(self.powerup_types, counts.tolist()))
+        snapshot = {
+            "session": self.session,
+            "time": time.time(),
+            "frames": self.frames,
+            "bricks_destroyed": self.bricks_destroyed.tolist(),
+            "paddle_hits": self.paddle_hits,
+            "lives_lost": self.lives_lost,
+            "powerups_spawned": perType(self.powerups_spawned),
+            "powerups_collected": perType(self.powerups_collected),
+            "powerups_expired": perType(self.powerups_expired),
+            "powerups_missed": perType(self.powerups_missed),
+            "clear_times": list(self.clear_times),
+            "frame_time_edges": self.FRAME_TIME_EDGES,
+            "frame_time": self.frame_time.tolist(),
+            "ball_speed_bin": self.BALL_SPEED_BIN,
+            "ball_speed": self.ball_speed.tolist()
+        }
+        for name, report in self.reports.items():
+            snapshot[name] = report()
+        snapshot.update(extra)
+        return snapshot
+
+    # hands a snapshot to the writer once per interval (time in seconds
+    # since start, e.g. glfw.get_time())
+    def poll(self, time: float, **extra) -> None:
+        if self.writer is None or time < self.next_flush:
+            return
+        self.next_flush = time + self.interval
+        self.writer.write(self.snapshot(**extra))
+
+    # writes a final snapshot and waits for the writer to finish
+    def close(self, **extra) -> None:
+        if self.writer is None:
+            return
+        self.writer.write(self.snapshot(**extra))
+        self.writer.close()
+        self.writer = None
+
+
+# StatsWriter appends snapshots to a JSON lines file or an SQLite
+# database from a background thread, so writing never blocks the game. If
+# writing fails the error is printed once and later snapshots are dropped.
+class StatsWriter:
+    def __init__(self, file: str) -> None:
+        self.file = file
+        self.sqlite = os.path.splitext(file)[1].lower() in (".db", ".sqlite")
+        self.queue: queue.Queue = queue.Queue()
+        # set once writing failed, and once close() was received
+        self.failed = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="stats",
+                                       daemon=True)
+        self.thread.start()
+
+    # queues a snapshot for writing
+    def write(self, snapshot: dict) -> None:
+        if not self.failed:
+            self.queue.put(snapshot)
+
+    # writes all queued snapshots and stops the thread
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self) -> None:
+        try:
+            self.writeAll()
+        except (OSError, sqlite3.Error, TypeError, ValueError) as e:
+            print("ERROR::STATS: Failed to write statistics to", self.file, e)
+            self.failed = True
+            # drop whatever is still queued until close()
+            while not self.stopped:
+                self.stopped = self.queue.get() is None
+
+    def writeAll(self) -> None:
+        directory = os.path.dirname(self.file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.sqlite:
+            # connections can only be used on the thread that created them
+            output = sqlite3.connect(self.file)
+        else:
+            output = open(self.file, "a")
+        try:
+            if self.sqlite:
+                output.execute("CREATE TABLE IF NOT EXISTS stats "
+                               "(session TEXT, time REAL, data TEXT)")
+            while True:
+                snapshot = self.queue.get()
+                if snapshot is None:
+                    self.stopped = True
+                    return
+                line = json.dumps(snapshot)
+                if self.sqlite:
+                    output.execute("INSERT INTO stats VALUES (?, ?, ?)",
+                                   (snapshot["session"], snapshot["time"],
+                                    line))
+                    output.commit()
+                else:
+                    output.write(line + "\n")
+                    output.flush()
+        finally:
+            output.close()
@@ -0,0 +1,135 @@
+import numpy as np
+from OpenGL.GL import *
+
+from texture2d import Texture2D
+
+
+# Holds all state information relevant to a character as rasterized using
+# FreeType: its rectangle in the atlas (x, y, width, height in texels; no
+# rectangle for glyphs without pixels such as spaces), offset from the
+# baseline to its left/top and horizontal advance (in 1/64 pixels)
+class Character:
+    def __init__(self, rect: tuple[int, int, int, int],
+                 bearing: tuple[int, int], advance: int) -> None:
+        self.rect = rect
+        self.size = rect[2:4]
+        self.bearing = bearing
+        self.advance = advance
+        # shelf of the atlas the glyph is stored on (None: no pixels)
+        self.shelf: Shelf = None
+
+
+# a row of the atlas glyphs are packed into left to right
+class Shelf:
+    def __init__(self, y: int, height: int) -> None:
+        self.y = y
+        self.height = height
+        self.x = 0
+        # keys of the glyphs on the shelf and when it was last used
+        self.keys: list = []
+        self.used = 0
+
+
+# GlyphAtlas caches rasterized glyphs of any number of fonts and sizes in
+# a single R8 texture, so all glyphs of a string are drawn with one
+# texture bound. Glyphs are packed onto shelves (rows). When the atlas is
+# full, the least recently used shelf that isn't needed by the string
+# currently being drawn is emptied and reused (glyphs are evicted a shelf
+# at a time, they get rasterized again when needed).
+class GlyphAtlas:
+    def __init__(self, width: int = 1024, height: int = 1024,
+                 padding: int = 1) -> None:
+        self.width = width
+        self.height = height
+        # empty texels between glyphs so linear filtering doesn't bleed
+        self.padding = padding
+        self.texture = Texture2D()
+        self.texture.internal_format = GL_R8
+        self.texture.image_format = GL_RED
+        self.texture.wrap_s = GL_CLAMP_TO_EDGE
+        self.texture.wrap_t = GL_CLAMP_TO_EDGE
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        self.texture.generate(width, height, None)
+        glClearTexImage(self.texture.tex_id, 0, GL_RED, GL_UNSIGNED_BYTE, None)
+        self.glyphs: dict = {}
+        self.shelves: list[Shelf] = []
+        # increased by the user for every batch of glyphs (e.g. a string)
+        # whose glyphs must stay in the atlas together
+        self.stamp = 1
+        self.evictions = 0
+
+    # returns the cached glyph with the given key (None if not cached) and
+    # marks it as used
+    def get(self, key) -> Character:
+        character = self.glyphs.get(key)
+        if character is not None and character.shelf is not None:
+            character.shelf.used = self.stamp
+        return character
+
+    # stores a glyph's bitmap (rows x columns uint8 array) in the atlas;
+    # returns None if it doesn't fit even after evicting
+    def add(self, key, bitmap: np.ndarray, bearing: tuple[int, int],
+            advance: int) -> Character:
+        height, width = bitmap.shape
+        if width == 0 or height == 0:
+            character = Character((0, 0, 0, 0), bearing, advance)
+            self.glyphs[key] = character
+            return character
+        shelf = self.allocate(width, height)
+        if shelf is None:
+            return None
+        x = shelf.x
+        shelf.x += width + self.padding
+        shelf.keys.append(key)
+        shelf.used = self.stamp
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTextureSubImage2D(self.texture.tex_id, 0, x, shelf.y, width, height,
+                            GL_RED, GL_UNSIGNED_BYTE,
+                            np.ascontiguousarray(bitmap))
+        character = Character((x, shelf.y, width, height), bearing, advance)
+        character.shelf = shelf
+        self.glyphs[key] = character
+        return character
+
+    # finds a shelf with room for a width x height glyph: an open shelf of
+    # fitting height, a new shelf, or the least recently used one
+    def allocate(self, width: int, height: int) -> Shelf:
+        padded_width = width + self.padding
+        if padded_width > self.width:
+            return None
+        best = None
+        for shelf in self.shelves:
+            if (height <= shelf.height < height * 2
+                    and shelf.x + padded_width <= self.width
+                    and (best is None or shelf.height < best.height)):
+                best = shelf
+        if best is not None:
+            return best
+        # open a new shelf, rounded up so similar glyphs can share it
+        top = 0
+        if len(self.shelves) > 0:
+            last = self.shelves[-1]
+            top = last.y + last.height + self.padding
+        if top + height <= self.height:
+            shelf = Shelf(top, min((height + 7) // 8 * 8, self.height - top))
+            self.shelves.append(shelf)
+            return shelf
+        # full: empty the least recently used shelf that's tall enough
+        candidates = [shelf for shelf in self.shelves
+                      if shelf.height >= height and shelf.used < self.stamp]
+        if len(candidates) == 0:
+            return None
+        shelf = min(candidates, key=lambda shelf: shelf.used)
+        for key in shelf.keys:
+            del self.glyphs[key]
+        shelf.keys.clear()
+        shelf.x = 0
+        # clear the old glyphs' texels, padding included
+        glClearTexSubImage(self.texture.tex_id, 0, 0, shelf.y, 0,
+                           self.width, shelf.height, 1,
+                           GL_RED, GL_UNSIGNED_BYTE, None)
+        self.evictions += 1
+        return shelf
+
+    def bind(self, index: int) -> None:
+        self.texture.bind(index)
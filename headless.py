@@ -0,0 +1,292 @@
+import argparse
+import os
+import random
+import sys
+
+# no audio device is needed (or available on CI machines) when rendering
+# offscreen
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import glfw
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as glReadPixelsToBuffer
+
+from resource_manager import ResourceManager
+from game import Game, GameState
+from startup import lazyImport
+
+# imported when images are first read or written
+Image = lazyImport("PIL.Image")
+
+
+# Renders frames without a visible window, e.g. level thumbnails for the
+# launcher or frames to compare against golden images on CI (Mesa
+# llvmpipe). Run with --help for the options.
+
+
+# FrameCapture reads back frames asynchronously: glReadPixels writes into
+# one of a ring of pixel buffer objects and a fence marks when the copy is
+# done, so reading a frame never stalls rendering. Finished frames are
+# returned by poll() a frame or two later.
+class FrameCapture:
+    def __init__(self, width: int, height: int, buffers: int = 3) -> None:
+        self.width = width
+        self.height = height
+        self.size = width * height * 4
+        self.buffers: list[GLuint] = []
+        for i in range(buffers):
+            pbo = GLuint()
+            glCreateBuffers(1, pbo)
+            glNamedBufferStorage(pbo, self.size, None, GL_MAP_READ_BIT)
+            self.buffers.append(pbo)
+        # (buffer index, fence) of reads still in flight, oldest first
+        self.pending: list[tuple[int, int]] = []
+        self.next = 0
+
+    # starts reading the given framebuffer's (x, y) rectangle of the
+    # capture size
+    def capture(self, framebuffer: int, x: int = 0, y: int = 0) -> list[np.ndarray]:
+        frames = []
+        # all buffers in use: the oldest read has to be finished first
+        if len(self.pending) == len(self.buffers):
+            frames.append(self.finish(*self.pending.pop(0)))
+        pbo = self.buffers[self.next]
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, framebuffer)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixelsToBuffer(x, y, self.width, self.height, GL_RGBA,
+                             GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, 0)
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.pending.append((self.next, fence))
+        self.next = (self.next + 1) % len(self.buffers)
+        return frames + self.poll()
+
+    # returns the frames whose read back completed (oldest first), as
+    # (height, width, 4) RGBA arrays with the first row at the top
+    def poll(self, wait: bool = False) -> list[np.ndarray]:
+        frames = []
+        while len(self.pending) > 0:
+            index, fence = self.pending[0]
+            if not wait and glClientWaitSync(fence, 0, 0) not in (
+                    GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                break
+            self.pending.pop(0)
+            frames.append(self.finish(index, fence))
+        return frames
+
+    # maps a finished buffer and copies its pixels out
+    def finish(self, index: int, fence: int) -> np.ndarray:
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT,
+                               1000000) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+        pbo = self.buffers[index]
+        pointer = glMapNamedBufferRange(pbo, 0, self.size, GL_MAP_READ_BIT)
+        address = ctypes.cast(pointer, ctypes.c_void_p).value
+        pixels = np.ctypeslib.as_array(
+            (ctypes.c_ubyte * self.size).from_address(address))
+        # OpenGL's first row is the bottom one
+        frame = np.flipud(pixels.reshape(self.height, self.width, 4)).copy()
+        glUnmapNamedBuffer(pbo)
+        return frame
+
+    def delete(self) -> None:
+        self.poll(wait=True)
+        for pbo in self.buffers:
+            glDeleteBuffers(1, pbo)
+
+
+# writes frames as a numbered PNG sequence
+class PngSequenceWriter:
+    def __init__(self, directory: str, prefix: str = "frame") -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.count = 0
+
+    def write(self, frame: np.ndarray) -> None:
+        file = os.path.join(self.directory, "{}_{:05d}.png".format(
+            self.prefix, self.count))
+        Image.fromarray(frame, "RGBA").save(file, compress_level=1)
+        self.count += 1
+
+    def close(self) -> None:
+        pass
+
+
+# writes frames back to back as raw RGBA video, e.g. for
+# ffmpeg -f rawvideo -pixel_format rgba -video_size WxH -i frames.rgba
+class RawVideoWriter:
+    def __init__(self, file: str) -> None:
+        directory = os.path.dirname(file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(file, "wb")
+
+    def write(self, frame: np.ndarray) -> None:
+        self.file.write(frame.tobytes())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+# returns the mean absolute difference (0-255) between a frame and a
+# golden image
+def compareWithGolden(frame: np.ndarray, golden_file: str) -> float:
+    if not os.path.exists(golden_file):
+        return 255.0
+    golden = np.asarray(Image.open(golden_file).convert("RGBA"))
+    if golden.shape != frame.shape:
+        return 255.0
+    return float(np.mean(np.abs(frame.astype(np.int16) - golden)))
+
+
+# passes frames on to a writer while comparing each one with the golden
+# image of the same name and number
+class GoldenComparer:
+    def __init__(self, writer, directory: str, prefix: str,
+                 tolerance: float) -> None:
+        self.writer = writer
+        self.directory = directory
+        self.prefix = prefix
+        self.tolerance = tolerance
+        self.count = 0
+        self.failures = 0
+
+    def write(self, frame: np.ndarray) -> None:
+        self.writer.write(frame)
+        golden = os.path.join(self.directory, "{}_{:05d}.png".format(
+            self.prefix, self.count))
+        self.count += 1
+        difference = compareWithGolden(frame, golden)
+        if difference > self.tolerance:
+            print("MISMATCH:", golden, difference)
+            self.failures += 1
+
+
+# creates an invisible window with an OpenGL 4.6 context; context_api
+# selects the native, EGL or OSMesa (software, no display needed) backend
+def createHiddenWindow(width: int, height: int,
+                       context_api: str = "native") -> glfw._GLFWwindow:
+    if not glfw.init():
+        raise RuntimeError("Failed to initialize GLFW")
+    glfw.window_hint(glfw.VISIBLE, False)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 6)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    if context_api == "egl":
+        glfw.window_hint(glfw.CONTEXT_CREATION_API, glfw.EGL_CONTEXT_API)
+    elif context_api == "osmesa":
+        glfw.window_hint(glfw.CONTEXT_CREATION_API, glfw.OSMESA_CONTEXT_API)
+    window = glfw.create_window(width, height, "Breakout (headless)",
+                                None, None)
+    if window is None:
+        glfw.terminate()
+        raise RuntimeError("Failed to create hidden GLFW window")
+    glfw.make_context_current(window)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    return window
+
+
+# renders frames of the given level with a fixed time step, passing every
+# captured frame to write; composite captures the final image (effects and
+# HUD text) instead of just the scene from the post-processing framebuffer
+def renderLevel(game: Game, level: int, frames: int, dt: float,
+                write, composite: bool = False) -> None:
+    game.level = level
+    game.resetLevel()
+    game.resetPlayer()
+    game.state = GameState.GAME_ACTIVE
+    game.ball.stuck = False
+    if composite:
+        x, y, width, height = game.viewport
+    else:
+        x, y = 0, 0
+        width, height = game.effects.scene_width, game.effects.scene_height
+    capture = FrameCapture(width, height)
+    for frame in range(frames):
+        # keep time driven effects deterministic
+        glfw.set_time(frame * dt)
+        game.update(dt)
+        game.recordFrame(dt)
+        glClearColor(0.0, 0.0, 0.0, 1.0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        game.render()
+        if composite:
+            captured = capture.capture(0, x, y)
+        else:
+            captured = capture.capture(game.effects.fbo)
+        for image in captured:
+            write(image)
+    for image in capture.poll(wait=True):
+        write(image)
+    capture.delete()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Render Breakout frames "
+                                     "offscreen")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--context", choices=("native", "egl", "osmesa"),
+                        default="native")
+    parser.add_argument("--levels", type=int, nargs="*",
+                        help="levels to render (default: all)")
+    parser.add_argument("--frames", type=int, default=1)
+    parser.add_argument("--dt", type=float, default=1.0 / 60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="frames")
+    parser.add_argument("--format", choices=("png", "raw"), default="png")
+    parser.add_argument("--composite", action="store_true",
+                        help="capture effects and HUD as well")
+    parser.add_argument("--thumbnail", type=int, nargs=2,
+                        metavar=("WIDTH", "HEIGHT"),
+                        help="write one downscaled PNG per level instead")
+    parser.add_argument("--golden",
+                        help="directory of golden images to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    window = createHiddenWindow(args.width, args.height, args.context)
+    game = Game(args.width, args.height)
+    game.init()
+    game.finishLoading()
+    game.resize(*glfw.get_framebuffer_size(window))
+    levels = args.levels if args.levels else range(len(game.levels))
+    failures = 0
+    for level in levels:
+        name = "level{}".format(level)
+        if args.thumbnail:
+            images = []
+            renderLevel(game, level, 1, args.dt, images.append)
+            os.makedirs(args.out, exist_ok=True)
+            image = Image.fromarray(images[-1], "RGBA").convert("RGB")
+            image.resize(tuple(args.thumbnail), Image.LANCZOS).save(
+                os.path.join(args.out, name + ".png"))
+            continue
+        if args.format == "png":
+            writer = PngSequenceWriter(args.out, name)
+        else:
+            writer = RawVideoWriter(os.path.join(args.out, name + ".rgba"))
+        sink = writer
+        if args.golden:
+            sink = GoldenComparer(writer, args.golden, name, args.tolerance)
+        renderLevel(game, level, args.frames, args.dt, sink.write,
+                    args.composite)
+        writer.close()
+        if args.golden:
+            failures += sink.failures
+    ResourceManager.clear()
+    glfw.destroy_window(window)
+    glfw.terminate()
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,61 @@
+import os
+
+from resource_manager import ResourceManager
+
+
+# HotReloader watches the game's shader and level files during development
+# and reloads whatever changed: only the affected shader is recompiled in
+# place (keeping the old program if the new source doesn't compile) and
+# only the affected level is reloaded. Polling compares file modification
+# times and is throttled to once per interval seconds.
+class HotReloader:
+    def __init__(self, game, interval: float = 0.5) -> None:
+        self.game = game
+        self.interval = interval
+        self.next_poll = 0.0
+        # last seen modification time per watched file
+        self.mtimes: dict[str, float] = {}
+
+    # returns whether file changed since the last poll (the first time a
+    # file is seen only records its modification time)
+    def changed(self, file: str) -> bool:
+        try:
+            mtime = os.stat(file).st_mtime
+        except OSError:
+            return False  # e.g. in the middle of being saved
+        previous = self.mtimes.get(file)
+        self.mtimes[file] = mtime
+        return previous is not None and previous != mtime
+
+    # checks all watched files and reloads the ones that changed
+    def poll(self, time: float) -> None:
+        if time < self.next_poll:
+            return
+        self.next_poll = time + self.interval
+        files = set()
+        for shader_files in ResourceManager.shader_files.values():
+            files.update(f for f in shader_files[:3] if f is not None)
+        files.update(f for f in self.game.level_files if f is not None)
+        changed = {file for file in files if self.changed(file)}
+        if len(changed) == 0:
+            return
+        for name, shader_files in ResourceManager.shader_files.items():
+            if changed.intersection(shader_files[:3]):
+                try:
+                    reloaded = ResourceManager.reloadShader(name)
+                except Exception as e:
+                    print("ERROR::HOTRELOAD: Failed to reload shader", name, e)
+                    continue
+                if reloaded:
+                    print("HOTRELOAD: Reloaded shader", name)
+                else:
+                    print("HOTRELOAD: Keeping previous shader", name)
+        for i, file in enumerate(self.game.level_files):
+            if file in changed:
+                try:
+                    self.game.levels[i].load(file, self.game.width,
+                                             self.game.height / 2)
+                except (OSError, ValueError) as e:
+                    print("ERROR::HOTRELOAD: Failed to reload level", file, e)
+                    continue
+                print("HOTRELOAD: Reloaded level", file)
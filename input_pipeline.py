@@ -0,0 +1,183 @@
+from collections import deque
+from typing import NamedTuple
+
+import glfw
+
+from game import Game
+
+
+# a key going down or up at a time (glfw.get_time() seconds)
+class InputEvent(NamedTuple):
+    time: float
+    key: int
+    down: bool
+
+
+# gamepad buttons (standard mapping) and the keys they act as
+GAMEPAD_KEYS: dict[int, int] = {
+    glfw.GAMEPAD_BUTTON_A: glfw.KEY_SPACE,
+    glfw.GAMEPAD_BUTTON_START: glfw.KEY_ENTER,
+    glfw.GAMEPAD_BUTTON_DPAD_UP: glfw.KEY_W,
+    glfw.GAMEPAD_BUTTON_DPAD_DOWN: glfw.KEY_S,
+    glfw.GAMEPAD_BUTTON_DPAD_LEFT: glfw.KEY_A,
+    glfw.GAMEPAD_BUTTON_DPAD_RIGHT: glfw.KEY_D,
+}
+
+
+# InputPipeline decouples input from the frame rate: key events are queued
+# with the time they were seen, and the game is simulated in fixed ticks of
+# 1 / tick_rate seconds that replay the events at their times. The pad is
+# driven through Game.paddle_axis, the fraction of each tick A or D was
+# held (plus a gamepad's stick), so a key pressed or released between two
+# frames moves the pad exactly as long as it was held, at any frame rate.
+# Call poll() as often as possible (at least once per frame; more often
+# while waiting for the next frame gives finer timestamps, GLFW events
+# carry none of their own) and advance() once per frame. Timestamps are
+# only as fine as the polling: FramePacer polls while it sleeps in the cap
+# and low-latency modes, but in the vsync and uncapped modes poll() runs
+# once per frame (nothing can be polled while swap_buffers blocks), so
+# their events are timed to the frame they were seen in:
+#
+#   pipeline = InputPipeline(game)
+#   glfw.set_key_callback(window, lambda w, key, s, action, m:
+#                         pipeline.keyEvent(key, action))
+#   while ...:
+#       pipeline.poll()
+#       pipeline.advance(glfw.get_time())
+#       game.render()
+#       game.recordFrame(frame_time)
+#
+# (advance() runs Game.update once per tick, so frame statistics are
+# recorded by the loop, not by update())
+#
+# Gamepads (and plain joysticks) are polled through GLFW on every poll():
+# buttons are mapped to keys by GAMEPAD_KEYS, the left stick (first axis)
+# moves the pad proportionally past a dead zone.
+class InputPipeline:
+    def __init__(self, game: Game, tick_rate: float = 120.0,
+                 max_lag: float = 0.25, dead_zone: float = 0.15) -> None:
+        self.game = game
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+        # simulated time behind the clock by more than this is dropped
+        # rather than caught up with (e.g. after a stall)
+        self.max_lag = max_lag
+        self.dead_zone = dead_zone
+        self.events: deque[InputEvent] = deque()
+        # time up to which the game has been simulated (None: not started)
+        self.time: float = None
+        # keys held on the keyboard and on gamepads; a key is down as long
+        # as either holds it
+        self.keyboard = [False] * len(game.keys)
+        self.gamepad = [False] * len(game.keys)
+        # stick position as of the last poll
+        self.axis = 0.0
+        self.ticks = 0
+        # ticks run during the last advance()
+        self.frame_ticks = 0
+
+    # queues a keyboard event (arguments as in GLFW's key callback)
+    def keyEvent(self, key: int, action: int, time: float = None) -> None:
+        if key < 0 or key >= len(self.keyboard) or action == glfw.REPEAT:
+            return
+        if time is None:
+            time = glfw.get_time()
+        self.keyboard[key] = action == glfw.PRESS
+        self.queue(time, key, self.keyboard[key] or self.gamepad[key])
+
+    def queue(self, time: float, key: int, down: bool) -> None:
+        # the clock can't go backwards, keep the queue in order anyway
+        if len(self.events) > 0 and time < self.events[-1].time:
+            time = self.events[-1].time
+        self.events.append(InputEvent(time, key, down))
+
+    # processes pending window events and samples the gamepads
+    def poll(self) -> None:
+        glfw.poll_events()
+        self.pollGamepads(glfw.get_time())
+
+    def pollGamepads(self, time: float) -> None:
+        held = [False] * len(self.gamepad)
+        axis = 0.0
+        for joystick in range(glfw.JOYSTICK_1, glfw.JOYSTICK_LAST + 1):
+            if not glfw.joystick_present(joystick):
+                continue
+            if glfw.joystick_is_gamepad(joystick):
+                state = glfw.get_gamepad_state(joystick)
+                if state is None:
+                    continue
+                for button, key in GAMEPAD_KEYS.items():
+                    held[key] = held[key] or bool(state.buttons[button])
+                stick = state.axes[glfw.GAMEPAD_AXIS_LEFT_X]
+            else:
+                # no known mapping: first axis and first button
+                axes, axis_count = glfw.get_joystick_axes(joystick)
+                buttons, button_count = glfw.get_joystick_buttons(joystick)
+                stick = axes[0] if axis_count > 0 else 0.0
+                if button_count > 0 and buttons[0]:
+                    held[glfw.KEY_SPACE] = True
+            if abs(stick) > abs(axis):
+                axis = stick
+        for key, down in enumerate(held):
+            if down != self.gamepad[key]:
+                self.gamepad[key] = down
+                self.queue(time, key, down or self.keyboard[key])
+        # rescale the stick past the dead zone to 0..1
+        if abs(axis) <= self.dead_zone:
+            self.axis = 0.0
+        else:
+            sign = 1.0 if axis > 0.0 else -1.0
+            self.axis = sign * (abs(axis) - self.dead_zone) / (1.0 - self.dead_zone)
+
+    # simulates the game in fixed ticks up to the time now
+    def advance(self, now: float) -> None:
+        self.frame_ticks = 0
+        if self.time is None:
+            self.time = now
+        if now - self.time > self.max_lag:
+            self.time = now - self.max_lag
+        while self.time + self.dt <= now:
+            self.tick(self.time, self.time + self.dt)
+            self.time += self.dt
+            self.ticks += 1
+            self.frame_ticks += 1
+
+    # applies the events of [start, end) and simulates one tick
+    def tick(self, start: float, end: float) -> None:
+        game = self.game
+        keys = game.keys
+        left = right = 0.0
+        last = start
+        # keys pressed during the tick count as pressed for it even if
+        # released again before its end (a quick tap isn't lost)
+        released: list[int] = []
+        while len(self.events) > 0 and self.events[0].time < end:
+            event = self.events.popleft()
+            time = max(event.time, start)
+            if keys[glfw.KEY_A]:
+                left += time - last
+            if keys[glfw.KEY_D]:
+                right += time - last
+            last = time
+            if event.down:
+                keys[event.key] = True
+                if event.key in released:
+                    released.remove(event.key)
+            elif keys[event.key]:
+                released.append(event.key)
+                # the pad stops right away
+                if event.key in (glfw.KEY_A, glfw.KEY_D):
+                    keys[event.key] = False
+                    game.keys_processed[event.key] = False
+        if keys[glfw.KEY_A]:
+            left += end - last
+        if keys[glfw.KEY_D]:
+            right += end - last
+        axis = (right - left) / (end - start) + self.axis
+        game.paddle_axis = max(-1.0, min(1.0, axis))
+        game.processInput(end - start)
+        game.paddle_axis = None
+        for key in released:
+            keys[key] = False
+            game.keys_processed[key] = False
+        game.update(end - start)
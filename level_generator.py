@@ -0,0 +1,188 @@
+import argparse
+import sys
+
+import numpy as np
+
+
+# Seeded procedural level generation. Levels come out as 2D arrays of tile
+# codes (0 empty, 1 solid, 2-5 breakable colors) that GameLevel.init takes
+# directly; saveLevel() exports them as .lvl files. Every step works on
+# whole arrays, so even 1000x500 tile levels generate in milliseconds.
+# Run as a script to write a generated level to disk.
+
+
+# smooth random field in [0, 1]: random values on a coarse lattice of the
+# given cell size, bilinearly interpolated up to rows x columns
+def valueNoise(rng: np.random.Generator, rows: int, columns: int,
+               cell: float) -> np.ndarray:
+    lattice = rng.random((int(rows / cell) + 2, int(columns / cell) + 2))
+    y = np.arange(rows) / cell
+    x = np.arange(columns) / cell
+    y0 = y.astype(np.intp)
+    x0 = x.astype(np.intp)
+    fy = (y - y0)[:, None]
+    fx = (x - x0)[None, :]
+    top = lattice[y0][:, x0] * (1.0 - fx) + lattice[y0][:, x0 + 1] * fx
+    bottom = (lattice[y0 + 1][:, x0] * (1.0 - fx)
+              + lattice[y0 + 1][:, x0 + 1] * fx)
+    return top * (1.0 - fy) + bottom * fy
+
+
+# sum of octaves of value noise, normalized to [0, 1]
+def fractalNoise(rng: np.random.Generator, rows: int, columns: int,
+                 cell: float, octaves: int = 3) -> np.ndarray:
+    noise = np.zeros((rows, columns))
+    amplitude = 1.0
+    total = 0.0
+    for octave in range(octaves):
+        noise += amplitude * valueNoise(rng, rows, columns,
+                                        max(cell / 2 ** octave, 1.0))
+        total += amplitude
+        amplitude *= 0.5
+    return noise / total
+
+
+# walls of a perfect maze (binary tree algorithm: every cell opens either
+# its north or its east wall), True where a wall is
+def mazeWalls(rng: np.random.Generator, rows: int, columns: int) -> np.ndarray:
+    walls = np.ones((rows, columns), dtype=bool)
+    cy, cx = np.meshgrid(np.arange(1, rows, 2), np.arange(1, columns, 2),
+                         indexing="ij")
+    walls[cy, cx] = False
+    if cy.size == 0:
+        return walls  # too small to hold a cell
+    # cells on the top row can only open east, on the right edge only north
+    north = rng.random(cy.shape) < 0.5
+    north[0, :] = False
+    north[:, -1] = True
+    north[0, -1] = False
+    east = ~north
+    east[:, -1] = False
+    walls[cy[north] - 1, cx[north]] = False
+    east_x = cx[east] + 1
+    inside = east_x < columns
+    walls[cy[east][inside], east_x[inside]] = False
+    return walls
+
+
+# difficulty of a level in [0, 1]: how full it is, weighted up by the
+# share of solid bricks in it
+def levelDifficulty(tile_data: np.ndarray) -> float:
+    tiles = tile_data.size
+    bricks = np.count_nonzero(tile_data)
+    if tiles == 0 or bricks == 0:
+        return 0.0
+    solid_share = np.count_nonzero(tile_data == 1) / bricks
+    return float(min(1.0, bricks / tiles * (0.5 + 2.0 * solid_share)))
+
+
+# generates a level of columns x rows tiles. symmetry is "none", "mirror"
+# (left-right) or "quad" (left-right and top-bottom); maze lays solid
+# walls out as a maze instead of scattering them; difficulty targets
+# levelDifficulty() of the result
+def generateLevel(columns: int, rows: int, seed: int = None,
+                  symmetry: str = "mirror", maze: bool = False,
+                  difficulty: float = 0.5) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    difficulty = float(np.clip(difficulty, 0.05, 1.0))
+    # generate the part that isn't mirrored
+    gen_columns = -(-columns // 2) if symmetry in ("mirror", "quad") else columns
+    gen_rows = -(-rows // 2) if symmetry == "quad" else rows
+    cell = max(min(gen_rows, gen_columns) / 4.0, 1.0)
+    # share of solid bricks and how full the level is to hit the target
+    solid_share = 0.05 + 0.25 * difficulty
+    fill = float(np.clip(difficulty / (0.5 + 2.0 * solid_share), 0.05, 1.0))
+    # bricks go where the density noise is lowest
+    density = fractalNoise(rng, gen_rows, gen_columns, cell)
+    filled = density <= np.quantile(density, fill)
+    # breakable colors run in bands from the top, disturbed by noise
+    band = (np.arange(gen_rows)[:, None] / gen_rows
+            + (fractalNoise(rng, gen_rows, gen_columns, cell) - 0.5) * 0.3)
+    codes = 5 - (np.clip(band, 0.0, 0.999) * 4).astype(np.int32)
+    tiles = np.where(filled, codes, 0).astype(np.int32)
+    # solid bricks
+    if maze:
+        walls = mazeWalls(rng, gen_rows, gen_columns)
+        keep = rng.random(walls.shape) < min(1.0, solid_share * 2.0)
+        tiles[walls & keep & filled] = 1
+    else:
+        scatter = rng.random((gen_rows, gen_columns))
+        tiles[filled & (scatter < solid_share)] = 1
+    # mirror into the full level (an odd size shares the center column or
+    # row between both halves)
+    if symmetry in ("mirror", "quad"):
+        mirrored = tiles[:, -2::-1] if columns % 2 else tiles[:, ::-1]
+        tiles = np.concatenate((tiles, mirrored), axis=1)
+    if symmetry == "quad":
+        mirrored = tiles[-2::-1, :] if rows % 2 else tiles[::-1, :]
+        tiles = np.concatenate((tiles, mirrored), axis=0)
+    # a level needs at least one brick to break (placed symmetrically)
+    if not np.any(tiles > 1):
+        tiles[0, columns // 2] = 2
+        if symmetry in ("mirror", "quad"):
+            tiles[0, (columns - 1) // 2] = 2
+        if symmetry == "quad":
+            tiles[rows - 1, [columns // 2, (columns - 1) // 2]] = 2
+    return tiles
+
+
+# whether tile data has the given symmetry
+def isSymmetric(tile_data: np.ndarray, symmetry: str) -> bool:
+    if symmetry in ("mirror", "quad") and not np.array_equal(
+            tile_data, tile_data[:, ::-1]):
+        return False
+    if symmetry == "quad" and not np.array_equal(tile_data,
+                                                 tile_data[::-1, :]):
+        return False
+    return True
+
+
+# generates levels of odd and even sizes and checks their shape and
+# symmetry (python level_generator.py --check)
+def check() -> None:
+    for columns, rows in ((5, 3), (6, 4), (5, 4), (6, 3), (1, 1), (61, 33),
+                          (60, 32)):
+        for symmetry in ("none", "mirror", "quad"):
+            for seed in range(4):
+                tiles = generateLevel(columns, rows, seed, symmetry,
+                                      maze=seed % 2 == 1)
+                assert tiles.shape == (rows, columns)
+                assert isSymmetric(tiles, symmetry), (columns, rows,
+                                                      symmetry, seed)
+                assert np.any(tiles > 1)
+    print("ok")
+
+
+# writes tile data in the .lvl format (one row per line, codes separated
+# by spaces)
+def saveLevel(tile_data: np.ndarray, file: str) -> None:
+    np.savetxt(file, tile_data, fmt="%d", delimiter=" ")
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Generate a Breakout level")
+    parser.add_argument("columns", type=int, nargs="?")
+    parser.add_argument("rows", type=int, nargs="?")
+    parser.add_argument("out", nargs="?", help=".lvl file to write")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--symmetry", choices=("none", "mirror", "quad"),
+                        default="mirror")
+    parser.add_argument("--maze", action="store_true")
+    parser.add_argument("--difficulty", type=float, default=0.5)
+    parser.add_argument("--check", action="store_true",
+                        help="check the generator's symmetry and exit")
+    args = parser.parse_args(argv)
+    if args.check:
+        check()
+        return 0
+    if args.out is None:
+        parser.error("columns, rows and out are required")
+    tiles = generateLevel(args.columns, args.rows, args.seed, args.symmetry,
+                          args.maze, args.difficulty)
+    saveLevel(tiles, args.out)
+    print("difficulty: {:.2f}".format(levelDifficulty(tiles)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,12 +1,13 @@
 #version 460 core
 layout (location = 0) in vec4 vertex; // <vec2 position, vec2 texCoords>
+// per particle instance
+layout (location = 1) in vec2 offset;
+layout (location = 2) in vec4 color;
 
 out vec2 TexCoords;
 out vec4 ParticleColor;
 
 uniform mat4 projection;
-uniform vec2 offset;
-uniform vec4 color;
 
 void main()
 {
@@ -14,4 +15,4 @@ void main()
     TexCoords = vertex.zw;
     ParticleColor = color;
     gl_Position = projection * vec4((vertex.xy * scale) + offset, 0.0, 1.0);
-}
\ No newline at end of file
+}
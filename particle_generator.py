@@ -1,32 +1,25 @@
-import random
-
 import glm
+import numpy as np
 from OpenGL.GL import *
 
 from game_object import GameObject
 from shader import Shader
+from stream_buffer import StreamBuffer
 from texture2d import Texture2D
 
 
-# Represents a single particle and its state
-class Particle:
-    def __init__(self):
-        self.position = glm.vec2(0.0)
-        self.velocity = glm.vec2(0.0)
-        self.color = glm.vec4(1.0)
-        self.life = 0.0
-
-
 # ParticleGenerator acts as a container for rendering a large number of
 # particles by repeatedly spawning and updating particles and killing
 # them after a given amount of time.
+# Particle state (position, velocity, color and life) is stored in
+# flat arrays, one row per particle, so particles can be spawned and
+# updated in bulk.
 class ParticleGenerator:
     def __init__(self, shader: Shader, texture: Texture2D,
                  amount: int) -> None:
         self.shader = shader
         self.texture = texture
         self.amount = amount
-        self.last_used_particle = 0
         self.init()
 
     # initializes buffer and vertex attributes
@@ -54,69 +47,82 @@ class ParticleGenerator:
         glVertexArrayAttribFormat(self.vao, 0, 4, GL_FLOAT, GL_FALSE, 0)
         glVertexArrayAttribBinding(self.vao, 0, 0)
         glEnableVertexArrayAttrib(self.vao, 0)
+        # per-instance attributes <vec2 offset, vec4 color>, streamed each
+        # frame for the particles that are alive
+        self.stream = StreamBuffer(max(self.amount * 6 * 4, 4096))
+        glVertexArrayAttribFormat(self.vao, 1, 2, GL_FLOAT, GL_FALSE, 0)
+        glVertexArrayAttribBinding(self.vao, 1, 1)
+        glEnableVertexArrayAttrib(self.vao, 1)
+        glVertexArrayAttribFormat(self.vao, 2, 4, GL_FLOAT, GL_FALSE,
+                                  2 * sizeof(GLfloat))
+        glVertexArrayAttribBinding(self.vao, 2, 1)
+        glEnableVertexArrayAttrib(self.vao, 2)
+        glVertexArrayBindingDivisor(self.vao, 1, 1)
 
         # create amount default particle instances
-        self.particles: list[Particle] = []
-        for i in range(self.amount):
-            self.particles.append(Particle())
+        self.position = np.zeros((self.amount, 2), dtype=np.float32)
+        self.velocity = np.zeros((self.amount, 2), dtype=np.float32)
+        self.color = np.ones((self.amount, 4), dtype=np.float32)
+        self.life = np.zeros(self.amount, dtype=np.float32)
 
-    # update all particles
+    # update all particles, spawning new ones for the given object
     def update(self, dt: float, object: GameObject, new_particles: int,
                offset=glm.vec2(0.0, 0.0)) -> None:
         # add new particles
-        for i in range(new_particles):
-            unused_particle = self.firstUnusedParticle()
-            self.respawnParticle(
-                self.particles[unused_particle], object, offset)
+        self.respawnParticles(
+            np.array([[object.position.x, object.position.y]]),
+            np.array([[object.velocity.x, object.velocity.y]]),
+            new_particles, offset)
         # update all particles
-        for i in range(self.amount):
-            p = self.particles[i]
-            p.life -= dt  # reduce life
-            if p.life > 0.0:
-                # particle is alive, thus update
-                p.position -= p.velocity * dt
-                p.color.w -= dt * 2.5
+        self.life -= dt  # reduce life
+        alive = self.life > 0.0
+        # particle is alive, thus update
+        self.position[alive] -= self.velocity[alive] * dt
+        self.color[alive, 3] -= dt * 2.5
 
-    # render all particles
+    # render all particles (in a single instanced draw)
     def draw(self) -> None:
+        alive = self.life > 0.0
+        count = int(np.count_nonzero(alive))
+        if count == 0:
+            return
+        offset, data = self.stream.allocate(count * 6)
+        instances = data.reshape(count, 6)
+        instances[:, 0:2] = self.position[alive]
+        instances[:, 2:6] = self.color[alive]
+        glVertexArrayVertexBuffer(self.vao, 1, self.stream.buffer, offset,
+                                  6 * sizeof(GLfloat))
         # use use additive blending to give it a 'glow' effect
         glBlendFunc(GL_SRC_ALPHA, GL_ONE)
         self.shader.use()
-        for p in self.particles:
-            if p.life > 0.0:
-                self.shader.setVec2("offset", p.position)
-                self.shader.setVec4("color", p.color)
-                self.texture.bind(0)
-                glBindVertexArray(self.vao)
-                glDrawArrays(GL_TRIANGLES, 0, 6)
+        self.texture.bind(0)
+        glBindVertexArray(self.vao)
+        glDrawArraysInstanced(GL_TRIANGLES, 0, 6, count)
         # don't forget to reset to default blending mode
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
-    # stores the index of the last particle used (for quick access to next
-    # dead particle)
-    def firstUnusedParticle(self) -> int:
-        # first search from last used particle, this will usually return
-        # almost instantly
-        for i in range(self.last_used_particle, self.amount):
-            if self.particles[i].life <= 0.0:
-                self.last_used_particle = i
-                return i
-        # otherwise, do a linear search
-        for i in range(self.last_used_particle):
-            if self.particles[i].life <= 0.0:
-                self.last_used_particle = i
-                return i
-        # all particles are taken, override the first one (note that if it
-        # repeatedly hits this case, more particles should be reserved)
-        self.last_used_particle = 0
-        return 0
-
-    # respawns particle
-    def respawnParticle(self, particle: Particle, object: GameObject,
-                        offset=glm.vec2(0.0, 0.0)) -> None:
-        ran = random.uniform(-5.0, 4.9)
-        rcolor = random.uniform(0.5, 1.49)
-        particle.position = object.position + ran + offset
-        particle.color = glm.vec4(rcolor, rcolor, rcolor, 1.0)
-        particle.life = 1.0
-        particle.velocity = object.velocity * 0.1
+    # respawns new_particles particles for each of the given emitters (one
+    # row of positions/velocities per emitter) in one go. Dead particles
+    # are reused first; if there aren't enough, the particles closest to
+    # dying are overridden (if this happens a lot, more particles should
+    # be reserved)
+    def respawnParticles(self, positions: np.ndarray, velocities: np.ndarray,
+                         new_particles: int,
+                         offset=glm.vec2(0.0, 0.0)) -> None:
+        count = min(len(positions) * new_particles, self.amount)
+        if count == 0:
+            return
+        if count < self.amount:
+            slots = np.argpartition(self.life, count - 1)[:count]
+        else:
+            slots = np.arange(self.amount)
+        emitter = np.repeat(np.arange(len(positions)), new_particles)[:count]
+        ran = np.random.uniform(-5.0, 4.9, (count, 1))
+        rcolor = np.random.uniform(0.5, 1.49, count)
+        self.position[slots] = positions[emitter] + ran + (offset.x, offset.y)
+        self.color[slots, 0] = rcolor
+        self.color[slots, 1] = rcolor
+        self.color[slots, 2] = rcolor
+        self.color[slots, 3] = 1.0
+        self.life[slots] = 1.0
+        self.velocity[slots] = velocities[emitter] * 0.1
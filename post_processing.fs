@@ -3,43 +3,34 @@ in vec2 TexCoords;
 out vec4 color;
 
 uniform sampler2D scene;
-uniform vec2  offsets[9];
-uniform int     edge_kernel[9];
-uniform float  blur_kernel[9];
 
-uniform bool chaos;
-uniform bool confuse;
-uniform bool shake;
+// one variant of this shader is compiled per effect (EDGE for chaos,
+// INVERT for confuse, BLUR for shake), so no effect is branched on at
+// runtime and the kernel weights are compile-time constants
+const float offset = 1.0 / 300.0;
 
 void main()
 {
-    // zero out memory since an out variable is initialized with undefined values by default 
-    color = vec4(0.0f);
-    // sample from texture offsets if using convolution matrix
-    vec3 sampleTex[9];
-    if(chaos || shake)
-        for(int i = 0; i < 9; i++)
-            sampleTex[i] = vec3(texture(scene, TexCoords.st + offsets[i]));
-
-    // process effects
-    if(chaos)
-    {           
-        for(int i = 0; i < 9; i++)
-            color += vec4(sampleTex[i] * edge_kernel[i], 0.0f);
-        color.a = 1.0f;
-    }
-    else if(confuse)
-    {
-        color = vec4(1.0 - texture(scene, TexCoords).rgb, 1.0);
-    }
-    else if(shake)
-    {
-        for(int i = 0; i < 9; i++)
-            color += vec4(sampleTex[i] * blur_kernel[i], 0.0f);
-        color.a = 1.0f;
-    }
-    else
-    {
-        color =  texture(scene, TexCoords);
-    }
+#if defined(EDGE)
+    // edge detection: 8 * center - sum of the 8 neighbours
+    vec3 sum = vec3(0.0);
+    for(int y = -1; y <= 1; y++)
+        for(int x = -1; x <= 1; x++)
+            sum += texture(scene, TexCoords + vec2(x, y) * offset).rgb;
+    vec3 center = texture(scene, TexCoords).rgb;
+    color = vec4(9.0 * center - sum, 1.0);
+#elif defined(INVERT)
+    color = vec4(1.0 - texture(scene, TexCoords).rgb, 1.0);
+#elif defined(BLUR)
+    // separable 1-2-1 gaussian: weight(x, y) = w[x] * w[y] / 16
+    const float w[3] = float[](1.0, 2.0, 1.0);
+    vec3 sum = vec3(0.0);
+    for(int y = -1; y <= 1; y++)
+        for(int x = -1; x <= 1; x++)
+            sum += w[x + 1] * w[y + 1] *
+                texture(scene, TexCoords + vec2(x, y) * offset).rgb;
+    color = vec4(sum / 16.0, 1.0);
+#else
+    color = texture(scene, TexCoords);
+#endif
 }
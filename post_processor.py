@@ -2,6 +2,7 @@ from OpenGL.GL import *
 
 from texture2d import Texture2D
 from shader import Shader
+from resource_manager import ResourceManager
 
 
 # PostProcessor hosts all PostProcessing effects for the Breakout
@@ -10,118 +11,160 @@ from shader import Shader
 # Shake boolean.
 # It is required to call BeginRender() before rendering the game
 # and EndRender() after rendering the game for the class to work.
+# The scene is rendered with the given number of MSAA samples (0 renders
+# straight into the texture without multisampling) at render_scale times
+# the output resolution. While no effect is active the effect pass is
+# skipped and the scene is blitted straight to the default framebuffer.
+# The output rectangle can change at any time through resize(); the
+# render targets are only reallocated on the next beginRender().
 class PostProcessor:
-    def __init__(self, shader: Shader, width: int, height: int) -> None:
-        self.post_processing_shader = shader
-        self.texture = Texture2D()
+    def __init__(self, width: int, height: int, samples: int = 4,
+                 render_scale: float = 1.0) -> None:
+        # one effect pass per effect, all built from the same source
+        self.shaders: dict[str, Shader] = {}
+        for effect, define in (("chaos", "EDGE"), ("confuse", "INVERT"),
+                               ("shake", "BLUR")):
+            shader = ResourceManager.loadShader(
+                "post_processing.vs", "post_processing.fs", None,
+                "postprocessing_" + effect, [define])
+            shader.use()
+            shader.setInteger("scene", 0)
+            self.shaders[effect] = shader
+        # output rectangle in the default framebuffer
+        self.x = 0
+        self.y = 0
         self.width = width
         self.height = height
+        self.samples = samples
+        self.render_scale = render_scale
+        # internal (scene) resolution the render targets are allocated at
+        self.scene_width = 0
+        self.scene_height = 0
         self.confuse = False
         self.chaos = False
         self.shake = False
+        self.texture: Texture2D = None
         # initialize renderbuffer/framebuffer object
         # MSFBO = Multisampled FBO. FBO is regular, used for blitting MS
         # color-buffer to texture
         self.msfbo = GLuint()
-        glCreateFramebuffers(1, self.msfbo)
         self.fbo = GLuint()
         glCreateFramebuffers(1, self.fbo)
-        # RBO is used for multisampled color buffer
-        self.rbo = GLuint()
-        glCreateRenderbuffers(1, self.rbo)
-        # initialize renderbuffer storage with a multisampled color buffer
-        #  (don't need a depth/stencil buffer)
-        glBindFramebuffer(GL_FRAMEBUFFER, self.msfbo)
-        glBindRenderbuffer(GL_RENDERBUFFER, self.rbo)
-        glNamedRenderbufferStorageMultisample(
-            self.rbo, 4, GL_RGB, width, height)
-        glNamedFramebufferRenderbuffer(
-            self.msfbo, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.rbo)
-        if (glCheckNamedFramebufferStatus(self.msfbo, GL_FRAMEBUFFER)
-                != GL_FRAMEBUFFER_COMPLETE):
-            print("ERROR::POSTPROCESSOR: Failed to initialize MSFBO")
-        # also initialize the FBO/texture to blit multisampled color-buffer to
-        #  used for shader operations (for postprocessing effects)
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
-        self.texture.generate(width, height, None)
+        if self.samples > 0:
+            glCreateFramebuffers(1, self.msfbo)
+            # RBO is used for multisampled color buffer
+            self.rbo = GLuint()
+            glCreateRenderbuffers(1, self.rbo)
+        self.initFramebuffers()
+        # initialize render data
+        self.initRenderData()
+
+    # sets the rectangle of the default framebuffer the result is drawn to
+    def resize(self, x: int, y: int, width: int, height: int) -> None:
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    # (re)allocates the render targets if the internal resolution changed
+    def initFramebuffers(self) -> None:
+        scene_width = max(1, int(self.width * self.render_scale))
+        scene_height = max(1, int(self.height * self.render_scale))
+        if (scene_width, scene_height) == (self.scene_width, self.scene_height):
+            return
+        self.scene_width = scene_width
+        self.scene_height = scene_height
+        if self.samples > 0:
+            # initialize renderbuffer storage with a multisampled color
+            # buffer (don't need a depth/stencil buffer)
+            glNamedRenderbufferStorageMultisample(
+                self.rbo, self.samples, GL_RGB8,
+                self.scene_width, self.scene_height)
+            glNamedFramebufferRenderbuffer(
+                self.msfbo, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.rbo)
+            if (glCheckNamedFramebufferStatus(self.msfbo, GL_FRAMEBUFFER)
+                    != GL_FRAMEBUFFER_COMPLETE):
+                print("ERROR::POSTPROCESSOR: Failed to initialize MSFBO")
+        # also initialize the FBO/texture to blit multisampled color-buffer
+        # to (or to render to directly without multisampling) used for
+        # shader operations (for postprocessing effects); texture storage
+        # is immutable so a new texture replaces the old one
+        if self.texture is not None:
+            glDeleteTextures(1, self.texture.tex_id)
+        self.texture = Texture2D()
+        self.texture.internal_format = GL_RGB8
+        self.texture.wrap_s = GL_CLAMP_TO_EDGE
+        self.texture.wrap_t = GL_CLAMP_TO_EDGE
+        self.texture.generate(self.scene_width, self.scene_height, None)
         glNamedFramebufferTexture(
             self.fbo, GL_COLOR_ATTACHMENT0, self.texture.tex_id, 0)
         if (glCheckNamedFramebufferStatus(self.fbo, GL_FRAMEBUFFER)
                 != GL_FRAMEBUFFER_COMPLETE):
             print("ERROR::POSTPROCESSOR: Failed to initialize FBO")
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
-        # initialize render data and uniforms
-        self.initRenderData()
-        self.post_processing_shader.use()
-        self.post_processing_shader.setInteger("scene", 0)
-        offset = 1.0 / 300.0
-        offsets = [
-            -offset,  offset,
-            0.0,     offset,
-            offset,  offset,
-            -offset,  0.0,
-            0.0,     0.0,
-            offset,  0.0,
-            -offset, -offset,
-            0.0,    -offset,
-            offset, -offset
-        ]
-        ctype_offsets = (GLfloat * len(offsets))(*offsets)
-        glUniform2fv(glGetUniformLocation(
-            self.post_processing_shader.id, "offsets"), 9, ctype_offsets)
-        edge_kernel = [
-            -1, -1, -1,
-            -1,  8, -1,
-            -1, -1, -1
-        ]
-        ctype_edge_kernel = (GLuint * len(edge_kernel))(*edge_kernel)
-        glUniform1iv(glGetUniformLocation(
-            self.post_processing_shader.id, "edge_kernel"), 9, ctype_edge_kernel)
-        blur_kernel = [
-            1.0 / 16.0, 2.0 / 16.0, 1.0 / 16.0,
-            2.0 / 16.0, 4.0 / 16.0, 2.0 / 16.0,
-            1.0 / 16.0, 2.0 / 16.0, 1.0 / 16.0
-        ]
-        ctype_blur_kernel = (GLfloat * len(blur_kernel))(*blur_kernel)
-        glUniform1fv(glGetUniformLocation(
-            self.post_processing_shader.id, "blur_kernel"), 9, ctype_blur_kernel)
+
+    # whether any effect currently needs the effect pass
+    def isActive(self) -> bool:
+        return self.chaos or self.confuse or self.shake
 
     # prepares the postprocessor's framebuffer operations before rendering
     # the game
     def beginRender(self) -> None:
-        glBindFramebuffer(GL_FRAMEBUFFER, self.msfbo)
+        self.initFramebuffers()
+        if self.samples > 0:
+            glBindFramebuffer(GL_FRAMEBUFFER, self.msfbo)
+        else:
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.scene_width, self.scene_height)
         glClearColor(0.0, 0.0, 0.0, 1.0)
         glClear(GL_COLOR_BUFFER_BIT)
 
     # should be called after rendering the game, so it stores all the rendered
     # data into a texture object
     def endRender(self) -> None:
-        # now resolve multisampled color-buffer into intermediate FBO to store
-        # to texture
-        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.msfbo)
-        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.fbo)
-        glBlitNamedFramebuffer(self.msfbo, self.fbo,
-                               0, 0, self.width, self.height,
-                               0, 0, self.width, self.height,
-                               GL_COLOR_BUFFER_BIT, GL_NEAREST)
+        if self.samples > 0:
+            # now resolve multisampled color-buffer into intermediate FBO to
+            # store to texture
+            glBlitNamedFramebuffer(self.msfbo, self.fbo,
+                                   0, 0, self.scene_width, self.scene_height,
+                                   0, 0, self.scene_width, self.scene_height,
+                                   GL_COLOR_BUFFER_BIT, GL_NEAREST)
         # binds both READ and WRITE framebuffer to default framebuffer
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(self.x, self.y, self.width, self.height)
 
     # renders the PostProcessor texture quad (as a screen-encompassing
     # large sprite)
     def render(self, time: float) -> None:
+        if not self.isActive():
+            # nothing to do but copying (and upscaling) the scene
+            if (self.scene_width, self.scene_height) == (self.width, self.height):
+                filter = GL_NEAREST
+            else:
+                filter = GL_LINEAR
+            glBlitNamedFramebuffer(self.fbo, 0,
+                                   0, 0, self.scene_width, self.scene_height,
+                                   self.x, self.y,
+                                   self.x + self.width, self.y + self.height,
+                                   GL_COLOR_BUFFER_BIT, filter)
+            return
+        # chaos takes precedence over confuse, both over shake's blur
+        if self.chaos:
+            shader = self.shaders["chaos"]
+        elif self.confuse:
+            shader = self.shaders["confuse"]
+        else:
+            shader = self.shaders["shake"]
         # set uniforms/options
-        self.post_processing_shader.use()
-        self.post_processing_shader.setFloat("time", time)
-        self.post_processing_shader.setInteger("confuse", self.confuse)
-        self.post_processing_shader.setInteger("chaos", self.chaos)
-        self.post_processing_shader.setInteger("shake", self.shake)
+        shader.use()
+        shader.setFloat("time", time)
+        shader.setInteger("confuse", self.confuse)
+        shader.setInteger("chaos", self.chaos)
+        shader.setInteger("shake", self.shake)
         # render textured quad
         self.texture.bind(0)
         glBindVertexArray(self.vao)
         glDrawArrays(GL_TRIANGLES, 0, 6)
 
-
     # initialize quad for rendering postprocessing texture
     def initRenderData(self) -> None:
         # configure VAO/VBO
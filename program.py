@@ -1,79 +1,177 @@
+import os
 import sys
+# (first, so startup is timed from here)
+import startup
 parent_dir = "../Python-Breakout"
 sys.path.append(parent_dir)
 
 import glfw
 from glfw import _GLFWwindow as GLFWwindow
-from OpenGL.GL import *
-
-
-from resource_manager import ResourceManager
-from game import Game
 
 # The Width of the screen
 SCREEN_WIDTH = 800
 # The height of the screen
 SCREEN_HEIGHT = 600
 
-Breakout = Game(SCREEN_WIDTH, SCREEN_HEIGHT)
-from pygame import mixer
+# --startup-report prints how long each step of startup took
+startup.verbose = "--startup-report" in sys.argv
+startup.mark("glfw imported")
+
+def argument(name: str, default: str) -> str:
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+# the game and the systems around it, created by loadGame() once the window
+# is up (importing them pulls in PyOpenGL and numpy)
+Breakout = None
+autopilot = None
+spectate = None
+pipeline = None
+pacer = None
+show_pacing = "--show-pacing" in sys.argv
+
+def loadGame() -> None:
+    global Breakout, autopilot, spectate, pipeline, pacer
+    import asset_archive
+    from game import Game
+    from autopilot import Autopilot
+    from spectator import SpectatorClient
+    from input_pipeline import InputPipeline
+    from frame_pacer import FramePacer
+    startup.mark("game modules imported")
+
+    # assets are read from a packed archive if there is one (--archive FILE,
+    # default: assets.pak next to this file, see asset_archive.py); --dev
+    # always reads the loose files it watches
+    archive_file = argument("--archive", os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "assets.pak"))
+    if os.path.exists(archive_file) and "--dev" not in sys.argv:
+        asset_archive.mount(archive_file)
+
+    Breakout = Game(SCREEN_WIDTH, SCREEN_HEIGHT)
+    # --dev reloads shaders and levels as they are edited
+    Breakout.hot_reload = "--dev" in sys.argv
+    # --stats FILE writes session statistics (.jsonl, .db or .sqlite)
+    Breakout.stats_file = argument("--stats", None)
+    # --autopilot lets the computer play (and start games from the menu)
+    autopilot = Autopilot(Breakout) if "--autopilot" in sys.argv else None
+    # --connect HOST:PORT shows the game of a spectator server instead of
+    # playing locally, --play also sends the keys to play it
+    if "--connect" in sys.argv[:-1]:
+        host, port = argument("--connect", None).rsplit(":", 1)
+        spectate = SpectatorClient(host, int(port), "--play" in sys.argv)
+    # input is replayed into a simulation of fixed ticks (--tick-rate HZ)
+    pipeline = InputPipeline(Breakout, float(argument("--tick-rate", "120")))
+    # --pacing uncapped|vsync|cap|low-latency, --fps N caps frames in cap
+    # mode, --idle-fps N paces the menu and win screens (0: off),
+    # --show-pacing shows frame time and latency in the title bar
+    pacer = FramePacer(argument("--pacing", "vsync"),
+                       float(argument("--fps", "60")),
+                       float(argument("--idle-fps", "5")), pipeline.poll)
+    # --profile measures CPU and GPU time of the render passes (reported
+    # with the stats and, with --show-pacing, in the title bar)
+    Breakout.profile = "--profile" in sys.argv
 
 def main():
     glfw.init()
     glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
     glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 6)
     glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
-    glfw.window_hint(glfw.RESIZABLE, False)
+    glfw.window_hint(glfw.RESIZABLE, True)
     window = glfw.create_window(SCREEN_WIDTH, SCREEN_HEIGHT, "Python3/OpenGL 4.6 Breakout", None, None)
     if (window == None):
         print("Failed to create GLFW window")
         glfw.terminate()
 
     glfw.make_context_current(window)
+    # show the (empty) window before loading anything else
+    glfw.poll_events()
+    startup.mark("window visible")
+
+    loadGame()
+    from OpenGL.GL import (GL_BLEND, GL_COLOR_BUFFER_BIT,
+                           GL_ONE_MINUS_SRC_ALPHA, GL_SRC_ALPHA,
+                           glBlendFunc, glClear, glClearColor, glEnable,
+                           glViewport)
+    from game import GameState
+    from resource_manager import ResourceManager
+    pacer.apply()
     glfw.set_key_callback(window, key_callback)
-    glfw.set_framebuffer_size_callback(window, framebuffer_size_callback)
 
     # OpenGL configuration
     # --------------------
-    glViewport(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    # the framebuffer can be larger than the window on high-DPI displays
+    framebuffer_width, framebuffer_height = glfw.get_framebuffer_size(window)
+    glViewport(0, 0, framebuffer_width, framebuffer_height)
     glEnable(GL_BLEND)
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
     # initialize game
     Breakout.init()
+    Breakout.resize(framebuffer_width, framebuffer_height)
+    glfw.set_framebuffer_size_callback(window, framebuffer_size_callback)
+    Breakout.stats.addReport("pacing", pacer.report)
+    startup.mark("game initialized")
 
     # deltaTime variables
     # -------------------
     delta_time = 0.0
     last_frame = 0.0
+    last_title = 0.0
+    first_frame = True
 
     while not glfw.window_should_close(window):
+        # wait for the frame's turn before sampling input
+        pacer.beginFrame(Breakout.state != GameState.GAME_ACTIVE)
         # calculate delta time
         # --------------------
         current_frame = glfw.get_time()
         delta_time = current_frame - last_frame
         last_frame = current_frame
-        glfw.poll_events()
+        pipeline.poll()
 
         # manage user input
         # -----------------
-        Breakout.processInput(delta_time)
+        if spectate is not None:
+            # the server runs the game, only show its state
+            spectate.apply(Breakout, delta_time)
+        else:
+            if autopilot is not None:
+                autopilot.control(delta_time)
+
+            # update game state in fixed ticks, with input at its time
+            # ----------------------------------------------------------
+            pipeline.advance(glfw.get_time())
 
-        # update game state
-        # -----------------
-        Breakout.update(delta_time)
-        
         # render
         glClearColor(0.0, 0.0, 0.0, 1.0)
         glClear(GL_COLOR_BUFFER_BIT)
         Breakout.render()
 
         glfw.swap_buffers(window)
+        pacer.endFrame()
+        if first_frame:
+            first_frame = False
+            startup.mark("first frame")
+        else:
+            # (the first frame's time includes startup)
+            Breakout.recordFrame(delta_time)
+        if show_pacing and current_frame - last_title >= 1.0:
+            last_title = current_frame
+            title = "Python3/OpenGL 4.6 Breakout - " + pacer.summary()
+            if Breakout.profile:
+                title += " - " + Breakout.profiler.summary()
+            glfw.set_window_title(window, title)
     # delete all resources as loaded using the resource manager
     # ---------------------------------------------------------
+    if spectate is not None:
+        spectate.close()
+    Breakout.stats.close(score=Breakout.score, level=Breakout.level)
     ResourceManager.clear()
-    mixer.music.stop()
-    mixer.quit()
+    Breakout.closeAudio()
+    if startup.verbose:
+        print(startup.report())
     glfw.destroy_window(window)
     glfw.terminate()
 
@@ -81,17 +179,25 @@ def key_callback(window: GLFWwindow, key:int, scancode:int, action:int, mods:int
     # when a user presses the escape key, we set the WindowShouldClose property to true, closing the application
     if key == glfw.KEY_ESCAPE and action == glfw.PRESS:
         glfw.set_window_should_close(window, True)
-    if key >= 0 and key < 1024:
-        if action == glfw.PRESS:
-            Breakout.keys[key] = True
-        elif action == glfw.RELEASE:
-            Breakout.keys[key] = False
-            Breakout.keys_processed[key] = False
+    if spectate is not None:
+        # the client sends the held keys to the server
+        if key >= 0 and key < 1024:
+            if action == glfw.PRESS:
+                Breakout.keys[key] = True
+            elif action == glfw.RELEASE:
+                Breakout.keys[key] = False
+                Breakout.keys_processed[key] = False
+        return
+    # timestamped, applied by the simulation tick it happened in
+    pipeline.keyEvent(key, action)
 
 def framebuffer_size_callback(window: GLFWwindow, width: int, height: int) -> None:
-    # make sure the viewport matches the new window dimensions; note that width and 
+    from OpenGL.GL import glViewport
+    # make sure the viewport matches the new window dimensions; note that width and
     # height will be significantly larger than specified on retina displays.
     glViewport(0, 0, width, height)
+    # the game scales its logical area into the new size
+    Breakout.resize(width, height)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,19 @@
+import hashlib
+import os
+import struct
+
 from OpenGL.GL import *
-from PIL import Image
 
+from asset_archive import openAsset, readText
+from asset_cache import AssetCache
+from startup import lazyImport
 from texture2d import Texture2D
 from shader import Shader
 
+# imported when first used
+Image = lazyImport("PIL.Image")
+mixer = lazyImport("pygame.mixer")
+
 
 # A static singleton ResourceManager class that hosts several
 # functions to load Textures and Shaders. Each loaded texture
@@ -14,17 +24,48 @@ class ResourceManager:
     # resource storage
     shaders:dict[str, Shader] = {}
     textures:dict[str, Texture2D] = {}
+    # source files (vertex, fragment, geometry, defines) of each shader
+    shader_files: dict[str, tuple] = {}
+    # directory linked shader programs are cached in, next to this file
+    # (None disables the cache)
+    shader_cache_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "shader_cache")
+    # directory decoded textures and sounds are cached in, next to this
+    # file (None disables the cache)
+    asset_cache_dir = AssetCache.DIRECTORY
+    asset_cache: AssetCache = None
+    # the music streamed from an archive has to stay open while playing
+    music_file = None
 
     # loads (and generates) a shader program from file loading vertex,
     # fragment (and geometry) shader's source code. If gShaderFile is
-    # not nullptr, it also loads a geometry shader
+    # not nullptr, it also loads a geometry shader. Any given defines are
+    # injected into each stage, to build variants from the same source
     @staticmethod
     def loadShader(vShaderFile: str, fShaderFile: str, gShaderFile: str,
-                   name: str) -> Shader:
+                   name: str, defines: list[str] = None) -> Shader:
         ResourceManager.shaders[name] = ResourceManager.loadShaderFromFile(
-            vShaderFile, fShaderFile, gShaderFile)
+            vShaderFile, fShaderFile, gShaderFile, defines)
+        ResourceManager.shader_files[name] = (vShaderFile, fShaderFile,
+                                              gShaderFile, defines)
         return ResourceManager.shaders[name]
 
+    # recompiles a stored shader from its source files in place, so every
+    # holder of the Shader object picks up the new program. If compilation
+    # fails the old program is kept and False is returned
+    @staticmethod
+    def reloadShader(name: str) -> bool:
+        shader = ResourceManager.shaders[name]
+        reloaded = ResourceManager.loadShaderFromFile(
+            *ResourceManager.shader_files[name])
+        if not reloaded.isLinked():
+            glDeleteProgram(reloaded.id)
+            return False
+        reloaded.copyUniforms(shader)
+        glDeleteProgram(shader.id)
+        shader.id = reloaded.id
+        return True
+
     # retrieves a stored sader
     @staticmethod
     def getShader(name: str) -> Shader:
@@ -42,6 +83,38 @@ class ResourceManager:
     def getTexture(name: str) -> Texture2D:
         return ResourceManager.textures[name]
 
+    # returns the asset cache (None if disabled)
+    @staticmethod
+    def assetCache() -> AssetCache:
+        if ResourceManager.asset_cache_dir is None:
+            return None
+        cache = ResourceManager.asset_cache
+        if cache is None or cache.directory != ResourceManager.asset_cache_dir:
+            cache = AssetCache(ResourceManager.asset_cache_dir)
+            ResourceManager.asset_cache = cache
+        return cache
+
+    # loads a sound effect (the mixer has to be initialized)
+    @staticmethod
+    def loadSound(file: str) -> "mixer.Sound":
+        cache = ResourceManager.assetCache()
+        if cache is None:
+            return mixer.Sound(file=openAsset(file))
+        return cache.sound(file)
+
+    # loads music to stream with mixer.music
+    @staticmethod
+    def loadMusic(file: str) -> None:
+        cache = ResourceManager.assetCache()
+        if cache is not None:
+            decoded = cache.music(file)
+            if decoded != file:
+                mixer.music.load(decoded)
+                return
+        ResourceManager.music_file = openAsset(file)
+        mixer.music.load(ResourceManager.music_file,
+                         os.path.splitext(file)[1].lstrip("."))
+
     # properly de-allocates all loaded resources
     @staticmethod
     def clear() -> None:
@@ -55,27 +128,78 @@ class ResourceManager:
     # loads and generates a shader from file
     @staticmethod
     def loadShaderFromFile(vShaderFile: str, fShaderFile: str,
-                           gShaderFile: str = None) -> Shader:
+                           gShaderFile: str = None,
+                           defines: list[str] = None) -> Shader:
         # 1. retrieve the vertex/fragment source code from filePath
         try:
-            # open files
-            with open(vShaderFile) as file:
-                vertex_code = file.read()
-            with open(fShaderFile) as file:
-                fragment_code = file.read()
+            # read files (from the asset archive if one is mounted)
+            vertex_code = readText(vShaderFile)
+            fragment_code = readText(fShaderFile)
             geometry_code = None
             # if geometry shader path is present, also load a geometry shader
             if gShaderFile is not None:
-                with open(gShaderFile) as file:
-                    geometry_code = file.read()
+                geometry_code = readText(gShaderFile)
         except:
             print("ERROR::SHADER: Failed to read shader files")
 
         # 2. now create shader object from source code
         shader = Shader()
+        if defines:
+            vertex_code = Shader.define(vertex_code, defines)
+            fragment_code = Shader.define(fragment_code, defines)
+            if geometry_code is not None:
+                geometry_code = Shader.define(geometry_code, defines)
+        # reuse the linked program from a previous run if possible
+        cache_file = ResourceManager.shaderCacheFile(
+            vertex_code, fragment_code, geometry_code)
+        # (a cache that can't be read or written is skipped)
+        data = b""
+        if cache_file is not None and os.path.exists(cache_file):
+            try:
+                with open(cache_file, "rb") as file:
+                    data = file.read()
+            except OSError:
+                pass
+        if len(data) > 4:
+            binary_format, = struct.unpack_from("<I", data)
+            if shader.loadBinary(binary_format, data[4:]):
+                return shader
         shader.compile(vertex_code, fragment_code, geometry_code)
+        if cache_file is not None and shader.isLinked():
+            binary_format, binary = shader.getBinary()
+            if len(binary) > 0:
+                # write to a temporary file first so an interrupted write
+                # never leaves a truncated binary behind
+                try:
+                    os.makedirs(ResourceManager.shader_cache_dir,
+                                exist_ok=True)
+                    with open(cache_file + ".tmp", "wb") as file:
+                        file.write(struct.pack("<I", binary_format) + binary)
+                    os.replace(cache_file + ".tmp", cache_file)
+                except OSError:
+                    pass
         return shader
 
+    # returns the cache file for a program built from the given sources,
+    # keyed by the sources and the driver (binaries are only valid for the
+    # driver that produced them), or None if caching isn't possible
+    @staticmethod
+    def shaderCacheFile(vertex_code: str, fragment_code: str,
+                        geometry_code: str) -> str:
+        if ResourceManager.shader_cache_dir is None:
+            return None
+        if glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) == 0:
+            return None
+        key = hashlib.sha256()
+        for source in (vertex_code, fragment_code, geometry_code or ""):
+            key.update(source.encode())
+            key.update(b"\0")
+        for name in (GL_VENDOR, GL_RENDERER, GL_VERSION):
+            key.update(glGetString(name) or b"")
+            key.update(b"\0")
+        return os.path.join(ResourceManager.shader_cache_dir,
+                            key.hexdigest() + ".bin")
+
     # loads a single texture from file
     @staticmethod
     def loadTextureFromFile(file: str, alpha: bool) -> Texture2D:
@@ -84,10 +208,14 @@ class ResourceManager:
         if alpha:
             texture.internal_format = GL_RGBA32F
             texture.image_format = GL_RGBA
-        # load image
-        image = Image.open(file)
-        width, height = image.size
-        channels = len(image.getbands())
+        # load image (decoded texels straight from the cache if possible)
+        cache = ResourceManager.assetCache()
+        if cache is not None:
+            width, height, data = cache.texture(file, alpha)
+        else:
+            image = Image.open(openAsset(file))
+            width, height = image.size
+            data = image.tobytes()
         # now generate texture
-        texture.generate(width, height, image.tobytes())
+        texture.generate(width, height, data)
         return texture
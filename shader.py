@@ -1,4 +1,5 @@
 from OpenGL.GL import *
+from OpenGL.error import GLError
 import glm
 
 
@@ -10,6 +11,16 @@ class Shader:
         glUseProgram(self.id)
         return self
 
+    # returns the source with a #define line for each of the given names
+    # inserted right after the #version directive
+    @staticmethod
+    def define(source: str, defines: list[str]) -> str:
+        lines = "".join("#define {}\n".format(d) for d in defines)
+        version, newline, body = source.partition("\n")
+        if not version.lstrip().startswith("#version"):
+            return lines + source
+        return version + newline + lines + body
+
     # compiles the shader from given source code
     def compile(self, vertex_source: str, fragment_source: str,
                 geometry_source: str) -> None:
@@ -31,6 +42,9 @@ class Shader:
             self.checkCompileErrors(g_shader, "GEOMETRY")
         # shader program
         self.id = glCreateProgram()
+        # allow retrieving the linked binary for the program cache
+        glProgramParameteri(self.id, GL_PROGRAM_BINARY_RETRIEVABLE_HINT,
+                            GL_TRUE)
         glAttachShader(self.id, s_vertex)
         glAttachShader(self.id, s_fragment)
         if geometry_source is not None:
@@ -44,6 +58,64 @@ class Shader:
         if geometry_source is not None:
             glDeleteShader(g_shader)
 
+    # whether the program linked successfully
+    def isLinked(self) -> bool:
+        return bool(glGetProgramiv(self.id, GL_LINK_STATUS))
+
+    # copies the current values of the uniforms this program shares with
+    # other, e.g. to carry state set once at startup (projection, samplers)
+    # over to a recompiled program
+    def copyUniforms(self, other: "Shader") -> None:
+        data = (GLfloat * 16)()
+        int_data = (GLint * 1)()
+        for i in range(glGetProgramiv(self.id, GL_ACTIVE_UNIFORMS)):
+            name, size, type = glGetActiveUniform(self.id, i)
+            location = glGetUniformLocation(self.id, name)
+            other_location = glGetUniformLocation(other.id, name)
+            if location < 0 or other_location < 0 or size != 1:
+                continue
+            if type in (GL_INT, GL_BOOL, GL_SAMPLER_2D):
+                glGetUniformiv(other.id, other_location, int_data)
+                glProgramUniform1i(self.id, location, int_data[0])
+                continue
+            glGetUniformfv(other.id, other_location, data)
+            if type == GL_FLOAT:
+                glProgramUniform1fv(self.id, location, 1, data)
+            elif type == GL_FLOAT_VEC2:
+                glProgramUniform2fv(self.id, location, 1, data)
+            elif type == GL_FLOAT_VEC3:
+                glProgramUniform3fv(self.id, location, 1, data)
+            elif type == GL_FLOAT_VEC4:
+                glProgramUniform4fv(self.id, location, 1, data)
+            elif type == GL_FLOAT_MAT4:
+                glProgramUniformMatrix4fv(self.id, location, 1, False, data)
+
+    # creates the program from a binary previously returned by getBinary();
+    # returns False (leaving no program behind) if the driver rejects it,
+    # in which case the program has to be compiled from source instead
+    def loadBinary(self, binary_format: int, binary: bytes) -> bool:
+        program = glCreateProgram()
+        data = (ctypes.c_ubyte * len(binary)).from_buffer_copy(binary)
+        try:
+            glProgramBinary(program, binary_format, data, len(binary))
+        except GLError:
+            glDeleteProgram(program)
+            return False
+        if not glGetProgramiv(program, GL_LINK_STATUS):
+            glDeleteProgram(program)
+            return False
+        self.id = program
+        return True
+
+    # retrieves the linked program as (binary format, binary)
+    def getBinary(self) -> tuple[int, bytes]:
+        length = glGetProgramiv(self.id, GL_PROGRAM_BINARY_LENGTH)
+        data = (ctypes.c_ubyte * length)()
+        written = GLsizei()
+        binary_format = GLenum()
+        glGetProgramBinary(self.id, length, written, binary_format, data)
+        return binary_format.value, bytes(data[:written.value])
+
     def setFloat(self, name: str, value: float, use_shader=False) -> None:
         if use_shader:
             self.use()
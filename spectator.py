@@ -0,0 +1,468 @@
+import argparse
+import asyncio
+import collections
+import struct
+import sys
+import threading
+import time
+
+import glfw
+import glm
+import numpy as np
+
+from autopilot import Autopilot
+from game import Game, GameState, PowerUp, POWERUP_TYPES
+from game_snapshot import (POWERUP_NAMES, FLAG_CONFUSE, FLAG_CHAOS,
+                           FLAG_SHAKE, FLAG_STUCK, FLAG_PASS_THROUGH,
+                           loadSnapshot, saveSnapshot)
+from resource_manager import ResourceManager
+
+
+# Streams live games over TCP. SpectatorServer runs the simulation at a
+# fixed tick and broadcasts its state to every connected client; one
+# client at a time may also send input and play (otherwise the autopilot
+# plays). There is a single pad, so there is no versus mode: the first
+# client to send input plays until it disconnects. Clients first get a keyframe (a full game snapshot, see
+# game_snapshot) and from then on one delta per tick holding only what
+# changed: the bricks whose state differs from the previous tick and
+# quantized positions of the balls, pad and powerups. Each delta is encoded
+# once and the same bytes are written to every client; clients that fall
+# behind skip deltas and get a fresh keyframe once they caught up.
+# SpectatorClient receives the stream on a background thread and applies
+# it to a local Game (loaded with the same levels) on the render thread,
+# interpolating positions between ticks; it disconnects on a message it
+# can't decode.
+#
+# Messages: <uint8 type, uint32 length> followed by length bytes. A peer
+# announcing a longer message than the receiver accepts is disconnected.
+
+MESSAGE = struct.Struct("<BI")
+# longest message a client accepts from the server (keyframes are the
+# largest), and a server from a client (input only)
+MAX_MESSAGE = 16 * 1024 * 1024
+MAX_INPUT_MESSAGE = 64
+KEYFRAME = 0
+DELTA = 1
+INPUT = 2
+
+# tick number, followed by a game snapshot
+KEYFRAME_HEADER = struct.Struct("<I")
+# tick, state, level, flags, lives, score, changed bricks
+DELTA_HEADER = struct.Struct("<IBIBiiI")
+# ball position and velocity, pad x and width (quantized)
+DELTA_OBJECTS = struct.Struct("<6h")
+# extra balls, powerups
+DELTA_COUNTS = struct.Struct("<HB")
+# type, flags, position (quantized)
+DELTA_POWERUP = struct.Struct("<BB2h")
+# held keys (bits: left, right, fire, enter)
+INPUT_KEYS = struct.Struct("<B")
+
+# positions are sent in 1/8 units, velocities in 1/4 units per second
+POSITION_SCALE = 8.0
+VELOCITY_SCALE = 4.0
+# scale of each of DELTA_OBJECTS' values
+OBJECT_SCALE = np.array((POSITION_SCALE, POSITION_SCALE, VELOCITY_SCALE,
+                         VELOCITY_SCALE, POSITION_SCALE, POSITION_SCALE),
+                        dtype=np.float32)
+
+
+def quantize(values, scale) -> np.ndarray:
+    return np.clip(np.round(np.asarray(values, dtype=np.float32) * scale),
+                   -32768, 32767).astype("<i2")
+
+
+def message(type: int, payload: bytes) -> bytes:
+    return MESSAGE.pack(type, len(payload)) + payload
+
+
+# reads one message; raises ValueError if it is longer than max_length
+async def readMessage(reader: asyncio.StreamReader,
+                      max_length: int = MAX_MESSAGE) -> tuple[int, bytes]:
+    type, length = MESSAGE.unpack(await reader.readexactly(MESSAGE.size))
+    if length > max_length:
+        raise ValueError("message of {} bytes is too long".format(length))
+    return type, await reader.readexactly(length)
+
+
+# encodes the delta between the state of the bricks last sent
+# (destroyed, hits) and the game's current state
+def encodeDelta(game: Game, tick: int, destroyed: np.ndarray,
+                hits: np.ndarray) -> bytes:
+    level = game.levels[game.level]
+    changed = np.flatnonzero((level.brick_destroyed != destroyed)
+                             | (level.brick_hits != hits)).astype("<u4")
+    flags = ((FLAG_CONFUSE if game.effects.confuse else 0)
+             | (FLAG_CHAOS if game.effects.chaos else 0)
+             | (FLAG_SHAKE if game.effects.shake else 0)
+             | (FLAG_STUCK if game.ball.stuck else 0)
+             | (FLAG_PASS_THROUGH if game.ball.pass_through else 0))
+    ball, player = game.ball, game.player
+    objects = quantize((ball.position.x, ball.position.y,
+                        ball.velocity.x, ball.velocity.y,
+                        player.position.x, player.size.x), OBJECT_SCALE)
+    balls = game.balls.active()
+    powerups = [p for p in game.powerups if not p.destroyed][:255]
+    parts = [
+        DELTA_HEADER.pack(tick, game.state.value, game.level, flags,
+                          game.lives, game.score, len(changed)),
+        objects.tobytes(),
+        changed.tobytes(),
+        level.brick_destroyed[changed].astype(np.uint8).tobytes(),
+        np.clip(level.brick_hits[changed], 0, 255).astype(np.uint8).tobytes(),
+        DELTA_COUNTS.pack(len(balls), len(powerups)),
+        quantize(game.balls.position[balls], POSITION_SCALE).tobytes()
+    ]
+    for powerup in powerups:
+        x, y = quantize((powerup.position.x, powerup.position.y),
+                        POSITION_SCALE).tolist()
+        parts.append(DELTA_POWERUP.pack(POWERUP_NAMES.index(powerup.type),
+                                        powerup.activated, x, y))
+    return b"".join(parts)
+
+
+# a decoded delta: everything but the bricks, which are applied right away;
+# raises ValueError (or struct.error) if the payload isn't a valid delta
+class DeltaState:
+    def __init__(self, payload: bytes) -> None:
+        view = memoryview(payload)
+        (self.tick, state, self.level, self.flags, self.lives,
+         self.score, changed) = DELTA_HEADER.unpack_from(view, 0)
+        self.state = GameState(state)
+        offset = DELTA_HEADER.size
+        objects = np.frombuffer(view, "<i2", 6, offset) / OBJECT_SCALE
+        offset += DELTA_OBJECTS.size
+        self.ball_position = objects[0:2]
+        self.ball_velocity = objects[2:4]
+        self.player_x, self.player_width = objects[4], objects[5]
+        self.changed = np.frombuffer(view, "<u4", changed, offset)
+        offset += changed * 4
+        self.destroyed = np.frombuffer(view, np.uint8, changed,
+                                       offset).astype(bool)
+        offset += changed
+        self.hits = np.frombuffer(view, np.uint8, changed, offset)
+        offset += changed
+        ball_count, powerup_count = DELTA_COUNTS.unpack_from(view, offset)
+        offset += DELTA_COUNTS.size
+        self.balls = np.frombuffer(view, "<i2", ball_count * 2, offset
+                                   ).reshape(-1, 2) / POSITION_SCALE
+        offset += ball_count * 4
+        self.powerups = [
+            DELTA_POWERUP.unpack_from(view, offset + i * DELTA_POWERUP.size)
+            for i in range(powerup_count)]
+        if any(powerup[0] >= len(POWERUP_NAMES) for powerup in self.powerups):
+            raise ValueError("unknown powerup in delta")
+
+
+# a connected client
+class Connection:
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.needs_keyframe = True
+
+
+class SpectatorServer:
+    def __init__(self, game: Game, tick_rate: float = 60.0,
+                 max_buffer: int = 64 * 1024) -> None:
+        self.game = game
+        self.dt = 1.0 / tick_rate
+        # clients with more than max_buffer bytes unsent are skipped
+        self.max_buffer = max_buffer
+        self.autopilot = Autopilot(game)
+        self.connections: set[Connection] = set()
+        self.handlers: set[asyncio.Task] = set()
+        # the client currently playing, and the keys it holds
+        self.player: Connection = None
+        self.player_keys = 0
+        self.tick = 0
+        # brick state as of the last delta
+        self.level_key = None
+        self.destroyed = np.zeros(0, dtype=bool)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.server: asyncio.AbstractServer = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        for connection in list(self.connections):
+            connection.writer.close()
+        # closing the connections ends their handlers
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    # serves one client: the stream goes out from broadcast(), this only
+    # reads its input
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        connection = Connection(writer)
+        self.connections.add(connection)
+        self.handlers.add(asyncio.current_task())
+        try:
+            while True:
+                type, payload = await readMessage(reader, MAX_INPUT_MESSAGE)
+                if type != INPUT:
+                    continue
+                if self.player is None:
+                    self.player = connection
+                if self.player is connection:
+                    self.player_keys = INPUT_KEYS.unpack(payload)[0]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, struct.error):
+            pass  # malformed input: drop the client
+        finally:
+            self.handlers.discard(asyncio.current_task())
+            self.connections.discard(connection)
+            if self.player is connection:
+                self.player = None
+                self.player_keys = 0
+            writer.close()
+
+    # runs the simulation and broadcasts its state until cancelled
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            self.update()
+            self.broadcast()
+            next_tick += self.dt
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    # advances the game by one tick
+    def update(self) -> None:
+        game = self.game
+        self.tick += 1
+        glfw.set_time(self.tick * self.dt)
+        if self.player is None:
+            self.autopilot.control(self.dt)
+        else:
+            keys = self.player_keys
+            for bit, key in enumerate((glfw.KEY_A, glfw.KEY_D,
+                                       glfw.KEY_SPACE, glfw.KEY_ENTER)):
+                down = bool(keys & (1 << bit))
+                if game.keys[key] and not down:
+                    game.keys_processed[key] = False
+                game.keys[key] = down
+        game.processInput(self.dt)
+        game.update(self.dt)
+        game.recordFrame(self.dt)
+
+    # sends the current state to every client
+    def broadcast(self) -> None:
+        game = self.game
+        level = game.levels[game.level]
+        key = (game.level, id(level), level.revision)
+        keyframe = None
+        if key != self.level_key:
+            # new or reloaded level: everyone starts over from a keyframe
+            self.level_key = key
+            self.destroyed = level.brick_destroyed.copy()
+            self.hits = level.brick_hits.copy()
+            for connection in self.connections:
+                connection.needs_keyframe = True
+        delta = message(DELTA, encodeDelta(game, self.tick, self.destroyed,
+                                           self.hits))
+        self.destroyed = level.brick_destroyed.copy()
+        self.hits = level.brick_hits.copy()
+        for connection in list(self.connections):
+            transport = connection.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                # too far behind for deltas to make sense
+                connection.needs_keyframe = True
+                continue
+            if connection.needs_keyframe:
+                if keyframe is None:
+                    keyframe = message(KEYFRAME, KEYFRAME_HEADER.pack(
+                        self.tick) + saveSnapshot(game))
+                connection.writer.write(keyframe)
+                connection.needs_keyframe = False
+            else:
+                connection.writer.write(delta)
+
+
+# SpectatorClient connects to a SpectatorServer on a background thread;
+# call apply() once per frame on the render thread
+class SpectatorClient:
+    def __init__(self, host: str, port: int, play: bool = False,
+                 tick_rate: float = 60.0) -> None:
+        self.host = host
+        self.port = port
+        self.play = play
+        # positions are shown this far in the past so there are always two
+        # ticks to interpolate between
+        self.delay = 2.0 / tick_rate
+        self.lock = threading.Lock()
+        # received (time, type, payload), oldest first
+        self.inbox: collections.deque = collections.deque()
+        self.keys = 0
+        self.sent_keys = -1
+        # (receive time, DeltaState) of the last two deltas
+        self.states: collections.deque = collections.deque(maxlen=2)
+        self.connected = threading.Event()
+        self.closed = False
+        self.loop: asyncio.AbstractEventLoop = None
+        self.writer: asyncio.StreamWriter = None
+        self.thread = threading.Thread(target=self.runThread,
+                                       name="spectator", daemon=True)
+        self.thread.start()
+
+    def runThread(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.receive())
+        finally:
+            self.closed = True
+            self.loop.close()
+
+    async def receive(self) -> None:
+        reader, self.writer = await asyncio.open_connection(self.host,
+                                                            self.port)
+        self.connected.set()
+        try:
+            while True:
+                type, payload = await readMessage(reader)
+                with self.lock:
+                    self.inbox.append((time.perf_counter(), type, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            print("ERROR::SPECTATOR: Invalid message from server, "
+                  "disconnecting", e)
+        finally:
+            self.writer.close()
+
+    # sends the held keys (bits: left, right, fire, enter) if playing
+    def sendKeys(self, keys: int) -> None:
+        if not self.play or keys == self.sent_keys or self.writer is None:
+            return
+        self.sent_keys = keys
+        data = message(INPUT, INPUT_KEYS.pack(keys))
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+
+    def close(self) -> None:
+        if self.writer is not None and not self.closed:
+            self.loop.call_soon_threadsafe(self.writer.close)
+        self.thread.join(1.0)
+
+    # applies everything received so far to the game and interpolates the
+    # moving objects for the current frame
+    def apply(self, game: Game, dt: float) -> None:
+        if self.play:
+            self.sendKeys(sum(1 << bit for bit, key in enumerate(
+                (glfw.KEY_A, glfw.KEY_D, glfw.KEY_SPACE, glfw.KEY_ENTER))
+                if game.keys[key]))
+        with self.lock:
+            received = list(self.inbox)
+            self.inbox.clear()
+        try:
+            for receive_time, type, payload in received:
+                if type == KEYFRAME:
+                    loadSnapshot(game, payload[KEYFRAME_HEADER.size:])
+                    self.states.clear()
+                elif type == DELTA:
+                    state = DeltaState(payload)
+                    if (state.level >= len(game.levels)
+                            or len(state.balls) > game.balls.capacity):
+                        raise ValueError("delta doesn't fit the game")
+                    if (state.level == game.level and len(state.changed) > 0
+                            and state.changed.max()
+                            >= game.levels[game.level].brickCount()):
+                        raise ValueError("delta doesn't match the level")
+                    if len(state.changed) > 0 and state.level == game.level:
+                        game.levels[game.level].setBricks(
+                            state.changed, state.destroyed, state.hits)
+                    self.states.append((receive_time, state))
+        except (ValueError, struct.error) as e:
+            print("ERROR::SPECTATOR: Invalid message from server, "
+                  "disconnecting", e)
+            self.play = False
+            self.close()
+            return
+        if len(self.states) == 0:
+            return
+        # interpolate between the last two deltas
+        now = time.perf_counter() - self.delay
+        t1, new = self.states[-1]
+        t0, old = self.states[0]
+        if t1 > t0:
+            a = min(max((now - t0) / (t1 - t0), 0.0), 1.0)
+        else:
+            a = 1.0
+        self.show(game, old, new, a)
+        game.particles.update(dt, game.ball, 2, glm.vec2(game.ball.radius / 2.0))
+
+    # shows the state a of the way from old to new
+    def show(self, game: Game, old: DeltaState, new: DeltaState,
+             a: float) -> None:
+        game.state = new.state
+        game.level = new.level
+        game.lives = new.lives
+        game.score = new.score
+        game.effects.confuse = bool(new.flags & FLAG_CONFUSE)
+        game.effects.chaos = bool(new.flags & FLAG_CHAOS)
+        game.effects.shake = bool(new.flags & FLAG_SHAKE)
+        game.ball.stuck = bool(new.flags & FLAG_STUCK)
+        game.ball.pass_through = bool(new.flags & FLAG_PASS_THROUGH)
+        ball = old.ball_position + (new.ball_position - old.ball_position) * a
+        # don't smear the ball across a reset
+        if np.abs(new.ball_position - old.ball_position).max() > 100.0:
+            ball = new.ball_position
+        game.ball.position = glm.vec2(*ball.tolist())
+        game.ball.velocity = glm.vec2(*new.ball_velocity.tolist())
+        game.player.position.x = float(old.player_x
+                                       + (new.player_x - old.player_x) * a)
+        game.player.size.x = float(new.player_width)
+        balls = new.balls
+        if len(old.balls) == len(balls):
+            balls = old.balls + (balls - old.balls) * a
+        game.balls.clear()
+        game.balls.alive[:len(balls)] = True
+        game.balls.position[:len(balls)] = balls
+        game.powerups = []
+        for type, activated, x, y in new.powerups:
+            name = POWERUP_NAMES[type]
+            color, duration, texture = POWERUP_TYPES[name]
+            powerup = PowerUp(name, color, duration,
+                              glm.vec2(x, y) / POSITION_SCALE,
+                              ResourceManager.getTexture(texture))
+            game.powerups.append(powerup)
+
+
+async def serve(game: Game, host: str, port: int, tick_rate: float) -> None:
+    server = SpectatorServer(game, tick_rate)
+    port = await server.start(host, port)
+    print("Serving on {}:{}".format(host, port))
+    try:
+        await server.run()
+    finally:
+        await server.stop()
+
+
+def main(argv: list[str]) -> int:
+    from headless import createHiddenWindow
+    parser = argparse.ArgumentParser(description="Run a Breakout spectator "
+                                     "server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--tick-rate", type=float, default=60.0)
+    args = parser.parse_args(argv)
+    window = createHiddenWindow(800, 600)
+    game = Game(800, 600)
+    game.init()
+    try:
+        asyncio.run(serve(game, args.host, args.port, args.tick_rate))
+    except KeyboardInterrupt:
+        pass
+    ResourceManager.clear()
+    glfw.destroy_window(window)
+    glfw.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,74 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+# time the game started (as early as this module is imported)
+start = time.perf_counter()
+# print every mark as it happens (--startup-report)
+verbose = False
+# (what, seconds since start) in the order they happened
+marks: list[tuple[str, float]] = []
+# seconds spent importing each lazily imported module
+import_times: dict[str, float] = {}
+lock = threading.Lock()
+
+# pygame greets on import, don't
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+
+# records that a step of startup finished (from any thread)
+def mark(what: str) -> None:
+    elapsed = time.perf_counter() - start
+    with lock:
+        marks.append((what, elapsed))
+    if verbose:
+        print("startup: {:8.1f} ms  {}".format(elapsed * 1000.0, what))
+
+
+# LazyModule stands in for a module that is only imported when one of its
+# attributes is first used; its attributes are then copied over, so later
+# lookups cost as much as on the module itself.
+class LazyModule:
+    def __init__(self, name: str) -> None:
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attribute: str):
+        name = self.__dict__["_name"]
+        # another thread may be importing it already, only time the first
+        loaded = name in sys.modules
+        begin = time.perf_counter()
+        module = importlib.import_module(name)
+        if not loaded:
+            with lock:
+                import_times.setdefault(name, time.perf_counter() - begin)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+    def __setattr__(self, attribute: str, value) -> None:
+        setattr(importlib.import_module(self.__dict__["_name"]), attribute,
+                value)
+        self.__dict__[attribute] = value
+
+
+# a module to be imported on first use, e.g. mixer = lazyImport("pygame.mixer")
+def lazyImport(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+# the marks so far and the lazily imported modules, slowest first
+def report() -> str:
+    with lock:
+        lines = ["startup (ms since start, step):"]
+        previous = 0.0
+        for what, elapsed in marks:
+            lines.append("  {:8.1f} (+{:7.1f})  {}".format(
+                elapsed * 1000.0, (elapsed - previous) * 1000.0, what))
+            previous = elapsed
+        lines.append("lazy imports (ms):")
+        for name, seconds in sorted(import_times.items(),
+                                    key=lambda item: -item[1]):
+            lines.append("  {:8.1f}  {}".format(seconds * 1000.0, name))
+    lines.append("(run with python -X importtime for every module)")
+    return "\n".join(lines)
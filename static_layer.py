@@ -0,0 +1,110 @@
+import math
+
+import glm
+import numpy as np
+from OpenGL.GL import *
+
+from brick_renderer import BrickRenderer
+from game_level import GameLevel
+from sprite_renderer import SpriteRenderer
+from texture2d import Texture2D
+
+
+# StaticLayer caches everything that doesn't move (the background and
+# the level's bricks) in an offscreen texture. The texture is fully
+# re-rendered only when the level changes or is reset; destroyed or
+# damaged bricks are patched by redrawing just the rectangle around them.
+# Each frame then only needs to composite the texture.
+# width/height are the logical size of the layer, the texture itself is
+# allocated at the pixel resolution given to resize().
+class StaticLayer:
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        # level (and its revision) the cached texture currently shows
+        self.level: GameLevel = None
+        self.revision = -1
+        self.texture: Texture2D = None
+        self.fbo = GLuint()
+        glCreateFramebuffers(1, self.fbo)
+        self.resize(width, height)
+
+    # reallocates the cached texture at the given pixel resolution
+    def resize(self, width: int, height: int) -> None:
+        width = max(1, width)
+        height = max(1, height)
+        if (self.texture is not None and self.texture.width == width
+                and self.texture.height == height):
+            return
+        if self.texture is not None:
+            glDeleteTextures(1, self.texture.tex_id)
+        self.texture = Texture2D()
+        self.texture.internal_format = GL_RGB8
+        self.texture.wrap_s = GL_CLAMP_TO_EDGE
+        self.texture.wrap_t = GL_CLAMP_TO_EDGE
+        self.texture.generate(width, height, None)
+        glNamedFramebufferTexture(
+            self.fbo, GL_COLOR_ATTACHMENT0, self.texture.tex_id, 0)
+        if (glCheckNamedFramebufferStatus(self.fbo, GL_FRAMEBUFFER)
+                != GL_FRAMEBUFFER_COMPLETE):
+            print("ERROR::STATICLAYER: Failed to initialize FBO")
+        self.invalidate()
+
+    # forces a full re-render on the next update
+    def invalidate(self) -> None:
+        self.level = None
+
+    # brings the cached texture up to date with the given level, rendering
+    # into it only if something changed since the last update
+    def update(self, renderer: SpriteRenderer, bricks: BrickRenderer,
+               background: Texture2D, level: GameLevel) -> None:
+        full = self.level is not level or self.revision != level.revision
+        if not full and len(level.dirty_bricks) == 0:
+            return
+        # remember which framebuffer and viewport to restore afterwards
+        previous = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.texture.width, self.texture.height)
+        if full:
+            renderer.drawSprite(background, glm.vec2(0.0, 0.0),
+                                glm.vec2(self.width, self.height), 0.0)
+            bricks.drawLevel(level)
+        else:
+            # tiles never overlap, so only the changed bricks' pixels need
+            # redrawing: the background and the bricks, clipped to one
+            # rectangle around all changed bricks (so breaking many bricks
+            # in a frame still costs a single draw)
+            bricks.updateBricks(level, level.dirty_bricks)
+            glEnable(GL_SCISSOR_TEST)
+            dirty = np.array(level.dirty_bricks)
+            lower = level.brick_position[dirty].min(axis=0)
+            upper = (level.brick_position[dirty]
+                     + level.brick_size[dirty]).max(axis=0)
+            scale_x = self.texture.width / self.width
+            scale_y = self.texture.height / self.height
+            # rectangle in texture pixels: every pixel a changed tile
+            # touches, and no more
+            x = math.floor(float(lower[0]) * scale_x)
+            y = math.floor(float(lower[1]) * scale_y)
+            w = math.ceil(float(upper[0]) * scale_x) - x
+            h = math.ceil(float(upper[1]) * scale_y) - y
+            # scissor box is in framebuffer coordinates (origin at the
+            # bottom-left)
+            glScissor(x, self.texture.height - y - h, w, h)
+            renderer.drawSprite(background, glm.vec2(0.0, 0.0),
+                                glm.vec2(self.width, self.height), 0.0)
+            bricks.drawLevel(level)
+            glDisable(GL_SCISSOR_TEST)
+        level.dirty_bricks.clear()
+        self.level = level
+        self.revision = level.revision
+        glBindFramebuffer(GL_FRAMEBUFFER, previous)
+        glViewport(*viewport)
+
+    # composites the cached layer as a screen-sized sprite
+    def draw(self, renderer: SpriteRenderer) -> None:
+        # the texture's first row is the bottom of the screen, so draw it
+        # flipped vertically
+        renderer.drawSprite(self.texture, glm.vec2(0.0, self.height),
+                            glm.vec2(self.width, -self.height), 0.0)
@@ -0,0 +1,68 @@
+import numpy as np
+from OpenGL.GL import *
+
+
+# StreamBuffer is a persistently mapped ring buffer for vertex data that
+# changes every frame. The buffer is split into regions (3 by default,
+# i.e. triple-buffered); allocations are handed out linearly as NumPy
+# views straight into the mapped memory, so data is written to the GPU
+# without intermediate copies. When the current region is full a fence is
+# placed behind it and writing continues in the next region, waiting only
+# if the GPU is still reading that one.
+class StreamBuffer:
+    # allocations are aligned so any offset is a whole vec4 vertex
+    alignment = 16
+
+    def __init__(self, region_size: int, regions: int = 3) -> None:
+        self.region_size = region_size
+        self.regions = regions
+        size = region_size * regions
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.buffer = GLuint()
+        glCreateBuffers(1, self.buffer)
+        glNamedBufferStorage(self.buffer, size, None, flags)
+        pointer = glMapNamedBufferRange(self.buffer, 0, size, flags)
+        address = ctypes.cast(pointer, ctypes.c_void_p).value
+        # float view of the whole mapped range
+        self.data = np.ctypeslib.as_array(
+            (ctypes.c_float * (size // 4)).from_address(address))
+        self.fences = [None] * regions
+        self.region = 0
+        self.head = 0
+
+    # returns (byte offset, float32 view) of count floats to write this
+    # frame's data to
+    def allocate(self, count: int) -> tuple[int, np.ndarray]:
+        size = count * 4
+        if size > self.region_size:
+            raise ValueError("StreamBuffer: allocation of {} bytes exceeds "
+                             "region size {}".format(size, self.region_size))
+        if self.head + size > (self.region + 1) * self.region_size:
+            # the GPU may still read the region we leave until the commands
+            # issued so far are complete
+            self.fences[self.region] = glFenceSync(
+                GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            self.region = (self.region + 1) % self.regions
+            self.head = self.region * self.region_size
+            self.waitRegion(self.region)
+        offset = self.head
+        self.head += -(-size // self.alignment) * self.alignment
+        return offset, self.data[offset // 4:offset // 4 + count]
+
+    # blocks until the GPU is done reading the given region
+    def waitRegion(self, region: int) -> None:
+        fence = self.fences[region]
+        if fence is None:
+            return
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT,
+                               1000000) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+        self.fences[region] = None
+
+    # releases the buffer and any pending fences
+    def delete(self) -> None:
+        for region in range(self.regions):
+            self.waitRegion(region)
+        glUnmapNamedBuffer(self.buffer)
+        glDeleteBuffers(1, self.buffer)
@@ -1,27 +1,33 @@
+import threading
+
 import glm
-import freetype
+import numpy as np
 
 from OpenGL.GL import *
 
+import startup
+from asset_archive import openAsset
+from glyph_atlas import Character, GlyphAtlas
 from resource_manager import ResourceManager
+from startup import lazyImport
+from stream_buffer import StreamBuffer
+
+# imported when the first font is opened
+freetype = lazyImport("freetype")
 
 
-# Holds all state information relevant to a character as loaded using FreeType
-class Character:
-    def __init__(self, texture_id, size, bearing, advance) -> None:
-        # ID handle of the glyph texture
-        self.texture_id = texture_id
-        # size of glyph
-        self.size = size
-        # offset from baseline to left/top of glyph
-        self.bearing = bearing
-        # horizontal offset to advance to next glyph
-        self.advance = advance
+# corners of a glyph quad (two triangles) as <vec2 pos, vec2 tex> in unit
+# space; scaled and offset per glyph
+GLYPH_QUAD = np.array([
+    (0.0, 1.0), (1.0, 0.0), (0.0, 0.0),
+    (0.0, 1.0), (1.0, 1.0), (1.0, 0.0)
+], dtype=np.float32)
 
 
 #  A renderer class for rendering text displayed by a font loaded using the
-# FreeType library. A single font is loaded, processed into a list of
-# Character items for later rendering.
+# FreeType library. Glyphs are rasterized on first use (any character the
+# font has, not just ASCII) into a GlyphAtlas shared by all loaded fonts
+# and sizes, so each string is drawn with a single draw call.
 class TextRenderer:
     def __init__(self, width: int, height: int) -> None:
         # load and configure shader
@@ -31,94 +37,221 @@ class TextRenderer:
         self.text_shader.setMatrix4("projection",
                                     glm.ortho(0.0, width, height, 0.0))
         self.text_shader.setInteger("text", 0)
-        # configure VAO/VBO for texture quads
+        # configure VAO/VBO for texture quads; the quads of each string are
+        # streamed into a persistently mapped buffer
         self.vao = GLuint()
         glCreateVertexArrays(1, self.vao)
-        self.vbo = GLuint()
-        glCreateBuffers(1, self.vbo)
-        glNamedBufferStorage(self.vbo, sizeof(GLfloat) * 6 * 4, None,
-                             GL_DYNAMIC_STORAGE_BIT)
-        glVertexArrayVertexBuffer(self.vao, 0, self.vbo, 0,
+        self.stream = StreamBuffer(64 * 1024)
+        glVertexArrayVertexBuffer(self.vao, 0, self.stream.buffer, 0,
                                   4 * sizeof(GLfloat))
         glVertexArrayAttribFormat(self.vao, 0, 4, GL_FLOAT, GL_FALSE, 0)
         glVertexArrayAttribBinding(self.vao, 0, 0)
         glEnableVertexArrayAttrib(self.vao, 0)
 
-        # holds a list of pre-compiled Characters
-        self.Characters:dict[str, Character] = {}
+        self.atlas = GlyphAtlas()
+        # FreeType faces by font file, and the font (file, size) used when
+        # none is given
+        self.faces: dict[str, freetype.Face] = {}
+        # fonts being opened in the background, and their threads
+        self.opening: set[str] = set()
+        self.threads: list[threading.Thread] = []
+        self.font: tuple[str, int] = None
 
-    # pre-compiles a list of characters from the given font
-    def load(self, font: str, font_size: int) -> None:
-        # first clear the previously loaded Characters
-        self.Characters.clear()
-        # load font as face
-        face = freetype.Face(font)
-        #  set size to load glyphs as
-        face.set_pixel_sizes(0, font_size)
-        # disable byte-alignment restriction
-        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-        # then for the first 128 ASCII characters, pre-load/compile their
-        # characters and store them
-        for i in range(128):
-            # load character glyph
-            face.load_char(chr(i))
-            # generate texture
-            tex_id = GLuint()
-            glCreateTextures(GL_TEXTURE_2D, 1, tex_id)
-            width = face.glyph.bitmap.width
-            height = face.glyph.bitmap.rows
-            left = face.glyph.bitmap_left
-            top = face.glyph.bitmap_top
-            adv = face.glyph.advance.x
-            if (width > 0) and (height > 0):
-                ctype_data = (ctypes.c_int8 * len(face.glyph.bitmap.buffer))(*face.glyph.bitmap.buffer)
-                glTextureStorage2D(tex_id, 1, GL_R8, width, height)
-                glTextureSubImage2D(tex_id, 0, 0, 0, width, height, GL_RED,
-                                    GL_UNSIGNED_BYTE, ctype_data)
-                glTextureParameteri(tex_id, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-                glTextureParameteri(tex_id, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-                glTextureParameteri(
-                    tex_id, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
-                glTextureParameteri(
-                    tex_id, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
-                character = Character(tex_id, glm.ivec2(width, height),
-                                      glm.ivec2(left, top), adv)
+    # makes a font available at the given size and the default font;
+    # returns the font to pass to renderText (no glyph is rasterized yet).
+    # In the background, the font (and FreeType) is loaded on another
+    # thread; until it's ready, text in it isn't drawn
+    def load(self, font: str, font_size: int,
+             background: bool = False) -> tuple[str, int]:
+        if font not in self.faces and font not in self.opening:
+            if background:
+                self.opening.add(font)
+                thread = threading.Thread(target=self.openFace, args=(font,),
+                                          name="font", daemon=True)
+                thread.start()
+                self.threads.append(thread)
             else:
-                character = Character(tex_id, glm.ivec2(width, height),
-                                      glm.ivec2(left, top), adv)
-            self.Characters[chr(i)] = character
+                self.openFace(font)
+        self.font = (font, font_size)
+        return self.font
+
+    def openFace(self, font: str) -> None:
+        try:
+            # (FreeType reads the face from the file object as needed)
+            self.faces[font] = freetype.Face(openAsset(font))
+            startup.mark("font loaded: " + font)
+        except Exception as e:
+            print("ERROR::TEXTRENDERER: Failed to load font", font, e)
+        finally:
+            self.opening.discard(font)
+
+    # waits for the fonts loading in the background
+    def wait(self) -> None:
+        for thread in self.threads:
+            thread.join()
+        self.threads.clear()
+
+    # whether text in the font (default: the one loaded last) can be drawn
+    def ready(self, font: tuple[str, int] = None) -> bool:
+        font = font if font is not None else self.font
+        return font is not None and font[0] in self.faces
 
-    # renders a string of text using the precompiled list of characters
+    # rasterizes the given characters ahead of their first use; does
+    # nothing while the font is still loading (wait() for it first)
+    def prewarm(self, characters: str, font: tuple[str, int] = None) -> None:
+        font = font if font is not None else self.font
+        if not self.ready(font):
+            return
+        self.atlas.stamp += 1
+        for c in set(characters):
+            self.glyph(font, c)
+
+    # returns a character's glyph, rasterizing it if it isn't cached (None
+    # if it doesn't fit into the atlas or the font isn't loaded yet)
+    def glyph(self, font: tuple[str, int], c: str) -> Character:
+        key = (font, c)
+        character = self.atlas.get(key)
+        if character is not None:
+            return character
+        file, font_size = font
+        face = self.faces.get(file)
+        if face is None:
+            return None
+        #  set size to load glyphs as (faces are shared between sizes)
+        face.set_pixel_sizes(0, font_size)
+        face.load_char(c)
+        glyph = face.glyph
+        bitmap = glyph.bitmap
+        pixels = np.array(bitmap.buffer, dtype=np.uint8)
+        if bitmap.rows > 0:
+            pixels = pixels.reshape(bitmap.rows, bitmap.pitch)[:, :bitmap.width]
+        else:
+            pixels = pixels.reshape(0, 0)
+        return self.atlas.add(key, pixels,
+                              (glyph.bitmap_left, glyph.bitmap_top),
+                              glyph.advance.x)
+
+    # renders a string of text, in the given font (default: the one loaded
+    # last)
     def renderText(self, text: str, x: float, y: float, scale: float,
-                   color=glm.vec3(1.0)) -> None:
-        # activate corresponding render state
-        self.text_shader.use()
-        self.text_shader.setVec3("textColor", color)
-        glBindVertexArray(self.vao)
-        # iterate through all characters
-        for c in text:
-            ch = self.Characters[c]
-            xpos = x + ch.bearing.x * scale
-            ypos = y + (self.Characters['H'].bearing.y - ch.bearing.y) * scale
-            w = ch.size.x * scale
-            h = ch.size.y * scale
-            # update VBO for each character
-            vertices = [
-                # pos                  # tex
-                xpos,     ypos + h,    0.0, 1.0,
-                xpos + w, ypos,        1.0, 0.0,
-                xpos,    ypos,        0.0, 0.0,
-                xpos,     ypos + h,    0.0, 1.0,
-                xpos + w, ypos + h,    1.0, 1.0,
-                xpos + w, ypos,        1.0, 0.0
-            ]
-            ctype_vertices = (GLfloat * len(vertices))(*vertices)
-            # render glyph texture over quad
-            glBindTextureUnit(0, ch.texture_id)
-            # update content of VBO memory
-            glNamedBufferSubData(self.vbo, 0, sizeof(GLfloat)*6*4, ctype_vertices)
-            # render quad
-            glDrawArrays(GL_TRIANGLES, 0, 6)
+                   color=glm.vec3(1.0), font: tuple[str, int] = None) -> None:
+        if not self.ready(font):
+            return
+        # glyphs of this string must not evict each other
+        self.atlas.stamp += 1
+        vertices, _ = self.layout(text, x, y, scale, font)
+        self.drawVertices(vertices, color)
+
+    # lays out the glyph quads of a string as <vec2 pos, vec2 tex> (6
+    # vertices per glyph); returns them and the atlas shelves they use
+    def layout(self, text: str, x: float, y: float, scale: float,
+               font: tuple[str, int] = None) -> tuple[np.ndarray, set]:
+        font = font if font is not None else self.font
+        # lines are aligned to the top of 'H', looked up first so making
+        # room for the string's glyphs can't evict it (falls back to the
+        # font size if it isn't available)
+        reference = self.glyph(font, 'H')
+        top = reference.bearing[1] if reference is not None else font[1]
+        characters = [self.glyph(font, c) for c in text]
+        characters = [ch for ch in characters if ch is not None]
+        vertices = np.empty((len(characters), 6, 4), dtype=np.float32)
+        if len(characters) == 0:
+            return vertices, set()
+        # lay out all glyph rectangles (x, y, w, h) and their rectangles in
+        # the atlas
+        rects = np.empty((len(characters), 4), dtype=np.float32)
+        texels = np.empty((len(characters), 4), dtype=np.float32)
+        for i, ch in enumerate(characters):
+            rects[i] = (x + ch.bearing[0] * scale,
+                        y + (top - ch.bearing[1]) * scale,
+                        ch.size[0] * scale, ch.size[1] * scale)
+            texels[i] = ch.rect
             # now advance cursors for next glyph
             # bitshift by 6 to get value in pixels (1/64th times 2^6 = 64)
             x += (ch.advance >> 6) * scale
+        texels /= (self.atlas.width, self.atlas.height,
+                   self.atlas.width, self.atlas.height)
+        # glyphs without pixels become empty quads
+        vertices[:, :, 0:2] = (rects[:, None, 0:2]
+                               + rects[:, None, 2:4] * GLYPH_QUAD)
+        vertices[:, :, 2:4] = (texels[:, None, 0:2]
+                               + texels[:, None, 2:4] * GLYPH_QUAD)
+        shelves = {ch.shelf for ch in characters if ch.shelf is not None}
+        return vertices, shelves
+
+    # draws laid out glyph quads in the given color
+    def drawVertices(self, vertices: np.ndarray, color: glm.vec3) -> None:
+        if len(vertices) == 0:
+            return
+        # copy the quads straight into the stream buffer
+        offset, data = self.stream.allocate(vertices.size)
+        data[:] = vertices.reshape(-1)
+        # activate corresponding render state and draw all glyphs at once
+        self.text_shader.use()
+        self.text_shader.setVec3("textColor", color)
+        self.atlas.bind(0)
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_TRIANGLES, offset // (4 * sizeof(GLfloat)),
+                     len(vertices) * 6)
+
+
+# TextLabel is a piece of text that keeps its laid out glyph quads between
+# frames: they're only computed again when the text, position, scale or
+# font change (or the atlas evicted glyphs meanwhile), so drawing an
+# unchanged label is a copy and a draw call. The text is a format string
+# filled in with the values given to update(); formatting also only
+# happens when the values change.
+class TextLabel:
+    def __init__(self, renderer: TextRenderer, text: str, x: float,
+                 y: float, scale: float = 1.0, color=glm.vec3(1.0),
+                 font: tuple[str, int] = None) -> None:
+        self.renderer = renderer
+        self.format = text
+        self.text = text
+        self.values: tuple = None
+        self.x = x
+        self.y = y
+        self.scale = scale
+        self.color = color
+        self.font = font
+        self.vertices: np.ndarray = None
+        self.shelves: set = set()
+        # atlas evictions at the time of the layout
+        self.evictions = -1
+
+    # fills the format string with values (if they changed)
+    def update(self, *values) -> None:
+        if values != self.values:
+            self.values = values
+            self.setText(self.format.format(*values))
+
+    def setText(self, text: str) -> None:
+        if text != self.text:
+            self.text = text
+            self.vertices = None
+
+    def setPosition(self, x: float, y: float, scale: float = None) -> None:
+        if scale is None:
+            scale = self.scale
+        if (x, y, scale) != (self.x, self.y, self.scale):
+            self.x, self.y, self.scale = x, y, scale
+            self.vertices = None
+
+    # (the color is a uniform, changing it needs no new layout)
+    def setColor(self, color: glm.vec3) -> None:
+        self.color = color
+
+    def draw(self) -> None:
+        if not self.renderer.ready(self.font):
+            return
+        atlas = self.renderer.atlas
+        atlas.stamp += 1
+        if self.vertices is None or self.evictions != atlas.evictions:
+            self.vertices, self.shelves = self.renderer.layout(
+                self.text, self.x, self.y, self.scale, self.font)
+            self.evictions = atlas.evictions
+        else:
+            # keep the label's glyphs from being evicted
+            for shelf in self.shelves:
+                shelf.used = atlas.stamp
+        self.renderer.drawVertices(self.vertices, self.color)
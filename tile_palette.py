@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+
+from asset_archive import openAsset
+
+
+# powerups that can drop from a destroyed brick, as type: chance (1 in
+# chance), for tiles that don't define their own drop table
+DEFAULT_DROPS: dict[str, int] = {
+    "speed": 75,
+    "sticky": 75,
+    "pass-through": 75,
+    "pad-size-increase": 75,
+    "multi-ball": 75,
+    # negative powerups should spawn more often
+    "confuse": 15,
+    "chaos": 15
+}
+
+
+# TilePalette defines what each tile code of a level stands for: color,
+# texture, hit points (0 for solid, indestructible bricks), score and the
+# powerups it can drop. The definitions are turned into lookup arrays
+# indexed by tile code, so a level resolves all its bricks with a single
+# vectorized lookup. Codes without a definition are white breakable bricks.
+class TilePalette:
+    def __init__(self, tiles: list[dict] = None,
+                 drops: dict[str, int] = None) -> None:
+        if tiles is None:
+            # the original Breakout tiles
+            tiles = [
+                {"code": 1, "color": [0.8, 0.8, 0.7],
+                 "texture": "block_solid", "hits": 0},
+                {"code": 2, "color": [0.2, 0.6, 1.0]},
+                {"code": 3, "color": [0.0, 0.7, 0.0]},
+                {"code": 4, "color": [0.8, 0.8, 0.4]},
+                {"code": 5, "color": [1.0, 0.5, 0.0]}
+            ]
+        default_drops = DEFAULT_DROPS if drops is None else drops
+        size = max([6] + [tile["code"] + 1 for tile in tiles])
+        # texture names used by the palette, indexed by self.texture
+        self.textures: list[str] = ["block"]
+        self.color = np.ones((size, 3), dtype=np.float32)
+        self.texture = np.zeros(size, dtype=np.int32)
+        self.hits = np.ones(size, dtype=np.int32)
+        self.score = np.full(size, 10, dtype=np.int32)
+        self.drops: list[dict[str, int]] = [default_drops] * size
+        for tile in tiles:
+            code = tile["code"]
+            if code <= 0:
+                raise ValueError("TilePalette: tile code 0 is always empty")
+            self.color[code] = tile.get("color", (1.0, 1.0, 1.0))
+            texture = tile.get("texture", "block")
+            if texture not in self.textures:
+                self.textures.append(texture)
+            self.texture[code] = self.textures.index(texture)
+            self.hits[code] = tile.get("hits", 1)
+            self.score[code] = tile.get("score", 0 if self.hits[code] == 0
+                                        else 10 * self.hits[code])
+            self.drops[code] = tile.get("powerups", default_drops)
+        self.solid = self.hits <= 0
+
+    # loads a palette from a JSON file of the form
+    # {"powerups": {type: chance}, "tiles": [{"code": 1, "color": [r, g, b],
+    #  "texture": name, "hits": n, "score": n, "powerups": {...}}, ...]}
+    @staticmethod
+    def load(file: str) -> "TilePalette":
+        with openAsset(file, text=True) as file:
+            data = json.load(file)
+        return TilePalette(data["tiles"], data.get("powerups"))
+
+    # maps an array of tile codes onto valid palette indices (unknown codes
+    # resolve to the white default tile)
+    def resolve(self, codes: np.ndarray) -> np.ndarray:
+        return np.where(codes < len(self.hits), codes, 0)